@@ -1,5 +1,10 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, Response
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, Response, jsonify, session
 from templates.base.database import init_db, get_db
+from templates.base.database_helper import init_app as init_database_helper, readonly_db
+from templates.base import sql_profiler
+from templates.base import compression
+from templates.base.dashboard_stats import read_dashboard_stats, stats_count, stats_total
+from templates.base.change_tracking import conditional_response
 
 from templates.social.social_routes import bluprint_social_routes
 from templates.social.scheduler import SocialScheduler
@@ -11,11 +16,13 @@ from templates.auth.users import bluprint_user_routes
 from templates.roles.roles_page import bluprint_roles_routes
 from templates.providers.providers import bluprint_provider_routes
 from templates.devices.devices import bluprint_devices_routes
-from templates.cubes.cubes import bluprint_cubes_routes, get_cubes
+from templates.cubes.cubes import bluprint_cubes_routes
 from templates.guest_wifi.guest_wify import bluprint_guest_wifi_routes
 from templates.organizations.organizations import bluprint_organizations_routes
 from templates.knowledge.notes.notes import bluprint_notes_routes
 from templates.knowledge.articles.articles import bluprint_articles_routes
+from templates.knowledge.knowledge_search import bluprint_knowledge_search_routes
+from templates.search.search import bluprint_search_routes
 from templates.todo.todo import bluprint_todo_routes
 from templates.shifts.shifts import bluprint_shifts_routes
 from templates.network_scan.network_scanner import bluprint_network_scan_routes
@@ -25,8 +32,11 @@ from templates.social.social_routes import bluprint_social_routes
 from templates.base.requirements import admin_required, login_required
 
 from excel_utils import (
-    export_any_type_to_exel, import_from_excel
+    XLSX_MIMETYPE, get_supported_exel_types_mapping
 )
+from export_cache import export_response
+from import_validation import dry_run_import, dry_run_message, generate_errors_filename
+from import_jobs import ImportJobRunner, create_import_job, import_job_status, read_import_job
 
 from templates.guest_wifi.wifi_utils import (
     export_guest_wifi_to_excel, 
@@ -40,13 +50,9 @@ from script_utils import execute_script, save_script_result, get_script_results
 
 from network_scanner import NetworkScanner
 
-from templates.base.navigation import create_main_menu
+from templates.base.navigation import main_menu
 
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-very-secret-key-change-in-production'
-
-social_scheduler = SocialScheduler(app)
 # Глобальный объект сканера
 
 
@@ -65,6 +71,18 @@ social_scheduler = SocialScheduler(app)
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-very-secret-key-change-in-production'
 
+# соединения с базой выдаются из пула на время запроса
+init_database_helper(app)
+# учёт запросов к базе: заголовки X-SQL-* в режиме отладки, статистика по обработчикам
+sql_profiler.init_app(app)
+# сжатие ответов, заранее сжатая статика и asset_url для ссылок с хэшем
+compression.init_app(app)
+
+social_scheduler = SocialScheduler(app)
+# фоновый импорт Excel: обработчик есть в каждом процессе и при запуске
+# подхватывает задания, брошенные убитыми процессами
+import_job_runner = ImportJobRunner(app)
+
 app.register_blueprint(bluprint_user_routes)
 app.register_blueprint(bluprint_roles_routes)
 app.register_blueprint(bluprint_provider_routes)
@@ -74,6 +92,8 @@ app.register_blueprint(bluprint_guest_wifi_routes)
 app.register_blueprint(bluprint_organizations_routes)
 app.register_blueprint(bluprint_notes_routes)
 app.register_blueprint(bluprint_articles_routes)
+app.register_blueprint(bluprint_knowledge_search_routes)
+app.register_blueprint(bluprint_search_routes)
 app.register_blueprint(bluprint_todo_routes)
 app.register_blueprint(bluprint_shifts_routes)
 app.register_blueprint(bluprint_network_scan_routes)
@@ -86,6 +106,8 @@ app.register_blueprint(bluprint_social_routes)
 with app.app_context():
     init_db()
 
+import_job_runner.start()
+
 # ========== ОСНОВНЫЕ МАРШРУТЫ ==========
 
 @app.context_processor
@@ -98,25 +120,26 @@ def utility_processor():
 @app.context_processor
 def inject_common_variables():
     return {
-        'menu': create_main_menu()
+        'menu': main_menu
     }
 
-@app.route('/')
-def index():
-    db = get_db()
-    
-    # Основная статистика
-    devices_count = db.execute('SELECT COUNT(*) as count FROM devices').fetchone()['count']
-    active_providers_count = db.execute('SELECT COUNT(*) as count FROM providers WHERE status = "Активен"').fetchone()['count']
-    total_monthly_cost = db.execute('SELECT SUM(price) as total FROM providers WHERE status = "Активен"').fetchone()['total'] or 0
-    users_count = db.execute('SELECT COUNT(*) as count FROM users').fetchone()['count']
+# таблицы, из которых собираются данные дашборда
+DASHBOARD_TABLES = ['devices', 'providers', 'software_cubes', 'users', 'articles', 'notes', 'shifts']
+
+def dashboard_data(db):
+    # Основная статистика - из сводки, которую поддерживают триггеры
+    stats = read_dashboard_stats(db)
+    devices_count = stats_count(stats, 'devices')
+    active_providers_count = stats_count(stats, 'active_providers')
+    total_monthly_cost = stats_total(stats, 'active_providers')
+    users_count = stats_count(stats, 'users')
 
     # Статистика по статьям и заметкам
-    articles_count = db.execute('SELECT COUNT(*) as count FROM articles WHERE is_published = 1').fetchone()['count']
-    notes_count = db.execute('SELECT COUNT(*) as count FROM notes').fetchone()['count']
+    articles_count = stats_count(stats, 'published_articles')
+    notes_count = stats_count(stats, 'notes')
     
     # Ближайшие смены (на сегодня и завтра)
-    from datetime import datetime, timedelta
+    from datetime import timedelta
     today = datetime.now().date()
     tomorrow = today + timedelta(days=1)
     
@@ -130,19 +153,14 @@ def index():
     ''', (today, tomorrow)).fetchall()
 
     # Статистика по устройствам
-    devices_by_type = db.execute('''
-        SELECT type, COUNT(*) as count 
-        FROM devices 
-        GROUP BY type 
-        ORDER BY count DESC
-    ''').fetchall()
-    
-    devices_by_status = db.execute('''
-        SELECT status, COUNT(*) as count 
-        FROM devices 
-        GROUP BY status 
-        ORDER BY count DESC
-    ''').fetchall()
+    devices_by_type = [
+        {'type': r['key'], 'count': r['count']}
+        for r in sorted(stats['devices_by_type'], key=lambda r: r['count'], reverse=True)
+    ]
+    devices_by_status = [
+        {'status': r['key'], 'count': r['count']}
+        for r in sorted(stats['devices_by_status'], key=lambda r: r['count'], reverse=True)
+    ]
     
     # Последние добавленные устройства
     recent_devices = db.execute('''
@@ -160,34 +178,30 @@ def index():
     ''').fetchall()
     
     # Статистика по провайдерам по городам
-    providers_by_city = db.execute('''
-        SELECT city, COUNT(*) as count 
-        FROM providers 
-        GROUP BY city 
-        ORDER BY count DESC
-    ''').fetchall()
+    providers_by_city = [
+        {'city': r['key'], 'count': r['count']}
+        for r in sorted(stats['providers_by_city'], key=lambda r: r['count'], reverse=True)
+    ]
     
     # Стоимость по типам услуг
-    cost_by_service = db.execute('''
-        SELECT service_type, SUM(price) as total_cost 
-        FROM providers 
-        WHERE status = "Активен" 
-        GROUP BY service_type 
-        ORDER BY total_cost DESC
-    ''').fetchall()
+    cost_by_service = [
+        {'service_type': r['key'], 'total_cost': r['total']}
+        for r in sorted(stats['cost_by_service'], key=lambda r: r['total'], reverse=True)
+    ]
 
     # Статистика по Telegram заявкам
     #telegram_stats = get_request_stats()
     #new_requests_count = telegram_stats.get('new_count', 0)
     #total_requests_count = telegram_stats.get('total', 0)
 
-    cubes_list = get_cubes()
-
-    total_cubes_price = 0
-    for c in cubes_list:
-        total_cubes_price += c['price']
+    # для разбивки по кубам нужны только название и цена
+    cubes_list = db.execute('''
+        SELECT name, price FROM software_cubes
+        ORDER BY created_at DESC
+    ''').fetchall()
+    total_cubes_price = stats_total(stats, 'software_cubes')
     
-    return render_template('dashboard/index.html',
+    return dict(
                         devices_count=devices_count,
                         active_providers_count=active_providers_count,
                         total_monthly_cost=total_monthly_cost,
@@ -214,23 +228,41 @@ def index():
                         # wifi_cities_count=wifi_cities_count,
                         # recent_wifi=recent_wifi,
                         # wifi_by_city=wifi_by_city
-    )  
+    )
+
+@app.route('/')
+@readonly_db
+def index():
+    return render_template('dashboard/index.html', **dashboard_data(get_db()))
+
+# те же данные в JSON для экранов мониторинга: при неизменных таблицах
+# (и той же дате - от неё зависят ближайшие смены) ответ 304 без запросов к данным
+@app.route('/api/dashboard')
+@login_required
+@readonly_db
+def api_dashboard():
+    db = get_db()
+
+    def build():
+        data = dashboard_data(db)
+        for name, value in data.items():
+            if isinstance(value, list):
+                data[name] = [dict(row) for row in value]
+        data['today'] = data['today'].isoformat()
+        data['tomorrow'] = data['tomorrow'].isoformat()
+        return jsonify(data)
+
+    return conditional_response(db, DASHBOARD_TABLES, build, datetime.now().date())
 
 # ========== МАРШРУТЫ ДЛЯ ЭКСПОРТА/ИМПОРТА EXCEL ==========
 
 @app.route('/export/<data_type>')
 @login_required
 def export_data(data_type):
-    """Экспорт данных в Excel"""
+    """Экспорт данных: ?format=xlsx (по умолчанию), csv, ndjson или parquet (если установлен pyarrow)"""
     try:
-        filename, excel_file = export_any_type_to_exel(data_type)
-        
-        return send_file(
-            excel_file,
-            download_name=filename,
-            as_attachment=True,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        # пока таблица не менялась, файл отдаётся из кэша, иначе - потоком по мере чтения из базы
+        return export_response(data_type, request.args.get('format', 'xlsx'))
         
     except Exception as e:
         flash(f'Ошибка при экспорте данных: {str(e)}', 'error')
@@ -255,14 +287,22 @@ def import_data(data_type):
             return redirect(request.url)
         
         try:
-            success, message = import_from_excel(file, data_type)
+            mode = request.form.get('mode', 'append')
+            
+            # только проверка: база не меняется, ошибки возвращаются книгой Excel
+            if request.form.get('dry_run'):
+                rows_checked, errors, workbook = dry_run_import(file, data_type, mode)
+                if not errors:
+                    flash(dry_run_message(rows_checked, errors), 'success')
+                    return redirect(request.url)
+                table_name = get_supported_exel_types_mapping()[data_type]['tablename']
+                return send_file(workbook, download_name=generate_errors_filename(table_name),
+                                 as_attachment=True, mimetype=XLSX_MIMETYPE)
             
-            if success:
-                flash(message, 'success')
-            else:
-                flash(message, 'error')
-                
-            return redirect(url_for(data_type))
+            # файл сохраняется и загружается в фоне, запрос не ждёт импорта
+            job_id = create_import_job(file, data_type, mode, session.get('user_id'))
+            import_job_runner.notify()
+            return redirect(url_for('import_job', job_id=job_id))
             
         except Exception as e:
             flash(f'Ошибка при импорте данных: {str(e)}', 'error')
@@ -282,16 +322,46 @@ def import_data(data_type):
         return redirect(url_for('index'))
     
     simple_data_type = data_type.split('.')[0] if '.' in data_type else data_type
+    merge_keys = get_supported_exel_types_mapping().get(data_type, {}).get('merge_keys')
     
     return render_template('excel/import.html', 
                          data_type=data_type,
                          simple_data_type=simple_data_type,  
+                         merge_keys=merge_keys,
                          page_title=f"Импорт {page_titles[data_type]}")
 
+@app.route('/import/jobs/<int:job_id>')
+@admin_required
+def import_job(job_id):
+    """Страница прогресса фонового импорта"""
+    job = read_import_job(job_id)
+    if job is None:
+        flash('Задание импорта не найдено', 'error')
+        return redirect(url_for('index'))
+    
+    return render_template('excel/import_job.html', job=import_job_status(job), data_type=job['data_type'])
+
+@app.route('/import/jobs/<int:job_id>/status')
+@admin_required
+def import_job_status_json(job_id):
+    """Состояние фонового импорта для опроса со страницы"""
+    job = read_import_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Задание импорта не найдено'}), 404
+    
+    return jsonify(import_job_status(job))
+
+
 
 
 
 
+@app.route('/sql_stats')
+@admin_required
+def sql_stats():
+    """Статистика запросов к базе по обработчикам"""
+    return jsonify(sql_profiler.get_endpoint_stats())
+
 
 def get_local_ip():
     """Получает локальный IP-адрес для доступа по сети"""
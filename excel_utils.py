@@ -1,20 +1,63 @@
 import pandas as pd
-import io
+from itertools import islice
 from datetime import datetime
 from templates.base.database import get_db
+from templates.base.streaming import iterate_rows
+from export_formats import EXPORT_FORMATS, export_stream
 
+XLSX_MIMETYPE = EXPORT_FORMATS['xlsx'][1]
+
+DEVICE_EXPORT_COLUMNS = [
+    'name', 'model', 'type', 'serial_number', 'mac_address', 
+    'ip_address', 'location', 'status', 'assigned_to', 'specifications'
+]
+
+PROVIDER_EXPORT_COLUMNS = [
+    'name', 'service_type', 'contract_number', 'contract_date', 
+    'ip_range', 'speed', 'price', 'contact_person', 'phone', 
+    'email', 'object_location', 'city', 'status', 'notes'
+]
+
+CUBE_EXPORT_COLUMNS = [
+    'name', 'software_type', 'license_type', 'license_key', 
+    'contract_number', 'contract_date', 'price', 'users_count',
+    'support_contact', 'phone', 'email', 'object_location', 
+    'city', 'status', 'renewal_date', 'notes'
+]
+
+ORGANIZATION_EXPORT_COLUMNS = [
+    'name', 'type', 'inn', 'contact_person', 'phone', 
+    'email', 'address', 'notes'
+]
+
+TODO_EXPORT_COLUMNS = [
+    'title', 'description', 'status', 'priority', 
+    'organization_id', 'due_date', 'is_completed'
+]
+
+WTWARE_EXPORT_COLUMNS = [
+    'name', 'version', 'server_ip', 'server_port', 'screen_width', 
+    'screen_height', 'auto_start', 'network_drive', 'printer_config',
+    'startup_script', 'shutdown_script', 'status', 'notes'
+]
+
+# merge_keys - естественные ключи для импорта с объединением, в порядке
+# приоритета: строка файла сопоставляется с записью по первому совпавшему
 def get_supported_exel_types_mapping():
     table_mapping = {
-                'devices.devices': { 'tablename' : 'devices', 'exporter' : export_devices },
-                'providers.providers': {'tablename' : 'providers',  'exporter' : export_providers },
-                'cubes.cubes': {'tablename' : 'software_cubes', 'exporter' : export_cubes },
-                'organizations.organizations': {'tablename' : 'organizations', 'exporter' : export_organizations },
-                'todos.todos': {'tablename' : 'todos', 'exporter' : export_todos },
+                'devices.devices': { 'tablename' : 'devices', 'columns' : DEVICE_EXPORT_COLUMNS,
+                                     'merge_keys' : ['serial_number', 'mac_address'] },
+                'providers.providers': {'tablename' : 'providers',  'columns' : PROVIDER_EXPORT_COLUMNS,
+                                        'merge_keys' : ['contract_number'] },
+                'cubes.cubes': {'tablename' : 'software_cubes', 'columns' : CUBE_EXPORT_COLUMNS },
+                'organizations.organizations': {'tablename' : 'organizations', 'columns' : ORGANIZATION_EXPORT_COLUMNS,
+                                                'merge_keys' : ['inn'] },
+                'todos.todos': {'tablename' : 'todos', 'columns' : TODO_EXPORT_COLUMNS },
             }
     
     return table_mapping
 
-def generate_export_filename(data_type):
+def generate_export_filename(data_type, extension='xlsx'):
     
     table_mapping = get_supported_exel_types_mapping()
     
@@ -22,36 +65,264 @@ def generate_export_filename(data_type):
         raise Exception('Неподдерживаемый тип данных для экспорта')
     
     table_name = table_mapping[data_type]['tablename']
-    filename = f'{table_name}_export_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
+    filename = f'{table_name}_export_{datetime.now().strftime("%Y%m%d_%H%M")}.{extension}'
     return filename
 
-def export_to_excel(table_name, columns=None):
-    """Экспорт данных из таблицы в Excel"""
+def stream_table_export(table_name, columns=None, export_format='xlsx'):
+    """Экспорт таблицы в файл формата export_format (xlsx, csv, ndjson, parquet) по частям.
+
+    Запрос выполняется сразу, чтобы ошибка в нём проявилась до начала ответа,
+    а строки читаются из курсора порциями по мере отдачи файла
+    """
     db = get_db()
     
+    # Объявленные типы столбцов нужны форматам со схемой (Parquet)
+    table_info = db.execute(f"PRAGMA table_info({table_name})").fetchall()
+    declared_types = {col['name']: col['type'] for col in table_info}
+    
     # Определяем какие столбцы экспортировать
     if columns is None:
-        # Получаем все столбцы таблицы
-        table_info = db.execute(f"PRAGMA table_info({table_name})").fetchall()
         columns = [col['name'] for col in table_info if col['name'] not in ['id', 'created_at', 'updated_at']]
     
-    # Получаем данные
     columns_str = ', '.join(columns)
-    data = db.execute(f"SELECT {columns_str} FROM {table_name}").fetchall()
+    cursor = db.execute(f"SELECT {columns_str} FROM {table_name} ORDER BY id")
+    
+    types = [declared_types.get(column, '') for column in columns]
+    return export_stream(export_format, table_name, columns, types, iterate_rows(cursor, tuple))
+
+def stream_table_to_excel(table_name, columns=None):
+    """Экспорт таблицы в Excel по частям"""
+    return stream_table_export(table_name, columns, 'xlsx')
+
+# сколько строк вставлять одним executemany
+IMPORT_CHUNK_SIZE = 5000
+# сколько ошибок строк показывать в сообщении об импорте
+IMPORT_ERRORS_SHOWN = 20
+
+# объявленные типы SQLite, которые хранятся как числа
+NUMERIC_TYPES = ('INT', 'REAL', 'FLOA', 'DOUB', 'DEC', 'NUM', 'BOOL')
+
+# python-calamine читает xlsx в разы быстрее openpyxl, если установлен
+try:
+    import python_calamine
+    EXCEL_READ_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_READ_ENGINE = None
+
+def read_excel_file(file):
+    return pd.read_excel(file, engine=EXCEL_READ_ENGINE)
+
+def text_column(values, declared_type=''):
+    """Столбец как текст: пустые строки - NULL, числа-идентификаторы без '.0'"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        date_format = '%Y-%m-%d %H:%M:%S' if 'TIME' in declared_type else '%Y-%m-%d'
+        text = values.dt.strftime(date_format).astype('string')
+    elif pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+        # Excel хранит номера договоров, ИНН и телефоны как числа: 123.0 -> '123'
+        text = values.astype('Int64').astype('string')
+    else:
+        text = values.astype('string').str.strip()
+    return text.mask(text == '')
+
+def clean_import_frame(df, table_info):
+    """Оставляет столбцы таблицы и приводит их к её типам целиком, без обхода строк"""
+    declared_types = {col['name']: (col['type'] or '').upper() for col in table_info
+                      if col['name'] not in ['id', 'created_at', 'updated_at']}
+    df = df[[col for col in declared_types if col in df.columns]].copy()
+    
+    for column in df.columns:
+        declared_type = declared_types[column]
+        if any(t in declared_type for t in NUMERIC_TYPES):
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+        else:
+            df[column] = text_column(df[column], declared_type)
+    
+    return df
+
+def drop_incomplete_rows(df, required_columns):
+    """Убирает строки без обязательных полей, возвращает таблицу и ошибки по номерам строк Excel"""
+    errors = []
+    missing = pd.Series(False, index=df.index)
+    for column in required_columns:
+        column_missing = df[column].isna() if column in df.columns else pd.Series(True, index=df.index)
+        for index in df.index[column_missing & ~missing]:
+            # +2: заголовок и нумерация строк Excel с единицы
+            errors.append(f"Строка {index + 2}: Не заполнено обязательное поле {column}")
+        missing |= column_missing
+    return df[~missing], errors
+
+def frame_rows(df):
+    """Строки таблицы как кортежи Python: NaN и pd.NA превращаются в None"""
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+def insert_rows(db, table_name, columns, rows, chunk_size=IMPORT_CHUNK_SIZE):
+    """Вставка порциями через executemany, без коммита - транзакцией управляет вызывающий"""
+    sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    count = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        db.executemany(sql, chunk)
+        count += len(chunk)
+    return count
+
+def with_import_errors(message, errors):
+    """(успех, сообщение) с перечнем первых ошибок строк"""
+    if not errors:
+        return True, message
+    
+    shown = '; '.join(errors[:IMPORT_ERRORS_SHOWN])
+    if len(errors) > IMPORT_ERRORS_SHOWN:
+        shown += f"; и ещё {len(errors) - IMPORT_ERRORS_SHOWN}"
+    return False, f"{message}. Ошибки: {shown}"
+
+def import_result_message(imported_count, errors):
+    return with_import_errors(f"Успешно импортировано {imported_count} записей", errors)
+
+def required_import_columns(table_info):
+    """NOT NULL столбцы таблицы без значения по умолчанию"""
+    return [col['name'] for col in table_info if col['notnull'] and col['dflt_value'] is None and not col['pk']]
+
+def prepare_import_frame(db, table_name, df, required_columns=None):
+    """Очищенный DataFrame, ошибки строк и столбцы таблицы.
+
+    required_columns - поля, без которых строка пропускается с ошибкой;
+    по умолчанию - required_import_columns таблицы
+    """
+    table_info = db.execute(f"PRAGMA table_info({table_name})").fetchall()
+    if required_columns is None:
+        required_columns = required_import_columns(table_info)
+    
+    df = clean_import_frame(df, table_info)
+    df, errors = drop_incomplete_rows(df, required_columns)
+    return df, errors, table_info
+
+def import_frame(db, table_name, df, required_columns=None):
+    """Импорт DataFrame в таблицу одной транзакцией"""
+    df, errors, _ = prepare_import_frame(db, table_name, df, required_columns)
+    
+    try:
+        imported_count = insert_rows(db, table_name, list(df.columns), frame_rows(df))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
+    return imported_count, errors
+
+def merge_rows(db, table_name, df, merge_keys, declared_types):
+    """Объединение очищенных строк с таблицей без коммита - транзакцией управляет вызывающий.
+
+    Строки загружаются во временную таблицу, сопоставление и сравнение
+    делаются запросами по всей таблице сразу, а в основную таблицу пишутся
+    только новые и изменённые строки. Возвращает (добавлено, обновлено, без изменений, ошибки)
+    """
+    errors = []
+    columns = list(df.columns)
+    keys = [key for key in merge_keys if key in columns]
+    if not keys:
+        raise Exception(f"В файле нет ни одного ключевого столбца: {', '.join(merge_keys)}")
+    
+    # типы столбцов те же, что в таблице, чтобы значения сравнивались одинаково
+    staging_columns = ', '.join(f"{column} {declared_types[column]}" for column in columns)
+    column_list = ', '.join(columns)
+    staging = 'temp.import_staging'
+    
+    try:
+        db.execute(f"DROP TABLE IF EXISTS {staging}")
+        db.execute(f"CREATE TEMP TABLE import_staging (row_no INTEGER PRIMARY KEY, target_id INTEGER, {staging_columns})")
+        
+        # row_no - номер строки в Excel: заголовок и нумерация с единицы
+        rows = ((index + 2,) + row for index, row in zip(df.index, frame_rows(df)))
+        insert_rows(db, staging, ['row_no'] + columns, rows)
+        
+        for key in keys:
+            db.execute(f"CREATE INDEX temp.idx_import_staging_{key} ON import_staging ({key})")
+            
+            # повтор ключа в файле: остаётся последняя строка
+            duplicates = db.execute(f'''
+                SELECT row_no FROM {staging} s
+                WHERE s.{key} IS NOT NULL
+                  AND EXISTS (SELECT 1 FROM {staging} later WHERE later.{key} = s.{key} AND later.row_no > s.row_no)
+            ''').fetchall()
+            for row in duplicates:
+                errors.append(f"Строка {row['row_no']}: {key} повторяется ниже в файле, строка пропущена")
+            db.executemany(f"DELETE FROM {staging} WHERE row_no = ?", [(row['row_no'],) for row in duplicates])
+            
+            # сопоставление по индексу естественного ключа
+            db.execute(f'''
+                UPDATE {staging} SET target_id = (
+                    SELECT t.id FROM main.{table_name} t WHERE t.{key} = import_staging.{key}
+                )
+                WHERE target_id IS NULL AND {key} IS NOT NULL
+            ''')
+        
+        # разные ключи могли привести к одной записи
+        db.execute("CREATE INDEX temp.idx_import_staging_target_id ON import_staging (target_id)")
+        duplicates = db.execute(f'''
+            SELECT row_no FROM {staging} s
+            WHERE s.target_id IS NOT NULL
+              AND EXISTS (SELECT 1 FROM {staging} later WHERE later.target_id = s.target_id AND later.row_no > s.row_no)
+        ''').fetchall()
+        for row in duplicates:
+            errors.append(f"Строка {row['row_no']}: запись уже обновляется строкой ниже, строка пропущена")
+        db.executemany(f"DELETE FROM {staging} WHERE row_no = ?", [(row['row_no'],) for row in duplicates])
+        
+        same_values = ' AND '.join(f"t.{column} IS s.{column}" for column in columns)
+        changed = f"NOT EXISTS (SELECT 1 FROM main.{table_name} t WHERE t.id = s.target_id AND {same_values})"
+        
+        counts = db.execute(f'''
+            SELECT SUM(s.target_id IS NULL) as inserted,
+                   SUM(s.target_id IS NOT NULL AND {changed}) as updated,
+                   COUNT(*) as total
+            FROM {staging} s
+        ''').fetchone()
+        inserted = counts['inserted'] or 0
+        updated = counts['updated'] or 0
+        unchanged = counts['total'] - inserted - updated
+        
+        assignments = [f"{column} = excluded.{column}" for column in columns]
+        if 'updated_at' in declared_types:
+            assignments.append("updated_at = CURRENT_TIMESTAMP")
+        
+        # новые строки получают id (target_id = NULL), найденные - обновляются по id
+        db.execute(f'''
+            INSERT INTO main.{table_name} (id, {column_list})
+            SELECT s.target_id, {', '.join(f"s.{column}" for column in columns)}
+            FROM {staging} s
+            WHERE s.target_id IS NULL OR {changed}
+            ORDER BY s.row_no
+            ON CONFLICT (id) DO UPDATE SET {', '.join(assignments)}
+        ''')
+    finally:
+        db.execute(f"DROP TABLE IF EXISTS {staging}")
     
-    # Преобразуем в DataFrame
-    df = pd.DataFrame(data, columns=columns)
+    return inserted, updated, unchanged, errors
+
+def merge_frame(db, table_name, df, merge_keys, required_columns=None):
+    """Импорт с объединением одной транзакцией: строки, найденные по естественным
+    ключам, обновляются, остальные добавляются, совпадающие с базой не трогаются"""
+    df, errors, table_info = prepare_import_frame(db, table_name, df, required_columns)
+    declared_types = {col['name']: col['type'] for col in table_info}
     
-    # Создаем Excel файл в памяти
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name=table_name, index=False)
+    try:
+        inserted, updated, unchanged, merge_errors = merge_rows(db, table_name, df, merge_keys, declared_types)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
     
-    output.seek(0)
-    return output
+    return inserted, updated, unchanged, errors + merge_errors
+
+def merge_result_message(inserted, updated, unchanged, errors):
+    return with_import_errors(f"Добавлено {inserted}, обновлено {updated}, без изменений {unchanged}", errors)
 
-def import_from_excel(file, data_type, column_mapping=None):
-    """Импорт данных из Excel в таблицу"""
+def import_from_excel(file, data_type, column_mapping=None, mode='append'):
+    """Импорт данных из Excel в таблицу.
+
+    mode='merge' - объединение с существующими записями по естественным ключам
+    """
     db = get_db()
 
     # проверка на поддерживаемый тип
@@ -63,91 +334,35 @@ def import_from_excel(file, data_type, column_mapping=None):
 
     try:
         # Читаем Excel файл
-        df = pd.read_excel(file)
+        df = read_excel_file(file)
         
         # Преобразуем названия столбцов если нужно
         if column_mapping:
             df = df.rename(columns=column_mapping)
         
-        # Получаем информацию о таблице
-        table_info = db.execute(f"PRAGMA table_info({table_name})").fetchall()
-        table_columns = [col['name'] for col in table_info if col['name'] not in ['id', 'created_at', 'updated_at']]
-        
-        # Оставляем только нужные столбцы
-        df = df[[col for col in table_columns if col in df.columns]]
+        if mode == 'merge':
+            merge_keys = table_mapping[data_type].get('merge_keys')
+            if not merge_keys:
+                raise Exception('Для этого типа данных объединение не поддерживается')
+            return merge_result_message(*merge_frame(db, table_name, df, merge_keys))
         
-        # Импортируем данные
-        for _, row in df.iterrows():
-            # Заменяем NaN на None
-            row_data = {k: (v if pd.notna(v) else None) for k, v in row.items()}
-            
-            # Создаем SQL запрос
-            columns = ', '.join(row_data.keys())
-            placeholders = ', '.join(['?' for _ in row_data])
-            
-            db.execute(
-                f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})",
-                list(row_data.values())
-            )
-        
-        db.commit()
-        return True, f"Успешно импортировано {len(df)} записей"
+        imported_count, errors = import_frame(db, table_name, df)
+        return import_result_message(imported_count, errors)
         
     except Exception as e:
-        db.rollback()
         return False, f"Ошибка импорта: {str(e)}"
 
-def export_devices():
-    """Экспорт устройств в Excel"""
-    return export_to_excel('devices', [
-        'name', 'model', 'type', 'serial_number', 'mac_address', 
-        'ip_address', 'location', 'status', 'assigned_to', 'specifications'
-    ])
-
-def export_providers():
-    """Экспорт провайдеров в Excel"""
-    return export_to_excel('providers', [
-        'name', 'service_type', 'contract_number', 'contract_date', 
-        'ip_range', 'speed', 'price', 'contact_person', 'phone', 
-        'email', 'object_location', 'city', 'status', 'notes'
-    ])
-
-def export_cubes():
-    """Экспорт программных кубов в Excel"""
-    return export_to_excel('software_cubes', [
-        'name', 'software_type', 'license_type', 'license_key', 
-        'contract_number', 'contract_date', 'price', 'users_count',
-        'support_contact', 'phone', 'email', 'object_location', 
-        'city', 'status', 'renewal_date', 'notes'
-    ])
-
-def export_organizations():
-    """Экспорт организаций в Excel"""
-    return export_to_excel('organizations', [
-        'name', 'type', 'inn', 'contact_person', 'phone', 
-        'email', 'address', 'notes'
-    ])
-
-def export_todos():
-    """Экспорт задач в Excel"""
-    return export_to_excel('todos', [
-        'title', 'description', 'status', 'priority', 
-        'organization_id', 'due_date', 'is_completed'
-    ])
-
-def export_wtware():
-    """Экспорт конфигураций WTware в Excel"""
-    return export_to_excel('wtware_configs', [
-        'name', 'version', 'server_ip', 'server_port', 'screen_width', 
-        'screen_height', 'auto_start', 'network_drive', 'printer_config',
-        'startup_script', 'shutdown_script', 'status', 'notes'
-    ])
-
+def export_any_type(data_type, export_format='xlsx'):
+    """Имя файла, mimetype и генератор содержимого выгрузки"""
+    if export_format not in EXPORT_FORMATS:
+        raise Exception(f'Неподдерживаемый формат выгрузки: {export_format}')
+    
+    extension, mimetype, _ = EXPORT_FORMATS[export_format]
+    filename = generate_export_filename(data_type, extension)
+    mapping = get_supported_exel_types_mapping()[data_type]
+    return filename, mimetype, stream_table_export(mapping['tablename'], mapping['columns'], export_format)
 
 def export_any_type_to_exel(data_type):
-
-    filename = generate_export_filename(data_type)
-    mapping = get_supported_exel_types_mapping()
-    exporter = mapping[data_type]['exporter']
-    file = exporter()
-    return filename, file
\ No newline at end of file
+    """Имя файла и генератор его содержимого"""
+    filename, _, chunks = export_any_type(data_type, 'xlsx')
+    return filename, chunks
@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import os
+import uuid
+
+from flask import Response, make_response, request, send_file, stream_with_context
+
+from templates.base.change_tracking import TRACKED_TABLES, get_table_versions, last_modified
+from templates.base.database import get_db
+from excel_utils import export_any_type, generate_export_filename, get_supported_exel_types_mapping
+from export_formats import EXPORT_FORMATS, ExportFormatError
+
+logger = logging.getLogger(__name__)
+
+# Кэш файлов выгрузки на диске.
+#
+# Файл выгрузки определяется типом данных, форматом, набором столбцов и
+# версией таблицы из table_changes, поэтому пока таблица не менялась,
+# повторная выгрузка отдаётся готовым файлом без запроса к базе. Ключ кэша
+# служит и ETag ответа - браузер, у которого файл уже есть, получит 304.
+#
+# Первая выгрузка после изменения данных идёт потоком, как без кэша, и
+# одновременно записывается в файл. Размер каталога ограничен
+# EXPORT_CACHE_MAX_BYTES: лишние файлы удаляются начиная с давно не
+# запрашивавшихся (при каждой выдаче из кэша у файла обновляется mtime).
+
+EXPORT_CACHE_FOLDER = os.environ.get('EXPORT_CACHE_FOLDER', 'export_cache')
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+
+
+def export_cache_key(data_type:str, export_format:str, columns:list[str], version:int):
+    key = f"{data_type};{export_format};{','.join(columns)};{version}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def export_cache_path(table_name:str, key:str, extension:str):
+    return os.path.join(EXPORT_CACHE_FOLDER, f"{table_name}_{key}.{extension}")
+
+
+def evict_export_cache(folder:str, max_bytes:int):
+    """Удаляет давно не запрашивавшиеся файлы, пока каталог больше max_bytes"""
+    files = []
+    for entry in os.scandir(folder):
+        # недописанные файлы принадлежат идущим выгрузкам
+        if entry.is_file() and not entry.name.endswith('.tmp'):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+
+def _write_through(chunks, path:str):
+    """Отдаёт части файла и пишет их в кэш; файл появляется в кэше только целиком"""
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(temp_path, path)
+    finally:
+        # выгрузка прервана - например, клиент закрыл соединение
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    try:
+        evict_export_cache(EXPORT_CACHE_FOLDER, EXPORT_CACHE_MAX_BYTES)
+    except OSError as e:
+        logger.warning(f"Не удалось очистить кэш выгрузок: {e}")
+
+
+def export_response(data_type:str, export_format:str = 'xlsx'):
+    """Ответ с файлом выгрузки: из кэша, если таблица не менялась, иначе потоком с записью в кэш"""
+    table_mapping = get_supported_exel_types_mapping()
+    if data_type not in table_mapping:
+        raise Exception('Неподдерживаемый тип данных для экспорта')
+    if export_format not in EXPORT_FORMATS:
+        raise ExportFormatError(f'Неподдерживаемый формат выгрузки: {export_format}')
+
+    mapping = table_mapping[data_type]
+    table_name = mapping['tablename']
+    extension, mimetype, _ = EXPORT_FORMATS[export_format]
+
+    # без счётчика изменений нельзя понять, что кэш устарел
+    if table_name not in TRACKED_TABLES:
+        filename, mimetype, chunks = export_any_type(data_type, export_format)
+        return Response(stream_with_context(chunks), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+    versions = get_table_versions(get_db(), [table_name])
+    key = export_cache_key(data_type, export_format, mapping['columns'], versions[table_name][0])
+    path = export_cache_path(table_name, key, extension)
+
+    # у клиента уже есть этот файл - даже если его вытеснили из кэша
+    if request.if_none_match.contains(key):
+        response = make_response('', 304)
+        response.set_etag(key)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    try:
+        # файл запрошен - в очереди на удаление он теперь последний
+        os.utime(path)
+        response = send_file(os.path.abspath(path), mimetype=mimetype, as_attachment=True,
+                             download_name=generate_export_filename(data_type, extension),
+                             etag=key, last_modified=last_modified(versions))
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except FileNotFoundError:
+        pass
+
+    filename, mimetype, chunks = export_any_type(data_type, export_format)
+    os.makedirs(EXPORT_CACHE_FOLDER, exist_ok=True)
+    response = Response(stream_with_context(_write_through(chunks, path)), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    response.set_etag(key)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
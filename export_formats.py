@@ -0,0 +1,193 @@
+import csv
+import io
+import json
+
+from xlsx_writer import ChunkBuffer, xlsx_stream
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Форматы выгрузки таблиц.
+#
+# Каждый писатель получает имя выгрузки, заголовки, типы столбцов из
+# схемы SQLite и итератор строк, и возвращает генератор байтов файла -
+# выгрузка идёт потоком, сколько бы строк ни было в таблице.
+
+# сколько строк собирать в одну порцию вывода
+CSV_FLUSH_ROWS = 1000
+# строк в группе Parquet: группа целиком собирается в памяти перед записью
+PARQUET_ROW_GROUP_SIZE = 10000
+
+
+class ExportFormatError(Exception):
+    pass
+
+
+def xlsx_format_stream(name:str, headers:list[str], types:list[str], rows):
+    # лист называется по имени выгрузки, типы берутся из самих значений
+    return xlsx_stream(name, headers, rows)
+
+
+def csv_stream(name:str, headers:list[str], types:list[str], rows):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(headers)
+
+    for number, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if number % CSV_FLUSH_ROWS == 0:
+            yield output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+
+    yield output.getvalue().encode('utf-8')
+
+
+def ndjson_stream(name:str, headers:list[str], types:list[str], rows):
+    lines = []
+    for number, row in enumerate(rows, start=1):
+        lines.append(json.dumps(dict(zip(headers, row)), ensure_ascii=False))
+        if number % CSV_FLUSH_ROWS == 0:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _parquet_type(declared:str):
+    # по правилам близости типов SQLite (type affinity)
+    declared = (declared or '').upper()
+    if 'INT' in declared:
+        return pyarrow.int64()
+    if 'CHAR' in declared or 'CLOB' in declared or 'TEXT' in declared:
+        return pyarrow.string()
+    # даты по этим правилам числовые, но хранятся строками
+    if 'DATE' in declared or 'TIME' in declared:
+        return pyarrow.string()
+    if 'BOOL' in declared:
+        return pyarrow.bool_()
+    if any(t in declared for t in ('REAL', 'FLOA', 'DOUB', 'DEC', 'NUM')):
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def _to_number(value, kind):
+    # SQLite не проверяет типы столбцов: в числовом поле может оказаться строка
+    if value is None or value == '':
+        return None
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_bool(value):
+    number = _to_number(value, float)
+    return None if number is None else number != 0
+
+
+def parquet_stream(name:str, headers:list[str], types:list[str], rows):
+    if pyarrow is None:
+        raise ExportFormatError('Для выгрузки в Parquet нужен пакет pyarrow')
+
+    fields = [pyarrow.field(column, _parquet_type(declared)) for column, declared in zip(headers, types)]
+    schema = pyarrow.schema(fields)
+    converters = []
+    for field in fields:
+        if field.type == pyarrow.int64():
+            converters.append(lambda v: _to_number(v, int))
+        elif field.type == pyarrow.float64():
+            converters.append(lambda v: _to_number(v, float))
+        elif field.type == pyarrow.bool_():
+            converters.append(_to_bool)
+        else:
+            converters.append(lambda v: None if v is None else str(v))
+
+    return _parquet_chunks(schema, converters, rows)
+
+
+def _parquet_chunks(schema, converters, rows):
+    buffer = ChunkBuffer()
+    writer = pyarrow.parquet.ParquetWriter(buffer, schema, compression='snappy')
+
+    def write_group(group):
+        columns = [[convert(row[i]) for row in group] for i, convert in enumerate(converters)]
+        writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+
+    group = []
+    for row in rows:
+        group.append(row)
+        if len(group) >= PARQUET_ROW_GROUP_SIZE:
+            write_group(group)
+            group = []
+            yield buffer.pop()
+
+    if group:
+        write_group(group)
+    writer.close()
+    yield buffer.pop()
+
+
+# формат -> (расширение файла, mimetype, писатель)
+EXPORT_FORMATS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', xlsx_format_stream),
+    # кодировку к text/* Flask добавляет сам
+    'csv': ('csv', 'text/csv', csv_stream),
+    'ndjson': ('ndjson', 'application/x-ndjson', ndjson_stream),
+}
+
+# Parquet - только если установлен необязательный пакет pyarrow
+if pyarrow is not None:
+    EXPORT_FORMATS['parquet'] = ('parquet', 'application/vnd.apache.parquet', parquet_stream)
+
+
+def export_stream(export_format:str, name:str, headers:list[str], types:list[str], rows):
+    """Генератор байтов файла в формате export_format"""
+    if export_format not in EXPORT_FORMATS:
+        raise ExportFormatError(f'Неподдерживаемый формат выгрузки: {export_format}')
+    return EXPORT_FORMATS[export_format][2](name, headers, types, rows)
+
+
+# объявленные типы столбцов базы и ожидаемые типы Parquet для проверки
+PARQUET_CHECK_TYPES = {
+    'INTEGER': 'int64',
+    'TEXT': 'string',
+    'DECIMAL(10,2)': 'double',
+    'NUMERIC': 'double',
+    'REAL': 'double',
+    'BOOLEAN': 'bool',
+    'TIMESTAMP': 'string',
+    'DATE': 'string',
+}
+
+
+def check_parquet_export():
+    """Пробная выгрузка в Parquet: список проблем, пустой - если всё в порядке
+    или pyarrow не установлен (тогда формат не предлагается)"""
+    if pyarrow is None:
+        return []
+
+    headers = [f"column_{i}" for i in range(len(PARQUET_CHECK_TYPES))]
+    types = list(PARQUET_CHECK_TYPES)
+    rows = [
+        (1, 'текст', 1500.5, '12', 0.5, 1, '2024-01-01 10:00:00', '2024-01-01'),
+        (None, None, None, None, None, None, None, None),
+        ('x', 2, 'не число', '', 'x', 0, '', ''),
+    ]
+    try:
+        data = b''.join(parquet_stream('check', headers, types, iter(rows)))
+        table = pyarrow.parquet.read_table(pyarrow.BufferReader(data))
+    except Exception as e:
+        return [f"выгрузка не удалась: {e}"]
+
+    problems = []
+    if table.num_rows != len(rows):
+        problems.append(f"строк {table.num_rows} вместо {len(rows)}")
+    for field, (declared, expected) in zip(table.schema, PARQUET_CHECK_TYPES.items()):
+        if str(field.type) != expected:
+            problems.append(f"{declared} выгружен как {field.type} вместо {expected}")
+    return problems
@@ -0,0 +1,310 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+
+import pandas as pd
+
+from templates.base.database import get_db
+from excel_utils import (
+    IMPORT_CHUNK_SIZE, frame_rows, get_supported_exel_types_mapping, import_result_message, insert_rows,
+    merge_result_message, merge_rows, prepare_import_frame, read_excel_file
+)
+
+logger = logging.getLogger(__name__)
+
+# Фоновый импорт Excel.
+#
+# Загруженный файл сохраняется на диск, а в таблицу import_jobs ставится
+# задание - запрос на этом завершается. Обработчик заданий (свой поток в
+# каждом процессе) забирает задание, читает файл и загружает строки
+# порциями по IMPORT_JOB_CHUNK_SIZE: каждая порция коммитится вместе с
+# отметкой о прогрессе, как дозаполнения в migrations.py.
+#
+# Прочитанная и очищенная таблица сохраняется рядом с файлом, поэтому
+# задание, процесс которого был убит, другой обработчик продолжает с
+# последней закоммиченной порции без повторного разбора Excel. Задание
+# считается брошенным, если прогресс не обновлялся IMPORT_STALE_SECONDS.
+# Каждая запись прогресса проверяет, что задание всё ещё принадлежит этому
+# обработчику, так что одну порцию два обработчика не загрузят.
+
+IMPORT_SPOOL_FOLDER = os.environ.get('IMPORT_SPOOL_FOLDER', 'import_spool')
+IMPORT_JOB_CHUNK_SIZE = IMPORT_CHUNK_SIZE
+IMPORT_STALE_SECONDS = 300
+# как часто обработчик проверяет задания, если его не разбудили
+IMPORT_POLL_SECONDS = 30
+
+IMPORT_MODES = ('append', 'merge')
+
+
+class ImportJobLost(Exception):
+    """Задание забрал другой обработчик"""
+    pass
+
+
+def create_import_jobs_table(db:sqlite3.Connection):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data_type TEXT NOT NULL,
+            mode TEXT NOT NULL DEFAULT 'append',
+            file_path TEXT NOT NULL,
+            file_name TEXT,
+            user_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            worker TEXT,
+            total_rows INTEGER,
+            processed_rows INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            updated INTEGER NOT NULL DEFAULT 0,
+            unchanged INTEGER NOT NULL DEFAULT 0,
+            errors TEXT NOT NULL DEFAULT '[]',
+            message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
+        )
+    ''')
+    db.execute("CREATE INDEX IF NOT EXISTS idx_import_jobs_status ON import_jobs (status, updated_at)")
+
+
+def frame_path(job):
+    """Файл с прочитанной и очищенной таблицей задания"""
+    return job['file_path'] + '.pkl'
+
+
+def create_import_job(file, data_type:str, mode:str = 'append', user_id:int = None):
+    """Сохраняет загруженный файл и ставит задание импорта, возвращает его id"""
+    table_mapping = get_supported_exel_types_mapping()
+    if data_type not in table_mapping:
+        raise Exception('Неподдерживаемый тип данных для импорта')
+    if mode not in IMPORT_MODES:
+        raise Exception(f'Неизвестный режим импорта: {mode}')
+    if mode == 'merge' and not table_mapping[data_type].get('merge_keys'):
+        raise Exception('Для этого типа данных объединение не поддерживается')
+
+    os.makedirs(IMPORT_SPOOL_FOLDER, exist_ok=True)
+    extension = os.path.splitext(file.filename)[1].lower()
+    file_path = os.path.join(IMPORT_SPOOL_FOLDER, f"{uuid.uuid4().hex}{extension}")
+    file.save(file_path)
+
+    db = get_db()
+    job_id = db.execute('''
+        INSERT INTO import_jobs (data_type, mode, file_path, file_name, user_id)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (data_type, mode, file_path, file.filename, user_id)).lastrowid
+    db.commit()
+    return job_id
+
+
+def read_import_job(job_id:int, db:sqlite3.Connection = None):
+    if db is None:
+        db = get_db()
+    return db.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+
+
+def import_job_result(job):
+    """(успех, сообщение) по счётчикам задания"""
+    errors = json.loads(job['errors'])
+    if job['mode'] == 'merge':
+        return merge_result_message(job['inserted'], job['updated'], job['unchanged'], errors)
+    return import_result_message(job['inserted'], errors)
+
+
+def import_job_status(job):
+    """Состояние задания для страницы прогресса"""
+    errors = json.loads(job['errors'])
+    total = job['total_rows']
+    return {
+        'id': job['id'],
+        'status': job['status'],
+        'file_name': job['file_name'],
+        'total_rows': total,
+        'processed_rows': job['processed_rows'],
+        'percent': round(job['processed_rows'] * 100 / total) if total else 0,
+        'inserted': job['inserted'],
+        'updated': job['updated'],
+        'unchanged': job['unchanged'],
+        'error_count': len(errors),
+        'message': job['message'],
+        'success': job['status'] == 'completed' and not errors,
+    }
+
+
+def claim_import_job(db:sqlite3.Connection, worker:str):
+    """Забирает следующее задание из очереди или брошенное, возвращает его или None"""
+    available = f'''
+        (status = 'queued' OR (status = 'running'
+            AND updated_at < datetime('now', '-{IMPORT_STALE_SECONDS} seconds')))
+    '''
+    row = db.execute(f"SELECT id FROM import_jobs WHERE {available} ORDER BY id LIMIT 1").fetchone()
+    if row is None:
+        return None
+
+    # условие повторяется в UPDATE: из нескольких обработчиков задание получит один
+    claimed = db.execute(f'''
+        UPDATE import_jobs SET status = 'running', worker = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND {available}
+    ''', (worker, row['id'])).rowcount
+    db.commit()
+    if not claimed:
+        return None
+    return read_import_job(row['id'], db)
+
+
+def save_progress(db:sqlite3.Connection, job_id:int, worker:str, **values):
+    """Обновляет задание в текущей транзакции, если оно всё ещё у этого обработчика"""
+    assignments = ''.join(f"{column} = ?, " for column in values)
+    saved = db.execute(f'''
+        UPDATE import_jobs SET {assignments}updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND worker = ?
+    ''', list(values.values()) + [job_id, worker]).rowcount
+    if not saved:
+        raise ImportJobLost()
+
+
+def load_import_frame(db:sqlite3.Connection, job, worker:str):
+    """Очищенная таблица задания: с диска, если файл уже разбирался, иначе из Excel"""
+    path = frame_path(job)
+    if job['total_rows'] is not None and os.path.exists(path):
+        return pd.read_pickle(path)
+
+    table_name = get_supported_exel_types_mapping()[job['data_type']]['tablename']
+    df, errors, _ = prepare_import_frame(db, table_name, read_excel_file(job['file_path']))
+
+    # сначала файл, потом отметка: отметка без файла означала бы повторный разбор
+    df.to_pickle(path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+    if job['total_rows'] is None:
+        save_progress(db, job['id'], worker, total_rows=len(df), errors=json.dumps(errors, ensure_ascii=False))
+        db.commit()
+    return df
+
+
+def remove_spool_files(job):
+    for path in (job['file_path'], frame_path(job)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def run_import_job(db:sqlite3.Connection, job, worker:str, chunk_size:int = IMPORT_JOB_CHUNK_SIZE):
+    """Загружает задание порциями, начиная с последней закоммиченной"""
+    mapping = get_supported_exel_types_mapping()[job['data_type']]
+    table_name = mapping['tablename']
+    table_info = db.execute(f"PRAGMA table_info({table_name})").fetchall()
+    declared_types = {col['name']: col['type'] for col in table_info}
+
+    df = load_import_frame(db, job, worker)
+    job = read_import_job(job['id'], db)
+
+    errors = json.loads(job['errors'])
+    processed = job['processed_rows']
+    inserted, updated, unchanged = job['inserted'], job['updated'], job['unchanged']
+
+    while processed < len(df):
+        chunk = df.iloc[processed:processed + chunk_size]
+        try:
+            if job['mode'] == 'merge':
+                chunk_counts = merge_rows(db, table_name, chunk, mapping['merge_keys'], declared_types)
+                inserted += chunk_counts[0]
+                updated += chunk_counts[1]
+                unchanged += chunk_counts[2]
+                errors += chunk_counts[3]
+            else:
+                inserted += insert_rows(db, table_name, list(chunk.columns), frame_rows(chunk))
+
+            processed += len(chunk)
+            save_progress(db, job['id'], worker, processed_rows=processed, inserted=inserted,
+                          updated=updated, unchanged=unchanged, errors=json.dumps(errors, ensure_ascii=False))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        logger.info(f"Импорт {job['id']}: загружено {processed} из {len(df)} строк")
+
+    finish_import_job(db, job['id'], worker, 'completed', import_job_result(read_import_job(job['id'], db))[1])
+
+
+def finish_import_job(db:sqlite3.Connection, job_id:int, worker:str, status:str, message:str):
+    saved = db.execute('''
+        UPDATE import_jobs
+        SET status = ?, message = ?, updated_at = CURRENT_TIMESTAMP, completed_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND worker = ?
+    ''', (status, message, job_id, worker)).rowcount
+    db.commit()
+    if not saved:
+        raise ImportJobLost()
+
+
+class ImportJobRunner:
+    """Обработчик заданий импорта в отдельном потоке"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.worker = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.running = False
+        self.thread = None
+        self.wakeup = threading.Event()
+
+    def start(self):
+        if self.running:
+            return
+
+        self.running = True
+        self.thread = threading.Thread(target=self._runner_loop, daemon=True)
+        self.thread.start()
+        logger.info(f"Обработчик заданий импорта {self.worker} запущен")
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def notify(self):
+        """Разбудить обработчик - в очереди новое задание"""
+        self.wakeup.set()
+
+    def _runner_loop(self):
+        while self.running:
+            try:
+                if self.run_next_job():
+                    continue
+            except Exception as e:
+                logger.error(f"Ошибка обработчика заданий импорта: {str(e)}")
+
+            self.wakeup.wait(IMPORT_POLL_SECONDS)
+            self.wakeup.clear()
+
+    def run_next_job(self):
+        """Выполняет одно задание, False - заданий нет"""
+        # своё соединение из пула на время задания
+        with self.app.app_context():
+            db = get_db()
+            job = claim_import_job(db, self.worker)
+            if job is None:
+                return False
+
+            logger.info(f"Импорт {job['id']}: {job['file_name']}, строк загружено {job['processed_rows']}")
+            try:
+                run_import_job(db, job, self.worker)
+            except ImportJobLost:
+                # файлы остаются - задание продолжает другой обработчик
+                logger.warning(f"Импорт {job['id']} забрал другой обработчик")
+                return True
+            except Exception as e:
+                logger.error(f"Импорт {job['id']} завершился ошибкой: {str(e)}")
+                try:
+                    finish_import_job(db, job['id'], self.worker, 'failed', f"Ошибка импорта: {str(e)}")
+                except ImportJobLost:
+                    return True
+
+            remove_spool_files(job)
+            return True
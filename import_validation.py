@@ -0,0 +1,211 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.comments import Comment
+from openpyxl.styles import Font, PatternFill
+
+from templates.base.database import get_db
+from excel_utils import (
+    NUMERIC_TYPES, frame_rows, get_supported_exel_types_mapping, read_excel_file, required_import_columns,
+    text_column
+)
+
+# Проверка файла импорта без записи в базу.
+#
+# Каждая проверка выполняется над столбцом DataFrame целиком - строки по
+# одной не обходятся. Результат - список ошибок ячеек
+# (индекс строки, столбец, текст), по которому собирается книга с исходными
+# строками: ячейки с ошибками подсвечены и снабжены примечаниями. Оператор
+# исправляет в ней всё сразу и загружает файл один раз.
+
+_octet = r'(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)'
+IP_PATTERN = rf'{_octet}(\.{_octet}){{3}}'
+# те же форматы, что принимает validate_network_range: CIDR, 192.168.1.1-100, одиночный адрес
+IP_RANGE_PATTERN = rf'{IP_PATTERN}(/(3[0-2]|[12]?\d)|-(25[0-5]|2[0-4]\d|1\d\d|[1-9]\d?))?'
+MAC_PATTERN = r'[0-9A-Fa-f]{2}([:-])[0-9A-Fa-f]{2}(\1[0-9A-Fa-f]{2}){4}|[0-9A-Fa-f]{4}\.[0-9A-Fa-f]{4}\.[0-9A-Fa-f]{4}'
+
+# столбец -> (шаблон значения, подсказка в тексте ошибки)
+COLUMN_PATTERNS = {
+    'ip_address': (IP_PATTERN, 'ожидается IP-адрес вида 192.168.1.10'),
+    'server_ip': (IP_PATTERN, 'ожидается IP-адрес вида 192.168.1.10'),
+    'ip_range': (IP_RANGE_PATTERN, 'ожидается диапазон вида 192.168.1.0/24 или 192.168.1.1-100'),
+    'mac_address': (MAC_PATTERN, 'ожидается MAC-адрес вида aa:bb:cc:dd:ee:ff'),
+}
+
+# сколько значений ключа проверять по базе одним запросом
+KEY_LOOKUP_BATCH_SIZE = 500
+
+ERROR_FILL = PatternFill(fill_type='solid', start_color='FFC7CE', end_color='FFC7CE')
+HEADER_FONT = Font(bold=True)
+COMMENT_AUTHOR = 'Проверка импорта'
+
+
+def is_date_column(column:str, declared_type:str):
+    return 'DATE' in declared_type or 'TIME' in declared_type or column.endswith('_date')
+
+
+def unique_columns(db, table_name:str):
+    """Столбцы таблицы с собственным уникальным индексом"""
+    columns = []
+    for index in db.execute(f"PRAGMA index_list({table_name})").fetchall():
+        if not index['unique'] or index['origin'] == 'pk':
+            continue
+        info = db.execute(f"PRAGMA index_info({index['name']})").fetchall()
+        if len(info) == 1:
+            columns.append(info[0]['name'])
+    return columns
+
+
+def existing_values(db, table_name:str, column:str, values):
+    """Какие из values уже есть в столбце таблицы"""
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), KEY_LOOKUP_BATCH_SIZE):
+        batch = values[start:start + KEY_LOOKUP_BATCH_SIZE]
+        rows = db.execute(f'''
+            SELECT {column} FROM {table_name} WHERE {column} IN ({', '.join('?' for _ in batch)})
+        ''', batch).fetchall()
+        found.update(row[0] for row in rows)
+    return found
+
+
+def validate_import_frame(db, table_name:str, df, required_columns=None, merge_keys=None, mode:str = 'append'):
+    """Ошибки ячеек df: список (индекс строки, столбец, текст).
+
+    Индекс None - ошибка заголовка (нет обязательного столбца). Ключи
+    merge_keys и уникальные столбцы проверяются на повторы в файле, а при
+    добавлении (mode='append') уникальные - ещё и на совпадение с базой
+    """
+    table_info = db.execute(f"PRAGMA table_info({table_name})").fetchall()
+    declared_types = {col['name']: (col['type'] or '').upper() for col in table_info
+                      if col['name'] not in ['id', 'created_at', 'updated_at']}
+    if required_columns is None:
+        required_columns = required_import_columns(table_info)
+
+    errors = [(None, column, f"Нет обязательного столбца {column}")
+              for column in required_columns if column not in df.columns]
+
+    def add_errors(mask, column, message):
+        errors.extend((index, column, message) for index in df.index[mask])
+
+    unique = unique_columns(db, table_name)
+    keys = [key for key in dict.fromkeys((merge_keys or []) + unique) if key in df.columns]
+
+    for column in [c for c in df.columns if c in declared_types]:
+        declared_type = declared_types[column]
+        values = df[column]
+        text = text_column(values, declared_type)
+        present = text.notna()
+
+        if column in required_columns:
+            add_errors(~present, column, 'обязательное поле не заполнено')
+
+        if any(t in declared_type for t in NUMERIC_TYPES):
+            add_errors(present & pd.to_numeric(values, errors='coerce').isna(), column, 'ожидается число')
+        elif is_date_column(column, declared_type) and not pd.api.types.is_datetime64_any_dtype(values):
+            parsed = pd.to_datetime(text, format='ISO8601', errors='coerce')
+            add_errors(present & parsed.isna(), column, 'ожидается дата в формате ГГГГ-ММ-ДД')
+
+        if column in COLUMN_PATTERNS:
+            pattern, hint = COLUMN_PATTERNS[column]
+            add_errors(present & ~text.str.fullmatch(pattern).fillna(False), column, hint)
+
+        if column in keys:
+            duplicated = present & text.duplicated(keep=False)
+            if duplicated.any():
+                # для каждого значения - строка, где оно встретилось впервые
+                first = pd.Series(df.index[duplicated], index=df.index[duplicated]).groupby(text[duplicated].values).transform('min')
+                for index, first_index in first.items():
+                    message = ('значение повторяется ниже в файле' if index == first_index
+                               else f'значение уже есть в строке {first_index + 2}')
+                    errors.append((index, column, message))
+
+            if mode == 'append' and column in unique:
+                found = existing_values(db, table_name, column, text[present].unique())
+                add_errors(text.isin(found).fillna(False), column, 'такое значение уже есть в базе')
+
+    return errors
+
+
+def error_workbook(df, errors, headers=None):
+    """Книга с исходными строками df: ячейки с ошибками подсвечены, у них есть
+    примечания, а последний столбец и лист «Ошибки» перечисляют все ошибки.
+
+    headers - заголовки столбцов, как они были в загруженном файле
+    """
+    headers = list(headers if headers is not None else df.columns)
+    positions = {column: position for position, column in enumerate(df.columns)}
+
+    cell_errors = {}
+    row_errors = {}
+    for index, column, message in errors:
+        if index is None:
+            continue
+        position = positions[column]
+        cell_errors.setdefault((index, position), []).append(message)
+        row_errors.setdefault(index, []).append(f"{headers[position]}: {message}")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Данные')
+    sheet.freeze_panes = 'A2'
+
+    def header_row(target, titles):
+        cells = []
+        for title in titles:
+            cell = WriteOnlyCell(target, value=title)
+            cell.font = HEADER_FONT
+            cells.append(cell)
+        target.append(cells)
+
+    header_row(sheet, headers + ['Ошибки'])
+    for index, row in zip(df.index, frame_rows(df)):
+        cells = list(row)
+        for position, value in enumerate(row):
+            messages = cell_errors.get((index, position))
+            if messages:
+                cell = WriteOnlyCell(sheet, value=value)
+                cell.fill = ERROR_FILL
+                cell.comment = Comment('\n'.join(messages), COMMENT_AUTHOR)
+                cells[position] = cell
+        cells.append('; '.join(row_errors[index]) if index in row_errors else None)
+        sheet.append(cells)
+
+    errors_sheet = workbook.create_sheet('Ошибки')
+    header_row(errors_sheet, ['Строка', 'Столбец', 'Ошибка'])
+    for index, column, message in sorted(errors, key=lambda e: (-1 if e[0] is None else e[0], positions.get(e[1], -1))):
+        if index is None:
+            errors_sheet.append([None, column, message])
+        else:
+            errors_sheet.append([index + 2, headers[positions[column]], message])
+
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def dry_run_message(rows_checked:int, errors):
+    if not errors:
+        return f"Проверено строк: {rows_checked}, ошибок не найдено"
+    rows_with_errors = len({index for index, _, _ in errors if index is not None})
+    return f"Проверено строк: {rows_checked}, ошибок: {len(errors)} в {rows_with_errors} строках"
+
+
+def generate_errors_filename(name:str):
+    return f'{name}_errors_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
+
+
+def dry_run_import(file, data_type:str, mode:str = 'append'):
+    """Проверка файла импорта без записи в базу: (строк проверено, ошибки, книга с ошибками или None)"""
+    table_mapping = get_supported_exel_types_mapping()
+    if data_type not in table_mapping:
+        raise Exception('Неподдерживаемый тип данных для импорта')
+
+    mapping = table_mapping[data_type]
+    df = read_excel_file(file)
+    merge_keys = mapping.get('merge_keys') if mode == 'merge' else None
+    errors = validate_import_frame(get_db(), mapping['tablename'], df, merge_keys=merge_keys, mode=mode)
+    return len(df), errors, error_workbook(df, errors) if errors else None
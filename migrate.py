@@ -0,0 +1,35 @@
+import sys
+
+from templates.base.database_helper import get_db
+from templates.base.migrations import run_migrations, get_schema_version, latest_version
+from templates.base.query_plans import find_full_scans
+from export_formats import check_parquet_export
+
+def migrate():
+    db = get_db()
+    try:
+        applied = run_migrations(db)
+        if applied:
+            print(f"✅ Применены миграции: {', '.join(str(v) for v in applied)}")
+        print(f"✅ Версия схемы базы данных: {get_schema_version(db)} (последняя {latest_version()})")
+
+    except Exception as e:
+        print(f"❌ Ошибка при обновлении базы данных: {e}")
+        return False
+
+    # проверяем, что частые запросы по-прежнему используют индексы
+    problems = find_full_scans(db)
+    for name, scans in problems.items():
+        print(f"❌ Полное сканирование таблицы в запросе \"{name}\": {'; '.join(scans)}")
+    if not problems:
+        print("✅ Все частые запросы используют индексы")
+
+    # выгрузка в Parquet - только если установлен pyarrow
+    export_problems = check_parquet_export()
+    for problem in export_problems:
+        print(f"❌ Выгрузка в Parquet: {problem}")
+
+    return not problems and not export_problems
+
+if __name__ == '__main__':
+    sys.exit(0 if migrate() else 1)
@@ -7,6 +7,8 @@ import time
 from datetime import datetime
 import json
 
+from templates.network_scan.ping_engine import lookup_hostnames, ping_hosts
+
 class NetworkScanner:
     def __init__(self):
         self.active_devices = []
@@ -17,57 +19,18 @@ class NetworkScanner:
         """
         Ping сканирование сети
         """
-        devices = []
         network = ipaddress.ip_network(network_range, strict=False)
-        total_hosts = len(list(network.hosts()))
-        scanned_hosts = 0
-        
-        def ping_host(ip):
-            try:
-                param = "-n 1 -w {}".format(timeout * 1000) if platform.system().lower() == "windows" else "-c 1 -W {}".format(timeout)
-                command = f"ping {param} {ip}"
-                response = subprocess.run(
-                    command, 
-                    stdout=subprocess.DEVNULL, 
-                    stderr=subprocess.DEVNULL, 
-                    shell=True
-                )
-                return response.returncode == 0
-            except:
-                return False
-        
-        threads = []
-        results = {}
         
-        def check_host(host):
-            if ping_host(str(host)):
-                device_info = self.get_device_info(str(host))
-                devices.append(device_info)
-            
-            nonlocal scanned_hosts
-            scanned_hosts += 1
-            self.scan_progress = (scanned_hosts / total_hosts) * 100
+        def set_progress(done, total):
+            self.scan_progress = (done / total) * 100
         
-        # Сканируем все хосты в сети
-        for host in network.hosts():
-            if not self.is_scanning:
-                break
-                
-            thread = threading.Thread(target=check_host, args=(host,))
-            threads.append(thread)
-            thread.start()
-            
-            # Ограничиваем количество одновременных потоков
-            if len(threads) >= 50:
-                for t in threads:
-                    t.join()
-                threads = []
-        
-        # Ждем завершения оставшихся потоков
-        for t in threads:
-            t.join()
-            
-        return devices
+        # все адреса опрашиваются параллельно в одном потоке (см. ping_engine.py)
+        alive = ping_hosts(network.hosts(), timeout, on_progress=set_progress,
+                           should_stop=lambda: not self.is_scanning)
+        # имена узлов - параллельно, время ответа уже измерено при опросе
+        hostnames = lookup_hostnames(alive)
+        return [self.get_device_info(ip, hostnames.get(ip, 'Unknown'), alive[ip])
+                for ip in sorted(alive, key=ipaddress.ip_address)]
     
     def arp_scan(self, interface=None):
         """
@@ -172,40 +135,43 @@ class NetworkScanner:
             
         return sorted(open_ports)
     
-    def get_device_info(self, ip):
+    def get_device_info(self, ip, hostname=None, response_time=None):
         """
-        Получение информации об устройстве
+        Получение информации об устройстве.
+        hostname и response_time, если уже известны, повторно не определяются
         """
         device_info = {
             'ip_address': ip,
-            'hostname': 'Unknown',
+            'hostname': hostname or 'Unknown',
             'mac_address': 'Unknown',
             'vendor': 'Unknown',
             'os_info': 'Unknown',
-            'response_time': 0,
+            'response_time': response_time or 0,
             'ports': []
         }
         
         try:
             # Получаем hostname
-            try:
-                hostname = socket.gethostbyaddr(ip)[0]
-                device_info['hostname'] = hostname
-            except:
-                pass
+            if hostname is None:
+                try:
+                    hostname = socket.gethostbyaddr(ip)[0]
+                    device_info['hostname'] = hostname
+                except:
+                    pass
             
             # Измеряем время ответа
-            start_time = time.time()
-            param = "-n 1 -w 1000" if platform.system().lower() == "windows" else "-c 1 -W 1"
-            result = subprocess.run(
-                f"ping {param} {ip}", 
-                capture_output=True, 
-                shell=True
-            )
-            end_time = time.time()
-            
-            if result.returncode == 0:
-                device_info['response_time'] = round((end_time - start_time) * 1000, 2)
+            if response_time is None:
+                start_time = time.time()
+                param = "-n 1 -w 1000" if platform.system().lower() == "windows" else "-c 1 -W 1"
+                result = subprocess.run(
+                    f"ping {param} {ip}", 
+                    capture_output=True, 
+                    shell=True
+                )
+                end_time = time.time()
+                
+                if result.returncode == 0:
+                    device_info['response_time'] = round((end_time - start_time) * 1000, 2)
             
             # Сканируем порты (только основные)
             device_info['ports'] = self.port_scan(ip, "21,22,23,80,443,3389,8080")
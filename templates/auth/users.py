@@ -4,17 +4,18 @@ from werkzeug.security import generate_password_hash, check_password_hash
 
 from functools import wraps
 from templates.base.requirements import admin_required, login_required, permission_required, permissions_required_all, permissions_required_any
-from templates.roles.database_roles import read_all_roles, read_roles_for_user, save_roles_to_user
+from templates.roles.database_roles import read_all_roles, read_roles_for_user, read_user_permissions, save_roles_to_user
 
 from templates.roles.permissions import Permissions, Role
+from templates.roles.permission_bits import to_mask
 
 bluprint_user_routes = Blueprint("users", __name__)
 
 # обновление разрешения пользователя, на случай, если он настраивал сам себя
 def update_effective_permissions():
-    user_roles = read_roles_for_user(session['user_id'])
-    effective_permissions = Role.get_effective_permissions(user_roles)
-    session['permissions'] = list(effective_permissions)
+    effective_permissions = read_user_permissions(session['user_id'])
+    # в cookie сессии - компактная битовая маска вместо списка строк
+    session['permissions'] = to_mask(effective_permissions)
 
 @bluprint_user_routes.route('/login', methods=['GET', 'POST'])
 def login():
@@ -0,0 +1,109 @@
+import hashlib
+import sqlite3
+from datetime import datetime, timezone
+
+from flask import make_response, request
+
+# Счётчики изменений таблиц.
+#
+# Триггеры на каждой отслеживаемой таблице увеличивают её номер версии
+# в table_changes при любой вставке, изменении или удалении. По версиям
+# можно дёшево понять, изменились ли данные, не перечитывая их: для
+# ETag/Last-Modified ответов, кэшей выгрузок и т.п.
+
+TRACKED_TABLES = [
+    'devices',
+    'providers',
+    'software_cubes',
+    'guest_wifi',
+    'organizations',
+    'users',
+    'articles',
+    'notes',
+    'shifts',
+    'todos',
+]
+
+
+def create_table_changes_table(db:sqlite3.Connection):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS table_changes (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+
+
+def track_table_changes(db:sqlite3.Connection, table:str):
+    """Создаёт триггеры, которые считают изменения таблицы"""
+    db.execute('INSERT OR IGNORE INTO table_changes (table_name) VALUES (?)', (table,))
+
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        name = f"trg_table_changes_{table}_{event.lower()}"
+        db.execute(f"DROP TRIGGER IF EXISTS {name}")
+        db.execute(f'''
+            CREATE TRIGGER {name} AFTER {event} ON {table}
+            BEGIN
+                UPDATE table_changes SET version = version + 1, changed_at = CURRENT_TIMESTAMP
+                WHERE table_name = '{table}';
+            END
+        ''')
+
+
+def get_table_versions(db:sqlite3.Connection, tables:list[str]):
+    """Версии и время последнего изменения таблиц: name -> (version, changed_at)"""
+    placeholders = ', '.join('?' for _ in tables)
+    rows = db.execute(f'''
+        SELECT table_name, version, changed_at FROM table_changes
+        WHERE table_name IN ({placeholders})
+    ''', tables).fetchall()
+
+    versions = {table: (0, None) for table in tables}
+    for row in rows:
+        versions[row['table_name']] = (row['version'], row['changed_at'])
+    return versions
+
+
+def make_etag(versions:dict, *extra):
+    key = ';'.join(f"{table}={versions[table][0]}" for table in sorted(versions))
+    key += ';' + ';'.join(str(e) for e in extra)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def last_modified(versions:dict):
+    times = [changed_at for _, changed_at in versions.values() if changed_at]
+    if not times:
+        return None
+    # CURRENT_TIMESTAMP в SQLite - время UTC
+    return datetime.strptime(max(times), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+def conditional_response(db:sqlite3.Connection, tables:list[str], build, *extra):
+    """Ответ, который строится функцией build только если данные таблиц
+    изменились с прошлого запроса клиента, иначе - пустой ответ 304.
+
+    extra - прочие значения, от которых зависит ответ (например, дата)
+    """
+    versions = get_table_versions(db, tables)
+    etag = make_etag(versions, *extra)
+    modified = last_modified(versions)
+
+    if request.if_none_match:
+        # сжатые ответы отдаются со слабым ETag (см. compression.py)
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        # дата изменения не учитывает extra, поэтому при нём проверяется только ETag
+        not_modified = (modified is not None and request.if_modified_since is not None
+                        and modified <= request.if_modified_since and not extra)
+
+    if not_modified:
+        response = make_response('', 304)
+    else:
+        response = make_response(build())
+
+    response.set_etag(etag)
+    if modified is not None:
+        response.last_modified = modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
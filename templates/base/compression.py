@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Сжатие ответов и кэширование статики.
+#
+# HTML и JSON сжимаются на лету (brotli, если установлен пакет brotli,
+# иначе gzip) по заголовку Accept-Encoding. Потоковые ответы не трогаются:
+# их пришлось бы сначала собрать целиком. Пакет brotli необязателен и в
+# requirements.txt не указан - без него используется только gzip.
+#
+# Текстовая статика сжимается заранее при запуске - рядом с файлом
+# кладутся .gz/.br, и статический маршрут отдаёт подходящий вариант.
+# Ссылки на статику в шаблонах строятся через asset_url и содержат хэш
+# содержимого файла, поэтому такие ответы (и загруженные скриншоты, у
+# которых уникальные имена) браузер может хранить год и не перепроверять.
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+}
+
+# ответы меньше этого размера не сжимаются - выигрыша почти нет
+MIN_COMPRESS_SIZE = 500
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+PRECOMPRESS_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.map')
+
+# варианты файла: кодировка -> суффикс, в порядке предпочтения
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# каталоги статики, файлы в которых никогда не перезаписываются
+IMMUTABLE_PREFIXES = ('uploads/',)
+
+# имя файла -> (mtime, хэш содержимого)
+_asset_hashes = dict()
+
+
+def available_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate_encoding(encodings:list[str]):
+    """Лучшая из encodings кодировка, которую принимает клиент, или None"""
+    return request.accept_encodings.best_match(encodings)
+
+
+def compress(data:bytes, encoding:str, best:bool = False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    # mtime=0 - одинаковое содержимое даёт одинаковый архив
+    return gzip.compress(data, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response):
+    if (response.direct_passthrough or response.is_streamed
+            or not 200 <= response.status_code < 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(available_encodings())
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    # сжатое тело отличается от исходного побайтно, строгий ETag больше не верен
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def precompress_static(folder:str):
+    """Создаёт .gz/.br рядом с текстовыми файлами статики, если их нет или они устарели"""
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if not name.endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+
+            path = os.path.join(root, name)
+            mtime = os.path.getmtime(path)
+            data = None
+            for encoding in available_encodings():
+                target = path + PRECOMPRESSED_SUFFIXES[encoding]
+                if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                try:
+                    with open(target, 'wb') as f:
+                        f.write(compress(data, encoding, best=True))
+                except OSError as e:
+                    logger.warning(f"Не удалось сжать {path}: {e}")
+
+
+def asset_hash(filename:str):
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+
+    mtime = os.path.getmtime(path)
+    cached = _asset_hashes.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'rb') as f:
+        digest = hashlib.md5(f.read()).hexdigest()[:12]
+    _asset_hashes[filename] = (mtime, digest)
+    return digest
+
+
+def asset_url(filename:str):
+    """url_for('static', ...) с хэшем содержимого файла: при изменении файла
+    меняется и ссылка, поэтому ответ можно кэшировать навсегда"""
+    digest = asset_hash(filename)
+    if digest is None:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=digest)
+
+
+def send_static(filename:str):
+    """Статический маршрут с поддержкой заранее сжатых вариантов файлов"""
+    folder = current_app.static_folder
+    served = filename
+    encoding = None
+
+    if os.path.splitext(filename)[1] in PRECOMPRESS_EXTENSIONS:
+        variants = [e for e in available_encodings()
+                    if os.path.isfile(safe_join(folder, filename + PRECOMPRESSED_SUFFIXES[e]) or '')]
+        encoding = negotiate_encoding(variants) if variants else None
+        if encoding is not None:
+            served = filename + PRECOMPRESSED_SUFFIXES[encoding]
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(folder, served, mimetype=mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if os.path.splitext(filename)[1] in PRECOMPRESS_EXTENSIONS:
+        response.vary.add('Accept-Encoding')
+
+    if request.args.get('v') or filename.startswith(IMMUTABLE_PREFIXES):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        # без хэша в ссылке браузер каждый раз перепроверяет файл по ETag
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def init_app(app):
+    if app.static_folder and os.path.isdir(app.static_folder):
+        precompress_static(app.static_folder)
+    app.view_functions['static'] = send_static
+    app.add_template_global(asset_url)
+    app.after_request(compress_response)
@@ -0,0 +1,134 @@
+import sqlite3
+
+# Сводная статистика для дашборда.
+#
+# Счётчики и суммы хранятся в таблице dashboard_stats и поддерживаются
+# триггерами на исходных таблицах: вставка добавляет строку в свою группу,
+# удаление вычитает, изменение вычитает старую версию и добавляет новую.
+# Дашборд читает всю сводку одним запросом, сколько бы ни было записей.
+
+
+class Rollup:
+    """Счётчик (и, если задано, сумма) по группам строк таблицы.
+
+    key_sql - выражение группы ('' - одна группа на всю таблицу),
+    where_sql - какие строки учитываются, total_sql - что суммируется.
+    В выражениях таблица обозначается как {row}, вместо неё подставляются
+    NEW и OLD в триггерах и имя таблицы при полном пересчёте.
+    """
+
+    def __init__(self, metric:str, table:str, key_sql:str = "''", where_sql:str = "1", total_sql:str = "0"):
+        self.metric = metric
+        self.table = table
+        self.key_sql = key_sql
+        self.where_sql = where_sql
+        self.total_sql = total_sql
+
+    def sql(self, expression:str, row:str):
+        return expression.replace('{row}', row)
+
+
+ROLLUPS = [
+    Rollup('devices', 'devices'),
+    Rollup('devices_by_type', 'devices', key_sql='{row}.type'),
+    Rollup('devices_by_status', 'devices', key_sql='{row}.status'),
+
+    Rollup('providers', 'providers', total_sql='IFNULL({row}.price, 0)'),
+    Rollup('active_providers', 'providers', where_sql="{row}.status = 'Активен'", total_sql='IFNULL({row}.price, 0)'),
+    Rollup('providers_by_city', 'providers', key_sql='{row}.city'),
+    Rollup('cost_by_service', 'providers', key_sql='{row}.service_type',
+           where_sql="{row}.status = 'Активен'", total_sql='IFNULL({row}.price, 0)'),
+
+    Rollup('software_cubes', 'software_cubes', total_sql='IFNULL({row}.price, 0)'),
+    Rollup('active_software_cubes', 'software_cubes', where_sql="{row}.status = 'Активен'"),
+
+    Rollup('organizations_by_type', 'organizations', key_sql='{row}.type'),
+
+    Rollup('users', 'users'),
+    Rollup('published_articles', 'articles', where_sql='{row}.is_published = 1'),
+    Rollup('notes', 'notes'),
+]
+
+
+def create_dashboard_stats_table(db:sqlite3.Connection):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_stats (
+            metric TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, key)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _add_statement(rollup:Rollup, row:str):
+    return f'''
+        INSERT INTO dashboard_stats (metric, key, count, total)
+        SELECT '{rollup.metric}', {rollup.sql(rollup.key_sql, row)}, 1, {rollup.sql(rollup.total_sql, row)}
+        WHERE {rollup.sql(rollup.where_sql, row)}
+        ON CONFLICT (metric, key) DO UPDATE SET count = count + 1, total = total + excluded.total;
+    '''
+
+
+def _subtract_statements(rollup:Rollup, row:str):
+    key = rollup.sql(rollup.key_sql, row)
+    return f'''
+        UPDATE dashboard_stats SET count = count - 1, total = total - {rollup.sql(rollup.total_sql, row)}
+        WHERE metric = '{rollup.metric}' AND key = {key} AND ({rollup.sql(rollup.where_sql, row)});
+        DELETE FROM dashboard_stats WHERE metric = '{rollup.metric}' AND key = {key} AND count <= 0;
+    '''
+
+
+def create_dashboard_stats_triggers(db:sqlite3.Connection):
+    for rollup in ROLLUPS:
+        name = f"trg_dashboard_stats_{rollup.metric}"
+        db.execute(f"DROP TRIGGER IF EXISTS {name}_insert")
+        db.execute(f"DROP TRIGGER IF EXISTS {name}_update")
+        db.execute(f"DROP TRIGGER IF EXISTS {name}_delete")
+
+        db.execute(f'''
+            CREATE TRIGGER {name}_insert AFTER INSERT ON {rollup.table}
+            BEGIN {_add_statement(rollup, 'NEW')} END
+        ''')
+        db.execute(f'''
+            CREATE TRIGGER {name}_update AFTER UPDATE ON {rollup.table}
+            BEGIN {_subtract_statements(rollup, 'OLD')} {_add_statement(rollup, 'NEW')} END
+        ''')
+        db.execute(f'''
+            CREATE TRIGGER {name}_delete AFTER DELETE ON {rollup.table}
+            BEGIN {_subtract_statements(rollup, 'OLD')} END
+        ''')
+
+
+def rebuild_dashboard_stats(db:sqlite3.Connection):
+    """Полный пересчёт сводки по исходным таблицам"""
+    db.execute("DELETE FROM dashboard_stats")
+    for rollup in ROLLUPS:
+        key = rollup.sql(rollup.key_sql, rollup.table)
+        db.execute(f'''
+            INSERT INTO dashboard_stats (metric, key, count, total)
+            SELECT '{rollup.metric}', {key}, COUNT(*), SUM({rollup.sql(rollup.total_sql, rollup.table)})
+            FROM {rollup.table}
+            WHERE {rollup.sql(rollup.where_sql, rollup.table)}
+            GROUP BY {key}
+        ''')
+
+
+def read_dashboard_stats(db:sqlite3.Connection):
+    """Вся сводка одним запросом: metric -> список строк (key, count, total)"""
+    stats = {rollup.metric: [] for rollup in ROLLUPS}
+    for row in db.execute("SELECT metric, key, count, total FROM dashboard_stats").fetchall():
+        stats.setdefault(row['metric'], []).append(row)
+    return stats
+
+
+# значение метрики без групп
+def stats_count(stats:dict, metric:str):
+    rows = stats.get(metric)
+    return rows[0]['count'] if rows else 0
+
+
+def stats_total(stats:dict, metric:str):
+    rows = stats.get(metric)
+    return rows[0]['total'] if rows else 0
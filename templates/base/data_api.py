@@ -0,0 +1,189 @@
+import math
+
+from flask import flash, jsonify, request
+
+from templates.base.database import get_db
+from templates.base.database_helper import readonly_db
+from templates.base.pagination import cursor_position, keyset_page, page_size
+from templates.base.requirements import permission_required
+
+# Построитель запросов к спискам сущностей.
+#
+# Для сущности описывается белый список полей, фильтров и сортировок,
+# параметры запроса (?status=Активен&price__gte=100&sort=name&fields=id,name)
+# превращаются в параметризованный SQL с постраничным выводом по ключу.
+# Одно и то же описание используется страницами списков и JSON API
+# /api/<сущность>, которое блюпринт подключает через register_data_api.
+#
+# Фильтры: поле=значение (равенство), поле__like (подстрока),
+# поле__gte / поле__lte (диапазон), поле__in (значения через запятую),
+# q - поиск подстроки сразу по полям search_fields.
+
+FILTER_OPERATORS = {
+    'eq': '{column} = ?',
+    'like': '{column} LIKE ?',
+    'gte': '{column} >= ?',
+    'lte': '{column} <= ?',
+    'in': '{column} IN ({placeholders})',
+}
+
+
+class QueryError(ValueError):
+    pass
+
+
+class Entity:
+    def __init__(self, name:str, table:str, permission, fields:list[str], filters:dict,
+                 sort_columns:list[str], default_sort:str, default_order:str = 'desc', search_fields:list[str] = None,
+                 sort_expressions:dict = None, numeric_fields:list[str] = None):
+        self.name = name
+        self.table = table
+        self.permission = permission
+        self.fields = fields
+        # поле -> допустимые операторы
+        self.filters = filters
+        self.sort_columns = {column: column for column in sort_columns}
+        # сортировки по выражениям: имя -> кортеж выражений (см. keyset_page)
+        self.sort_columns.update(sort_expressions or {})
+        self.default_sort = default_sort
+        self.default_order = default_order
+        self.search_fields = search_fields or []
+        # значения фильтров по этим полям должны быть числами
+        self.numeric_fields = numeric_fields or []
+
+
+def parse_filters(entity:Entity, args):
+    filters = []
+    for key in args:
+        if key in ('fields', 'sort', 'order', 'cursor', 'per_page'):
+            continue
+
+        value = args.get(key)
+        if value is None or value == '':
+            continue
+
+        if key == 'q':
+            if entity.search_fields:
+                conditions = ' OR '.join(f"{field} LIKE ?" for field in entity.search_fields)
+                filters.append((conditions, [f'%{value}%'] * len(entity.search_fields)))
+            continue
+
+        field, _, operator = key.partition('__')
+        operator = operator or 'eq'
+        if operator not in entity.filters.get(field, ()):
+            raise QueryError(f"Фильтр {key} не поддерживается")
+
+        template = FILTER_OPERATORS[operator]
+        if operator == 'in':
+            values = [filter_value(entity, field, v) for v in value.split(',') if v]
+            placeholders = ', '.join('?' for _ in values)
+            filters.append((template.format(column=field, placeholders=placeholders), values))
+        elif operator == 'like':
+            filters.append((template.format(column=field), [f'%{value}%']))
+        else:
+            filters.append((template.format(column=field), [filter_value(entity, field, value)]))
+
+    return filters
+
+
+def filter_value(entity:Entity, field:str, value:str):
+    if field not in entity.numeric_fields:
+        return value
+    try:
+        number = float(value)
+        if not math.isfinite(number):
+            raise ValueError(value)
+    except ValueError:
+        raise QueryError(f"Значение фильтра {field} должно быть числом: {value}")
+    return int(number) if number.is_integer() else number
+
+
+def entity_filters(entity:Entity, args):
+    """Условия фильтров списка для итогов по той же выборке; при неверных
+    параметрах - без условий, как и сам список в query_entity_page"""
+    try:
+        return parse_filters(entity, args)
+    except QueryError:
+        return []
+
+
+def filters_where(filters:list):
+    """WHERE из условий parse_filters и его параметры"""
+    if not filters:
+        return '', []
+    params = []
+    for _, values in filters:
+        params.extend(values)
+    return f"WHERE {' AND '.join(f'({sql})' for sql, _ in filters)}", params
+
+
+def parse_fields(entity:Entity, args, sort:str):
+    requested = args.get('fields')
+    if not requested:
+        return '*'
+
+    fields = [f.strip() for f in requested.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in entity.fields]
+    if unknown:
+        raise QueryError(f"Неизвестные поля: {', '.join(unknown)}")
+
+    # id и столбец сортировки нужны для курсора следующей страницы,
+    # значения выражений сортировки keyset_page читает сам
+    required_fields = ['id'] if isinstance(entity.sort_columns[sort], tuple) else ['id', sort]
+    for required in required_fields:
+        if required not in fields:
+            fields.append(required)
+    return ', '.join(fields)
+
+
+def query_entity(db, entity:Entity, args):
+    """Страница сущности по параметрам запроса"""
+    sort = args.get('sort', entity.default_sort)
+    if sort not in entity.sort_columns:
+        sort = entity.default_sort
+
+    cursor = args.get('cursor')
+    if cursor and cursor_position(cursor, entity.sort_columns[sort]) is None:
+        raise QueryError("Неверный курсор: начните с первой страницы")
+
+    return keyset_page(
+        db, entity.table, entity.sort_columns,
+        sort=sort,
+        order=args.get('order', entity.default_order),
+        cursor=cursor,
+        size=page_size(args.get('per_page')),
+        filters=parse_filters(entity, args),
+        columns=parse_fields(entity, args, sort),
+        default_sort=entity.default_sort,
+    )
+
+
+def query_entity_page(entity:Entity, args):
+    """Страница для HTML-списка: при неверных параметрах - весь список с сообщением"""
+    db = get_db()
+    try:
+        return query_entity(db, entity, args)
+    except QueryError as e:
+        flash(str(e), 'error')
+        return query_entity(db, entity, {})
+
+
+def register_data_api(blueprint, entity:Entity):
+    """Подключает к блюпринту маршрут /api/<сущность>"""
+
+    @permission_required(entity.permission)
+    @readonly_db
+    def data_api():
+        try:
+            page = query_entity(get_db(), entity, request.args)
+        except QueryError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return jsonify({
+            'items': [{key: row[key] for key in row.keys() if not key.startswith('sort_key_')} for row in page.rows],
+            'next_cursor': page.next_cursor,
+            'sort': page.sort,
+            'order': page.order,
+        })
+
+    blueprint.add_url_rule(f'/api/{entity.name}', f'api_{entity.name}', data_api)
@@ -4,7 +4,9 @@ from werkzeug.security import generate_password_hash
 from templates.roles.database_roles import create_roles_tables, find_role_by_name, save_roles_to_user_by_id
 from templates.base.database_helper import get_db
 
-def find_user_id_by_name(user_name:str, db:sqlite3.Connection = get_db()):
+def find_user_id_by_name(user_name:str, db:sqlite3.Connection = None):
+    if db is None:
+        db = get_db()
     user = db.execute(f"SELECT id FROM users where username=\"{user_name}\"").fetchone()
     if user is None:
         raise ValueError(f"Пользователь {user_name} не найден")
@@ -50,9 +52,7 @@ def init_default_admin(db:sqlite3.Connection):
         set_role_for_user("user", "Reader", db)
 
 
-def init_db():
-    db = get_db()
-    
+def create_tables(db:sqlite3.Connection):
     # Таблица устройств
     db.execute('''
         CREATE TABLE IF NOT EXISTS devices (
@@ -398,5 +398,11 @@ def init_db():
     # Добавляем администратора по умолчанию
     create_roles_tables(db)
     init_default_admin(db)
-    
-    db.commit()
\ No newline at end of file
+
+
+def init_db():
+    # схема создаётся и обновляется миграциями, если версия базы актуальна -
+    # при запуске выполняется единственный запрос
+    from templates.base.migrations import run_migrations
+
+    run_migrations(get_db())
\ No newline at end of file
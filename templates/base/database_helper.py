@@ -1,18 +1,168 @@
+import queue
 import sqlite3
+import threading
+from functools import wraps
+
+from flask import g, has_app_context
+
+from templates.base.sql_profiler import wrap_connection, unwrap_connection
+
+DATABASE = 'it_inventory.db'
+
+# максимальное количество одновременно открытых соединений в пуле
+POOL_SIZE = 16
+# сколько секунд ждать свободное соединение, если пул исчерпан
+POOL_TIMEOUT = 30
+
+# настройки соединения: WAL позволяет читателям не ждать писателя,
+# busy_timeout - писателям подождать друг друга вместо мгновенной ошибки
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",      # ~20 МБ страничного кэша на соединение
+    "PRAGMA mmap_size = 268435456",    # 256 МБ отображения файла в память
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def open_connection(database=DATABASE, readonly=False):
+    """Открывает новое соединение с базой и применяет настройки"""
+    if readonly:
+        # mode=ro не даёт писать в файл, query_only - выполнять любые
+        # изменяющие запросы: попытка записи сразу падает с ошибкой
+        conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(database, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        # режим журнала переключает только пишущее соединение
+        if readonly and 'journal_mode' in pragma:
+            continue
+        conn.execute(pragma)
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений с базой.
+
+    Соединение выдаётся потоку/запросу целиком и возвращается обратно
+    после завершения работы, поэтому незакоммиченная транзакция одного
+    потока больше не видна другим.
+    """
+
+    def __init__(self, database=DATABASE, size=POOL_SIZE, timeout=POOL_TIMEOUT, readonly=False):
+        self.database = database
+        self.readonly = readonly
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return open_connection(self.database, self.readonly)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError(f"Нет свободных соединений с базой (размер пула {self.size})")
+
+    def release(self, conn):
+        # откатываем всё, что не было закоммичено, чтобы не отдать
+        # следующему владельцу соединение с открытой транзакцией
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self._discard(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._opened -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+pool = ConnectionPool()
+# соединения только для чтения, не конкурируют с пишущими за блокировку
+readonly_pool = ConnectionPool(readonly=True)
+
+# соединения потоков, работающих вне контекста приложения Flask
+_thread_local = threading.local()
+
 
-class SingletonClass:
-    _instance = None 
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(SingletonClass, cls).__new__(cls)
-            #print("Создали новый SingletonClass")
-            cls.conn = sqlite3.connect('it_inventory.db', check_same_thread=False)
-            cls.conn.row_factory = sqlite3.Row
-            #print("Открыли коннект к базе")
-        return cls._instance
-    
 def get_db():
-    singleton = SingletonClass()
-    return singleton.conn
+    """Соединение текущего запроса (или потока, если контекста приложения нет)"""
+    if has_app_context():
+        if g.get('_db_readonly'):
+            return get_readonly_db()
+        if '_database' not in g:
+            g._database = wrap_connection(pool.acquire())
+        return g._database
+
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is None:
+        conn = open_connection()
+        _thread_local.conn = conn
+    return conn
+
+
+def get_readonly_db():
+    """Соединение только для чтения на время текущего запроса"""
+    if '_database_ro' not in g:
+        g._database_ro = wrap_connection(readonly_pool.acquire())
+    return g._database_ro
+
+
+def close_db(exception=None):
+    """Возвращает соединения запроса в пул"""
+    conn = g.pop('_database', None)
+    if conn is not None:
+        pool.release(unwrap_connection(conn))
+
+    conn = g.pop('_database_ro', None)
+    if conn is not None:
+        readonly_pool.release(unwrap_connection(conn))
+
+
+# Декоратор для обработчиков, которые только читают данные:
+# get_db() внутри них вернёт соединение только для чтения
+def readonly_db(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g._db_readonly = True
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g._db_readonly = False
+    return decorated_function
+
 
+def init_app(app):
+    app.teardown_appcontext(close_db)
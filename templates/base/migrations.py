@@ -0,0 +1,412 @@
+import sqlite3
+
+from templates.base.database import create_tables
+from templates.base.change_tracking import TRACKED_TABLES, create_table_changes_table, track_table_changes
+from templates.base.dashboard_stats import create_dashboard_stats_table, create_dashboard_stats_triggers, rebuild_dashboard_stats
+from templates.knowledge.knowledge_search import create_knowledge_fts, rebuild_knowledge_fts
+from templates.roles.permission_cache import permission_cache
+from templates.roles.database_roles import PERMISSION_TABLES, create_user_permissions_table, refresh_user_permissions
+from templates.roles.permission_bits import assign_permission_bits, create_permission_bits_table
+from templates.search.search import create_global_search, rebuild_global_search
+from templates.organizations.organizations import ORGANIZATION_TYPE_ORDER
+from import_jobs import create_import_jobs_table
+
+# Версионные миграции схемы базы.
+#
+# Каждая миграция имеет номер, описание, функцию изменения схемы и
+# (необязательно) список дозаполнений данных. Номер последней применённой
+# миграции хранится в таблице schema_version, поэтому при актуальной схеме
+# запуск приложения обходится одним запросом.
+#
+# Функция схемы выполняется в одной транзакции вместе с записью номера
+# миграции и отметками о её дозаполнениях, поэтому применяется ровно один
+# раз. Она всё равно должна быть идемпотентной (IF NOT EXISTS, проверка
+# столбцов) - схема старых баз могла быть создана и без миграций.
+#
+# Дозаполнения выполняются после коммита схемы порциями по BACKFILL_BATCH_SIZE
+# строк, каждая порция коммитится вместе с отметкой о прогрессе. Так большая
+# таблица не блокируется целиком, а прерванное дозаполнение продолжается
+# с последней закоммиченной порции при следующем запуске. Условие
+# дозаполнения (where_sql) должно отбирать только ещё не заполненные строки:
+# одно и то же дозаполнение могут одновременно продолжить несколько воркеров.
+
+BACKFILL_BATCH_SIZE = 1000
+
+MIGRATIONS = list()
+
+
+class Backfill:
+    def __init__(self, name:str, table:str, set_sql:str, where_sql:str):
+        self.name = name
+        self.table = table
+        self.set_sql = set_sql
+        self.where_sql = where_sql
+
+
+class Migration:
+    def __init__(self, version:int, description:str, apply, backfills:list[Backfill] = None):
+        self.version = version
+        self.description = description
+        self.apply = apply
+        self.backfills = backfills or []
+
+
+def migration(version:int, description:str, backfills:list[Backfill] = None):
+    def register(function):
+        MIGRATIONS.append(Migration(version, description, function, backfills))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return function
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def get_schema_version(db:sqlite3.Connection):
+    try:
+        row = db.execute('SELECT MAX(version) as version FROM schema_version').fetchone()
+    except sqlite3.OperationalError:
+        # таблицы ещё нет - база создаётся с нуля
+        return 0
+    return row['version'] or 0
+
+
+def create_migration_tables(db:sqlite3.Connection):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS migration_backfills (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            is_done BOOLEAN NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def column_exists(db:sqlite3.Connection, table:str, column:str):
+    columns = db.execute(f"PRAGMA table_info({table})").fetchall()
+    return any(c['name'] == column for c in columns)
+
+
+def add_column(db:sqlite3.Connection, table:str, column:str, definition:str):
+    if not column_exists(db, table, column):
+        print(f"Добавляем столбец {table}.{column}")
+        db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def run_backfill(db:sqlite3.Connection, backfill:Backfill, batch_size:int = BACKFILL_BATCH_SIZE):
+    """Порционное дозаполнение данных с сохранением прогресса"""
+    db.execute('INSERT OR IGNORE INTO migration_backfills (name) VALUES (?)', (backfill.name,))
+    db.commit()
+
+    state = db.execute('SELECT last_id, is_done FROM migration_backfills WHERE name = ?', (backfill.name,)).fetchone()
+    if state['is_done']:
+        return
+
+    last_id = state['last_id']
+    while True:
+        # граница очередной порции по первичному ключу
+        row = db.execute(f'''
+            SELECT MAX(id) as max_id FROM (
+                SELECT id FROM {backfill.table} WHERE id > ? ORDER BY id LIMIT ?
+            )
+        ''', (last_id, batch_size)).fetchone()
+        upper_id = row['max_id']
+
+        if upper_id is None:
+            db.execute('''
+                UPDATE migration_backfills SET is_done = 1, updated_at = CURRENT_TIMESTAMP WHERE name = ?
+            ''', (backfill.name,))
+            db.commit()
+            break
+
+        db.execute(f'''
+            UPDATE {backfill.table} SET {backfill.set_sql}
+            WHERE id > ? AND id <= ? AND ({backfill.where_sql})
+        ''', (last_id, upper_id))
+        db.execute('''
+            UPDATE migration_backfills SET last_id = ?, updated_at = CURRENT_TIMESTAMP WHERE name = ?
+        ''', (upper_id, backfill.name))
+        db.commit()
+
+        print(f"Дозаполнение {backfill.name}: обработаны строки до id={upper_id}")
+        last_id = upper_id
+
+
+def get_migration_state(db:sqlite3.Connection):
+    """(версия схемы, есть ли незаконченные дозаполнения) одним запросом"""
+    try:
+        row = db.execute('''
+            SELECT (SELECT MAX(version) FROM schema_version) as version,
+                   EXISTS (SELECT 1 FROM migration_backfills WHERE is_done = 0) as pending
+        ''').fetchone()
+    except sqlite3.OperationalError:
+        # таблиц ещё нет - база создаётся с нуля
+        return 0, False
+    return row['version'] or 0, bool(row['pending'])
+
+
+def run_pending_backfills(db:sqlite3.Connection):
+    """Продолжает дозаполнения, которые отмечены, но не закончены"""
+    pending = {row['name'] for row in db.execute('SELECT name FROM migration_backfills WHERE is_done = 0').fetchall()}
+    for m in MIGRATIONS:
+        for backfill in m.backfills:
+            if backfill.name in pending:
+                run_backfill(db, backfill)
+
+
+def run_migrations(db:sqlite3.Connection):
+    """Применяет к базе все миграции, которых в ней ещё нет"""
+    current, pending = get_migration_state(db)
+    if current >= latest_version() and not pending:
+        return []
+
+    # дозаполнения, прерванные при прошлом запуске
+    if pending:
+        run_pending_backfills(db)
+
+    applied = []
+    for m in MIGRATIONS:
+        if m.version <= current:
+            continue
+
+        # BEGIN IMMEDIATE не даст нескольким воркерам одновременно
+        # менять схему: второй дождётся первого и увидит новую версию
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            create_migration_tables(db)
+            if get_schema_version(db) >= m.version:
+                db.rollback()
+                current = m.version
+                continue
+
+            print(f"Применяем миграцию {m.version}: {m.description}")
+            m.apply(db)
+            db.executemany('INSERT OR IGNORE INTO migration_backfills (name) VALUES (?)',
+                           [(backfill.name,) for backfill in m.backfills])
+            db.execute('INSERT OR IGNORE INTO schema_version (version, description) VALUES (?, ?)', (m.version, m.description))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        # следующие миграции могут рассчитывать на заполненные данные
+        for backfill in m.backfills:
+            run_backfill(db, backfill)
+
+        current = m.version
+        applied.append(m.version)
+
+    # миграции создают роли и назначают их с commit=False
+    permission_cache.invalidate()
+    return applied
+
+
+# ========== МИГРАЦИИ ==========
+
+@migration(1, "Базовая схема, роли и администратор по умолчанию")
+def migration_base_schema(db:sqlite3.Connection):
+    create_tables(db)
+
+
+# столбцы, которые раньше добавлялись вручную скриптами migrate_*.py
+# и update_devices_model.py, в старых базах их может не быть
+@migration(2, "Недостающие столбцы в таблицах старых версий", backfills=[
+    Backfill("organizations_type", "organizations", "type = 'ООО'", "type IS NULL"),
+    Backfill("todos_is_completed", "todos", "is_completed = (status = 'выполнена')", "is_completed IS NULL"),
+    Backfill("todos_updated_at", "todos", "updated_at = created_at", "updated_at IS NULL"),
+])
+def migration_legacy_columns(db:sqlite3.Connection):
+    add_column(db, 'devices', 'model', 'TEXT')
+
+    add_column(db, 'organizations', 'type', "TEXT DEFAULT 'ООО'")
+    add_column(db, 'organizations', 'inn', 'TEXT')
+    add_column(db, 'organizations', 'contact_person', 'TEXT')
+    add_column(db, 'organizations', 'phone', 'TEXT')
+    add_column(db, 'organizations', 'email', 'TEXT')
+    add_column(db, 'organizations', 'address', 'TEXT')
+    add_column(db, 'organizations', 'notes', 'TEXT')
+
+    add_column(db, 'providers', 'city', "TEXT NOT NULL DEFAULT 'Не указан'")
+    add_column(db, 'software_cubes', 'city', "TEXT NOT NULL DEFAULT 'Не указан'")
+
+    # ALTER TABLE не допускает DEFAULT CURRENT_TIMESTAMP,
+    # updated_at заполняется дозаполнением
+    add_column(db, 'todos', 'completed_at', 'TIMESTAMP')
+    add_column(db, 'todos', 'is_completed', 'BOOLEAN')
+    add_column(db, 'todos', 'updated_at', 'TIMESTAMP')
+
+
+# индексы для фильтров и сортировок дашборда, списков и фоновых задач,
+# проверка планов запросов - templates/base/query_plans.py
+@migration(3, "Индексы для частых запросов")
+def migration_hot_path_indexes(db:sqlite3.Connection):
+    indexes = [
+        # устройства: последние добавленные, группировки на дашборде
+        "CREATE INDEX IF NOT EXISTS idx_devices_created_at ON devices (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_devices_type ON devices (type)",
+        "CREATE INDEX IF NOT EXISTS idx_devices_status ON devices (status)",
+
+        # провайдеры: покрывающий индекс для сумм и группировки по типу услуги
+        "CREATE INDEX IF NOT EXISTS idx_providers_status_service_price ON providers (status, service_type, price)",
+        "CREATE INDEX IF NOT EXISTS idx_providers_status_created_at ON providers (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_providers_city ON providers (city)",
+        "CREATE INDEX IF NOT EXISTS idx_providers_created_at ON providers (created_at)",
+
+        "CREATE INDEX IF NOT EXISTS idx_software_cubes_created_at ON software_cubes (created_at)",
+
+        "CREATE INDEX IF NOT EXISTS idx_guest_wifi_city_organization ON guest_wifi (city, organization)",
+        "CREATE INDEX IF NOT EXISTS idx_guest_wifi_created_at ON guest_wifi (created_at)",
+
+        "CREATE INDEX IF NOT EXISTS idx_shifts_shift_date ON shifts (shift_date, shift_type)",
+
+        "CREATE INDEX IF NOT EXISTS idx_network_devices_scan_ip ON network_devices (scan_id, ip_address)",
+        "CREATE INDEX IF NOT EXISTS idx_network_devices_ip_address ON network_devices (ip_address)",
+        "CREATE INDEX IF NOT EXISTS idx_network_devices_last_seen ON network_devices (last_seen)",
+        "CREATE INDEX IF NOT EXISTS idx_network_scans_created_at ON network_scans (created_at)",
+
+        # планировщик выбирает только ожидающие публикации - частичный индекс
+        "CREATE INDEX IF NOT EXISTS idx_scheduled_posts_due ON scheduled_posts (scheduled_time) WHERE status = 'scheduled'",
+
+        # в списке статей показываются только опубликованные
+        "CREATE INDEX IF NOT EXISTS idx_articles_published_updated_at ON articles (updated_at) WHERE is_published = 1",
+        "CREATE INDEX IF NOT EXISTS idx_articles_category ON articles (category)",
+
+        "CREATE INDEX IF NOT EXISTS idx_notes_author_pinned_updated ON notes (author_id, is_pinned, updated_at)",
+
+        "CREATE INDEX IF NOT EXISTS idx_script_results_script_id ON script_results (script_id, executed_at)",
+
+        "CREATE INDEX IF NOT EXISTS idx_roles_to_user_user_id ON roles_to_user (user_id, role_id)",
+    ]
+
+    for sql in indexes:
+        db.execute(sql)
+
+    # статистика для планировщика запросов
+    db.execute("ANALYZE")
+
+
+# материализованные эффективные разрешения пользователей,
+# дальше поддерживаются функциями templates/roles/database_roles.py
+@migration(4, "Таблица эффективных разрешений пользователей")
+def migration_user_effective_permissions(db:sqlite3.Connection):
+    create_user_permissions_table(db)
+    refresh_user_permissions(db)
+
+
+# номера битов разрешений для маски в сессии, см. templates/roles/permission_bits.py
+@migration(5, "Назначение битов разрешениям")
+def migration_permission_bits(db:sqlite3.Connection):
+    create_permission_bits_table(db)
+    assign_permission_bits(db)
+
+
+# сводная статистика дашборда, поддерживается триггерами,
+# см. templates/base/dashboard_stats.py
+@migration(6, "Сводная статистика дашборда")
+def migration_dashboard_stats(db:sqlite3.Connection):
+    create_dashboard_stats_table(db)
+    create_dashboard_stats_triggers(db)
+    rebuild_dashboard_stats(db)
+
+
+# счётчики изменений таблиц, см. templates/base/change_tracking.py
+@migration(7, "Счётчики изменений таблиц")
+def migration_table_changes(db:sqlite3.Connection):
+    create_table_changes_table(db)
+    for table in TRACKED_TABLES:
+        track_table_changes(db, table)
+
+
+# сортировки и фильтры списка устройств с постраничным выводом,
+# см. templates/base/pagination.py
+@migration(8, "Индексы для сортировки и фильтров списка устройств")
+def migration_device_list_indexes(db:sqlite3.Connection):
+    db.execute("CREATE INDEX IF NOT EXISTS idx_devices_name ON devices (name)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_devices_location ON devices (location)")
+
+    # фильтр + сортировка по умолчанию (сначала новые)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_devices_type_created_at ON devices (type, created_at)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_devices_status_created_at ON devices (status, created_at)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_devices_location_created_at ON devices (location, created_at)")
+
+
+# сортировки списков, которые отдаются страницами (templates/base/data_api.py),
+# и новые метрики сводки для итогов под этими списками
+@migration(9, "Индексы для списков с постраничным выводом")
+def migration_entity_list_indexes(db:sqlite3.Connection):
+    indexes = [
+        "CREATE INDEX IF NOT EXISTS idx_providers_name ON providers (name)",
+        "CREATE INDEX IF NOT EXISTS idx_providers_service_type ON providers (service_type)",
+        "CREATE INDEX IF NOT EXISTS idx_providers_status ON providers (status)",
+
+        "CREATE INDEX IF NOT EXISTS idx_software_cubes_name ON software_cubes (name)",
+        "CREATE INDEX IF NOT EXISTS idx_software_cubes_software_type ON software_cubes (software_type)",
+        "CREATE INDEX IF NOT EXISTS idx_software_cubes_city ON software_cubes (city)",
+        "CREATE INDEX IF NOT EXISTS idx_software_cubes_status ON software_cubes (status)",
+
+        "CREATE INDEX IF NOT EXISTS idx_guest_wifi_city ON guest_wifi (city)",
+
+        "CREATE INDEX IF NOT EXISTS idx_organizations_name ON organizations (name)",
+        "CREATE INDEX IF NOT EXISTS idx_organizations_type ON organizations (type)",
+        "CREATE INDEX IF NOT EXISTS idx_organizations_created_at ON organizations (created_at)",
+    ]
+    for sql in indexes:
+        db.execute(sql)
+
+    create_dashboard_stats_triggers(db)
+    rebuild_dashboard_stats(db)
+
+
+# полнотекстовый поиск по статьям и заметкам,
+# см. templates/knowledge/knowledge_search.py
+@migration(10, "Полнотекстовые индексы базы знаний")
+def migration_knowledge_fts(db:sqlite3.Connection):
+    create_knowledge_fts(db)
+    rebuild_knowledge_fts(db)
+
+
+# общий trigram-индекс для поиска по всем сущностям,
+# см. templates/search/search.py
+@migration(11, "Общий поисковый индекс")
+def migration_global_search(db:sqlite3.Connection):
+    create_global_search(db)
+    rebuild_global_search(db)
+
+
+# естественные ключи для импорта с объединением (см. merge_frame в excel_utils.py);
+# devices.serial_number уже уникален и проиндексирован
+@migration(12, "Индексы естественных ключей для импорта")
+def migration_natural_key_indexes(db:sqlite3.Connection):
+    db.execute("CREATE INDEX IF NOT EXISTS idx_devices_mac_address ON devices (mac_address)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_organizations_inn ON organizations (inn)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_providers_contract_number ON providers (contract_number)")
+
+
+@migration(13, "Очередь фонового импорта Excel")
+def migration_import_jobs(db:sqlite3.Connection):
+    create_import_jobs_table(db)
+
+
+# номер поколения кэша разрешений, см. templates/roles/permission_cache.py
+@migration(14, "Счётчики изменений таблиц ролей")
+def migration_permission_tables_changes(db:sqlite3.Connection):
+    create_table_changes_table(db)
+    for table in PERMISSION_TABLES:
+        track_table_changes(db, table)
+
+
+# список организаций по страницам в порядке типов (templates/organizations/organizations.py)
+# и итоги по типам над ним
+@migration(15, "Постраничный список организаций")
+def migration_organizations_list(db:sqlite3.Connection):
+    db.execute(f"CREATE INDEX IF NOT EXISTS idx_organizations_type_order ON organizations (({ORGANIZATION_TYPE_ORDER}), name)")
+    create_dashboard_stats_triggers(db)
+    rebuild_dashboard_stats(db)
@@ -1,5 +1,10 @@
 from templates.roles.permissions import Permissions
-from flask import session, url_for
+from templates.roles.permission_bits import session_permissions_mask, to_mask
+from functools import lru_cache
+from flask import current_app, request, url_for
+
+# сколько разных вариантов отрисованного меню хранить
+MENU_CACHE_SIZE = 256
 
 # класс родитель-заглушка
 class DrawableMenuItem():
@@ -24,19 +29,25 @@ class MenuItem(DrawableMenuItem):
         self.url = url
         self.urls_to_be_active = urls_to_be_active
         self.permissions = permissions
+        self._mask = None
+
+    # маска разрешений кнопки, считается при первой проверке
+    @property
+    def mask(self):
+        if self._mask is None:
+            self._mask = to_mask(self.permissions)
+        return self._mask
 
     def is_allowed(self):
-        if not session.get('permissions'):
+        user_mask = session_permissions_mask()
+        if not user_mask:
             return False
             
         if len(self.permissions) == 0:
             return True
 
-        for p in session['permissions']:
-            if p in self.permissions:
-                return True
-        
-        return False
+        # достаточно любого из разрешений кнопки
+        return bool(user_mask & self.mask)
 
     def is_active(self, url):
         return url in self.urls_to_be_active
@@ -109,6 +120,32 @@ class DropDownMenu(SimpleMenu):
         </li>
         """
 
+# Меню с кэшем отрисовки.
+# Разметка зависит только от разрешений пользователя, активной страницы и
+# адресов, поэтому строится один раз для каждой пары (маска разрешений,
+# endpoint). Адреса меняются только вместе с картой URL приложения
+# (после первого запроса Flask не даёт добавлять маршруты) и префиксом
+# SCRIPT_NAME - они тоже входят в ключ.
+class CachedMenu(DrawableMenuItem):
+    def __init__(self, factory, maxsize = MENU_CACHE_SIZE):
+        super().__init__(icon="")
+        self.factory = factory
+        self.menu = None
+        self._render = lru_cache(maxsize=maxsize)(self._draw)
+
+    def _draw(self, mask, url, url_map_id, script_root):
+        if self.menu is None:
+            self.menu = self.factory()
+        return self.menu.draw(url)
+
+    def draw(self, url):
+        return self._render(session_permissions_mask(), url, id(current_app.url_map), request.script_root)
+
+    # сброс при изменении структуры меню
+    def clear(self):
+        self.menu = None
+        self._render.cache_clear()
+
 def create_knowlege_base_menu():
     menu = DropDownMenu(name="База знаний", icon="bi-journal-text")
     menu.add_item(MenuItem(button_class="dropdown-item", icon="bi-journal-text",name="Статьи", url="articles.articles_list", urls_to_be_active= ['articles.articles_list', 'articles.view_article', 'articles.add_article', 'articles.edit_article'], permissions=[Permissions.articles_read, Permissions.articles_manage]))
@@ -153,4 +190,6 @@ def create_main_menu():
     menu.add_item(create_knowlege_base_menu())
     menu.add_item(create_simple_menu())
     menu.add_item(create_social_menu())
-    return menu
\ No newline at end of file
+    return menu
+
+main_menu = CachedMenu(create_main_menu)
@@ -0,0 +1,167 @@
+import base64
+import json
+import sqlite3
+
+# Постраничный вывод по ключу (keyset pagination).
+#
+# Вместо OFFSET следующая страница начинается сразу после последней строки
+# предыдущей: курсор хранит значение столбца сортировки и id этой строки,
+# а запрос читает по индексу только строки страницы. Поэтому любая страница
+# стоит одинаково, сколько бы записей ни было в таблице.
+#
+# Сортировать можно только по столбцам из белого списка, у которых есть
+# индекс (id в SQLite входит в любой индекс таблицы и используется как
+# второй ключ, чтобы порядок был однозначным).
+#
+# Столбец может содержать NULL (например, created_at у строк, вставленных
+# с явным NULL). SQLite ставит NULL первыми при возрастании и последними
+# при убывании, а сравнение с NULL ничего не находит, поэтому продолжение
+# после курсора разбито на части: строки со значением и строки с NULL
+# читаются отдельными запросами по тому же индексу.
+#
+# Вместо столбца сортировкой может быть кортеж SQL-выражений (например,
+# порядок типов через CASE и затем название) - для него нужен индекс по
+# тем же выражениям. Их значения у последней строки читаются вместе со
+# строками страницы и попадают в курсор; NULL выражения давать не должны.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class Page:
+    def __init__(self, rows:list, next_cursor:str, sort:str, order:str, size:int):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.sort = sort
+        self.order = order
+        self.size = size
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(value, id:int):
+    data = json.dumps([value, id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor:str):
+    """(значение, id) из курсора или None, если курсор испорчен"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, id = json.loads(data)
+        return value, int(id)
+    except (ValueError, TypeError):
+        return None
+
+
+def cursor_position(cursor:str, column):
+    """Позиция из курсора для сортировки column или None, если курсор
+    испорчен либо выдан для другой сортировки"""
+    position = decode_cursor(cursor)
+    if position is None:
+        return None
+
+    value, _ = position
+    if isinstance(column, tuple):
+        if not isinstance(value, list) or len(value) != len(column):
+            return None
+        values = value
+    else:
+        values = [value]
+    if not all(v is None or isinstance(v, (str, int, float)) for v in values):
+        return None
+    return position
+
+
+def page_size(value, default:int = DEFAULT_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_page(db:sqlite3.Connection, table:str, sort_columns:dict, sort:str, order:str,
+                cursor:str = None, size:int = DEFAULT_PAGE_SIZE, filters:list = None, columns:str = '*',
+                default_sort:str = None):
+    """Страница строк таблицы.
+
+    sort_columns - допустимые сортировки: имя параметра -> столбец или
+    кортеж выражений, filters - список условий (sql, параметры),
+    объединяемых через AND.
+    """
+    if sort not in sort_columns:
+        sort = default_sort or next(iter(sort_columns))
+    if order not in ('asc', 'desc'):
+        order = 'desc'
+    column = sort_columns[sort]
+    direction = order.upper()
+
+    if isinstance(column, tuple):
+        order_by = ', '.join(f"{expression} {direction}" for expression in column)
+        columns += ', ' + ', '.join(f"{expression} AS sort_key_{i}" for i, expression in enumerate(column))
+    else:
+        order_by = f"{column} {direction}"
+
+    conditions = []
+    params = []
+    for sql, values in filters or []:
+        conditions.append(f"({sql})")
+        params.extend(values)
+
+    position = cursor_position(cursor, column) if cursor else None
+    rows = []
+    # одна лишняя строка показывает, есть ли следующая страница
+    for sql, values in after_cursor(column, order, position):
+        where_conditions = conditions + ([f"({sql})"] if sql else [])
+        where = f"WHERE {' AND '.join(where_conditions)}" if where_conditions else ''
+
+        rows += db.execute(f'''
+            SELECT {columns} FROM {table}
+            {where}
+            ORDER BY {order_by}, id {direction}
+            LIMIT ?
+        ''', params + values + [size + 1 - len(rows)]).fetchall()
+        if len(rows) > size:
+            break
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        last = rows[-1]
+        if isinstance(column, tuple):
+            value = [last[f'sort_key_{i}'] for i in range(len(column))]
+        else:
+            value = last[column]
+        next_cursor = encode_cursor(value, last['id'])
+
+    return Page(rows, next_cursor, sort, order, size)
+
+
+def after_cursor(column:str, order:str, position):
+    """Части выборки после курсора по порядку: список (условие, параметры)"""
+    if position is None:
+        return [(None, [])]
+
+    value, id = position
+    comparison = '<' if order == 'desc' else '>'
+    if isinstance(column, tuple):
+        # отдельное условие на первое выражение позволяет начать чтение
+        # индекса с нужного места: сравнение кортежей выражений SQLite
+        # по индексу не ищет
+        placeholders = ', '.join('?' for _ in column)
+        return [(f"{column[0]} {comparison}= ? AND ({', '.join(column)}, id) {comparison} ({placeholders}, ?)",
+                 [value[0]] + list(value) + [id])]
+
+    if order == 'desc':
+        # NULL - в конце
+        if value is None:
+            return [(f"{column} IS NULL AND id < ?", [id])]
+        return [(f"({column}, id) < (?, ?)", [value, id]), (f"{column} IS NULL", [])]
+
+    # NULL - в начале
+    if value is None:
+        return [(f"{column} IS NULL AND id > ?", [id]), (f"{column} IS NOT NULL", [])]
+    return [(f"({column}, id) > (?, ?)", [value, id])]
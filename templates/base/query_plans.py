@@ -0,0 +1,108 @@
+import sqlite3
+
+# Частые запросы дашборда, списков и фоновых задач.
+# Для каждого проверяется план выполнения (EXPLAIN QUERY PLAN):
+# ни один не должен читать таблицу целиком, минуя индексы.
+# Параметры нужны только для построения плана, значения не важны.
+HOT_QUERIES = {
+    'index: последние устройства': ('SELECT * FROM devices ORDER BY created_at DESC LIMIT 5', ()),
+    'index: последние активные провайдеры': ('SELECT * FROM providers WHERE status = "Активен" ORDER BY created_at DESC LIMIT 5', ()),
+    'index: ближайшие смены': ('''
+        SELECT s.*, u.username FROM shifts s JOIN users u ON s.user_id = u.id
+        WHERE s.shift_date BETWEEN ? AND ? ORDER BY s.shift_date, s.shift_type LIMIT 10
+    ''', ('2024-01-01', '2024-01-02')),
+    'devices.devices': ('''
+        SELECT * FROM devices WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', ('2024-01-01 00:00:00', 1, 51)),
+    'devices.devices: строки без даты после курсора': ('''
+        SELECT * FROM devices WHERE (created_at IS NULL AND id < ?) ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', (1, 51)),
+    'devices.devices: фильтр по типу': ('''
+        SELECT * FROM devices WHERE (type = ?) ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', ('ПК', 51)),
+    'devices.devices: сортировка по названию': ('''
+        SELECT * FROM devices WHERE (name, id) > (?, ?) ORDER BY name ASC, id ASC LIMIT ?
+    ''', ('a', 1, 51)),
+    'providers.providers': ('''
+        SELECT * FROM providers WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', ('2024-01-01 00:00:00', 1, 51)),
+    'cubes.cubes': ('''
+        SELECT * FROM software_cubes WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?
+    ''', ('2024-01-01 00:00:00', 1, 51)),
+    'guest_wifi.guest_wifi': ('''
+        SELECT * FROM guest_wifi WHERE (city, id) > (?, ?) ORDER BY city ASC, id ASC LIMIT ?
+    ''', ('Москва', 1, 51)),
+    'organizations.organizations': ('''
+        SELECT *, CASE type WHEN 'ООО' THEN 1 WHEN 'ИП' THEN 2 WHEN 'Самозанятый' THEN 3 ELSE 4 END AS sort_key_0
+        FROM organizations
+        WHERE CASE type WHEN 'ООО' THEN 1 WHEN 'ИП' THEN 2 WHEN 'Самозанятый' THEN 3 ELSE 4 END >= ?
+        AND (CASE type WHEN 'ООО' THEN 1 WHEN 'ИП' THEN 2 WHEN 'Самозанятый' THEN 3 ELSE 4 END, name, id) > (?, ?, ?)
+        ORDER BY CASE type WHEN 'ООО' THEN 1 WHEN 'ИП' THEN 2 WHEN 'Самозанятый' THEN 3 ELSE 4 END ASC, name ASC, id ASC
+        LIMIT ?
+    ''', (2, 2, 'a', 1, 51)),
+    'organizations.api_organizations': ('''
+        SELECT * FROM organizations WHERE (name, id) > (?, ?) ORDER BY name ASC, id ASC LIMIT ?
+    ''', ('a', 1, 51)),
+    'guest_wifi.guest_wifi: последние точки': ('SELECT * FROM guest_wifi ORDER BY created_at DESC LIMIT 5', ()),
+    'articles.articles_list': ('''
+        SELECT a.*, u.username as author_name FROM articles a JOIN users u ON a.author_id = u.id
+        WHERE a.is_published = 1 ORDER BY a.updated_at DESC
+    ''', ()),
+    'articles.articles_list: категории': ('SELECT DISTINCT category FROM articles ORDER BY category', ()),
+    'notes.notes_list': ('''
+        SELECT n.*, u.username as author_name FROM notes n JOIN users u ON n.author_id = u.id
+        WHERE n.author_id = ? ORDER BY n.is_pinned DESC, n.updated_at DESC
+    ''', (1,)),
+    'shifts.shifts_list': ('''
+        SELECT s.*, u.username FROM shifts s JOIN users u ON s.user_id = u.id
+        WHERE s.shift_date BETWEEN ? AND ?
+    ''', ('2024-01-01', '2024-01-31')),
+    'network_scan.network_scan': ('SELECT * FROM network_scans ORDER BY created_at DESC LIMIT 10', ()),
+    'network_scan.network_scan_results': ('SELECT * FROM network_devices WHERE scan_id = ? ORDER BY ip_address', (1,)),
+    'network_scan.network_devices': ('''
+        SELECT nd.*, ns.name as scan_name, ns.created_at as scan_date
+        FROM network_devices nd JOIN network_scans ns ON nd.scan_id = ns.id
+        ORDER BY nd.last_seen DESC
+    ''', ()),
+    'network_devices: поиск по IP': ('SELECT * FROM network_devices WHERE ip_address = ?', ('192.168.1.1',)),
+    'SocialScheduler: публикации к отправке': ('''
+        SELECT sp.* FROM scheduled_posts sp
+        WHERE sp.status = 'scheduled' AND sp.scheduled_time <= ? ORDER BY sp.scheduled_time
+    ''', ('2024-01-01 00:00:00',)),
+    'get_script_results': ('SELECT * FROM script_results WHERE script_id = ? ORDER BY executed_at DESC LIMIT ?', (1, 10)),
+    'read_roles_for_user': ('''
+        SELECT r.id, r.name, r.description, rp.permission
+        FROM roles_to_user ru JOIN roles r ON r.id = ru.role_id
+        LEFT JOIN roles_to_permissions rp ON rp.role_id = r.id
+        WHERE ru.user_id = ? ORDER BY ru.role_id
+    ''', (1,)),
+    'read_user_permissions': ('SELECT permission FROM user_effective_permissions WHERE user_id = ?', (1,)),
+    'permissions_generation': ('''
+        SELECT table_name, version, changed_at FROM table_changes WHERE table_name IN (?, ?, ?)
+    ''', ('roles', 'roles_to_user', 'roles_to_permissions')),
+}
+
+
+def explain(db:sqlite3.Connection, sql:str, params = ()):
+    """Строки плана выполнения запроса"""
+    return [row['detail'] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def is_full_scan(detail:str):
+    # "SCAN devices" - полный проход по таблице,
+    # "SCAN devices USING COVERING INDEX ..." - проход только по индексу
+    return detail.startswith('SCAN ') and 'INDEX' not in detail
+
+
+def find_full_scans(db:sqlite3.Connection, queries:dict = None):
+    """Возвращает частые запросы, план которых читает таблицу целиком"""
+    if queries is None:
+        queries = HOT_QUERIES
+
+    problems = dict()
+    for name, (sql, params) in queries.items():
+        scans = [d for d in explain(db, sql, params) if is_full_scan(d)]
+        if scans:
+            problems[name] = scans
+
+    return problems
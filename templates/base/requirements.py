@@ -1,7 +1,7 @@
 from functools import wraps
 from flask import flash, session, redirect, url_for
 
-from templates.roles.database_roles import read_roles_for_user
+from templates.roles.database_roles import read_user_permissions
 from templates.roles.permissions import Permissions, Role
 
 # Декоратор для проверки авторизации
@@ -34,8 +34,7 @@ def permission_required(p:Permissions):
         def wrapper(*args, **kwargs):
             
             print(f"Проверяем {p} для пользователя с id={session['user_id']} ({session['username']})")
-            roles:Role = read_roles_for_user(session['user_id'])
-            effective_permissions = Role.get_effective_permissions(roles)
+            effective_permissions = read_user_permissions(session['user_id'])
 
             is_granted = p in effective_permissions
 
@@ -58,8 +57,7 @@ def permissions_required_any(permissions:list[Permissions]):
         def wrapper(*args, **kwargs):
             
             print(f"Проверяем наличие хотябы одного из {permissions} для пользователя с id={session['user_id']} ({session['username']})")
-            roles:Role = read_roles_for_user(session['user_id'])
-            effective_permissions = Role.get_effective_permissions(roles)
+            effective_permissions = read_user_permissions(session['user_id'])
 
             #
             is_granted = any(p in effective_permissions for p in permissions)
@@ -82,9 +80,7 @@ def permissions_required_all(permissions:list[Permissions]):
         def wrapper(*args, **kwargs):
             
             print(f"Проверяем наличие всех разрешений из {permissions} для пользователя с id={session['user_id']} ({session['username']})")
-            roles:Role = read_roles_for_user(session['user_id'])
-
-            effective_permissions = Role.get_effective_permissions(roles)
+            effective_permissions = read_user_permissions(session['user_id'])
 
 
             is_granted = all(p in effective_permissions for p in permissions)
@@ -0,0 +1,212 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+# сколько запросов одной формы за запрос считать признаком N+1
+REPEATED_QUERY_THRESHOLD = 3
+# ключ статистики для запросов, не попавших ни в один маршрут
+UNMATCHED_ENDPOINT = '<unmatched>'
+
+_literals = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\b\d+(?:\.\d+)?\b")
+_spaces = re.compile(r"\s+")
+
+
+def query_shape(sql:str):
+    """Текст запроса без значений: одинаковые запросы с разными параметрами
+    (в том числе подставленными через f-строку) дают одну форму"""
+    shape = _literals.sub('?', sql)
+    return _spaces.sub(' ', shape).strip()
+
+
+class QueryRecord:
+    def __init__(self, sql:str):
+        self.sql = sql
+        self.shape = query_shape(sql)
+        self.duration = 0.0
+        self.rows = 0
+
+
+class TracedCursor:
+    """Курсор, учитывающий время выборки и количество прочитанных строк"""
+
+    def __init__(self, cursor, record:QueryRecord):
+        self._cursor = cursor
+        self._record = record
+
+    def _fetch(self, fetch, *args):
+        started = time.perf_counter()
+        result = fetch(*args)
+        self._record.duration += time.perf_counter() - started
+        return result
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is not None:
+            self._record.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._fetch(self._cursor.fetchmany, *args)
+        self._record.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        self._record.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TracedConnection:
+    """Обёртка над соединением, записывающая все запросы текущего запроса Flask"""
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def _record(self, sql:str):
+        record = QueryRecord(sql)
+        if has_request_context():
+            g.setdefault('_sql_queries', []).append(record)
+        return record
+
+    def _run(self, method, sql, *args):
+        record = self._record(sql)
+        started = time.perf_counter()
+        cursor = method(sql, *args)
+        record.duration += time.perf_counter() - started
+        if cursor.rowcount > 0:
+            # для INSERT/UPDATE/DELETE - количество изменённых строк
+            record.rows = cursor.rowcount
+        return TracedCursor(cursor, record)
+
+    def execute(self, sql, *args):
+        return self._run(self.raw.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._run(self.raw.executemany, sql, *args)
+
+    def executescript(self, sql):
+        return self._run(self.raw.executescript, sql)
+
+    def __enter__(self):
+        self.raw.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self.raw.__exit__(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+def wrap_connection(conn):
+    """Соединения запросов Flask оборачиваются для учёта запросов"""
+    if has_request_context():
+        return TracedConnection(conn)
+    return conn
+
+
+def unwrap_connection(conn):
+    return conn.raw if isinstance(conn, TracedConnection) else conn
+
+
+# ========== СТАТИСТИКА ПО ОБРАБОТЧИКАМ ==========
+
+_stats_lock = threading.Lock()
+_endpoint_stats = dict()
+
+
+def repeated_shapes(queries:list[QueryRecord]):
+    counts = Counter(q.shape for q in queries)
+    return {shape: count for shape, count in counts.items() if count >= REPEATED_QUERY_THRESHOLD}
+
+
+def collect_endpoint_stats(endpoint:str, queries:list[QueryRecord]):
+    total_time = sum(q.duration for q in queries)
+    repeated = repeated_shapes(queries)
+
+    with _stats_lock:
+        stats = _endpoint_stats.setdefault(endpoint, {
+            'requests': 0,
+            'queries': 0,
+            'max_queries': 0,
+            'time_ms': 0.0,
+            'max_time_ms': 0.0,
+            'rows': 0,
+            'repeated': Counter(),
+        })
+        stats['requests'] += 1
+        stats['queries'] += len(queries)
+        stats['max_queries'] = max(stats['max_queries'], len(queries))
+        stats['time_ms'] += total_time * 1000
+        stats['max_time_ms'] = max(stats['max_time_ms'], total_time * 1000)
+        stats['rows'] += sum(q.rows for q in queries)
+        for shape, count in repeated.items():
+            stats['repeated'][shape] += count
+
+
+def get_endpoint_stats():
+    """Накопленная статистика запросов к базе по обработчикам"""
+    with _stats_lock:
+        result = dict()
+        for endpoint, stats in _endpoint_stats.items():
+            result[endpoint] = {
+                'requests': stats['requests'],
+                'avg_queries': round(stats['queries'] / stats['requests'], 2),
+                'max_queries': stats['max_queries'],
+                'avg_time_ms': round(stats['time_ms'] / stats['requests'], 3),
+                'max_time_ms': round(stats['max_time_ms'], 3),
+                'avg_rows': round(stats['rows'] / stats['requests'], 2),
+                'repeated': dict(stats['repeated'].most_common(10)),
+            }
+        return result
+
+
+def reset_endpoint_stats():
+    with _stats_lock:
+        _endpoint_stats.clear()
+
+
+def after_request(response):
+    queries = g.pop('_sql_queries', [])
+    # все адреса без маршрута - под одним ключом, иначе каждый несуществующий
+    # путь добавлял бы новую запись в статистику, которая не очищается
+    endpoint = request.endpoint or UNMATCHED_ENDPOINT
+
+    repeated = repeated_shapes(queries)
+    for shape, count in repeated.items():
+        logger.warning(f"Возможный N+1 в {endpoint}: {count} запросов вида \"{shape}\"")
+
+    collect_endpoint_stats(endpoint, queries)
+
+    # в режиме отладки - подробности прямо в заголовках ответа
+    if current_app.debug:
+        total_time = sum(q.duration for q in queries)
+        response.headers['X-SQL-Queries'] = str(len(queries))
+        response.headers['X-SQL-Time-Ms'] = f"{total_time * 1000:.3f}"
+        response.headers['X-SQL-Rows'] = str(sum(q.rows for q in queries))
+        if repeated:
+            header = '; '.join(f"{count}x {shape[:120]}" for shape, count in repeated.items())
+            # заголовки ответа допускают только latin-1
+            response.headers['X-SQL-Repeated'] = header.encode('ascii', 'backslashreplace').decode('ascii')
+
+    return response
+
+
+def init_app(app):
+    app.after_request(after_request)
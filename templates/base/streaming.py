@@ -0,0 +1,50 @@
+import sqlite3
+
+from flask import Response, stream_template
+
+# Потоковый вывод больших страниц.
+#
+# Шаблон рендерится по мере чтения строк из курсора: начало страницы
+# уходит браузеру сразу, строки таблицы читаются порциями по
+# STREAM_CHUNK_SIZE, так что в памяти держится одна порция, а не вся
+# таблица. Шаблон получает строки генератором, поэтому не может считать
+# их через |length - количества и прочие итоги передаются отдельно.
+
+STREAM_CHUNK_SIZE = 500
+
+# сколько байт HTML накапливать перед отправкой, чтобы не отдавать
+# ответ тысячами мелких кусков
+STREAM_BUFFER_SIZE = 16 * 1024
+
+
+def iterate_rows(cursor:sqlite3.Cursor, convert=None, chunk_size:int = STREAM_CHUNK_SIZE):
+    """Строки курсора порциями по chunk_size, convert - преобразование строки"""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row in rows:
+            yield convert(row) if convert else row
+
+
+def _buffered(chunks, size:int):
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def render_streamed(template_name:str, **context):
+    """Аналог render_template, отдающий страницу по частям.
+
+    Контекст запроса и соединение с базой живут, пока ответ не отдан целиком
+    """
+    chunks = stream_template(template_name, **context)
+    return Response(_buffered(chunks, STREAM_BUFFER_SIZE), mimetype='text/html')
@@ -1,6 +1,9 @@
 from flask import render_template, request, redirect, url_for, flash, session, Blueprint
 
 from templates.base.database import get_db
+from templates.base.database_helper import readonly_db
+from templates.base.data_api import Entity, entity_filters, filters_where, query_entity_page, register_data_api
+from templates.base.dashboard_stats import read_dashboard_stats, stats_count, stats_total
 from templates.base.requirements import permission_required, permissions_required_all, permissions_required_any
 from templates.roles.permissions import Permissions
 
@@ -14,11 +17,62 @@ def get_cubes():
     ''').fetchall()
     return cubes_list
 
+CUBES = Entity(
+    name='cubes',
+    table='software_cubes',
+    permission=Permissions.cubes_read,
+    fields=['id', 'name', 'software_type', 'license_type', 'license_key', 'contract_number', 'contract_date', 'price',
+            'users_count', 'support_contact', 'phone', 'email', 'object_location', 'city', 'status', 'renewal_date',
+            'notes', 'created_at'],
+    filters={
+        'name': ('eq', 'like'),
+        'software_type': ('eq', 'in'),
+        'license_type': ('eq', 'in'),
+        'contract_number': ('eq', 'like'),
+        'object_location': ('eq', 'like'),
+        'city': ('eq', 'like', 'in'),
+        'status': ('eq', 'in'),
+        'price': ('gte', 'lte'),
+        'renewal_date': ('gte', 'lte'),
+        'created_at': ('gte', 'lte'),
+    },
+    sort_columns=['created_at', 'name', 'software_type', 'city', 'status'],
+    default_sort='created_at',
+    search_fields=['name', 'license_key', 'contract_number', 'object_location', 'support_contact'],
+    numeric_fields=['price'],
+)
+register_data_api(bluprint_cubes_routes, CUBES)
+
+# итоги под списком: без фильтров - из сводной статистики, а при поиске
+# и фильтрах - запросом с теми же условиями, что и у списка
+def cubes_summary(filters:list = None):
+    if not filters:
+        stats = read_dashboard_stats(get_db())
+        return {
+            'total': stats_count(stats, 'software_cubes'),
+            'active': stats_count(stats, 'active_software_cubes'),
+            'total_price': stats_total(stats, 'software_cubes'),
+        }
+
+    where, params = filters_where(filters)
+    totals = get_db().execute(f'''
+        SELECT COUNT(*) AS total,
+               COUNT(CASE WHEN status = 'Активен' THEN 1 END) AS active,
+               IFNULL(SUM(price), 0) AS total_price
+        FROM software_cubes {where}
+    ''', params).fetchone()
+    return {
+        'total': totals['total'],
+        'active': totals['active'],
+        'total_price': totals['total_price'],
+    }
+
 @bluprint_cubes_routes.route('/cubes')
 @permission_required(Permissions.cubes_read)
+@readonly_db
 def cubes():
-    cubes_list = get_cubes()
-    return render_template('cubes/cubes.html', cubes=cubes_list)
+    page = query_entity_page(CUBES, request.args)
+    return render_template('cubes/cubes.html', cubes=page.rows, page=page, summary=cubes_summary(entity_filters(CUBES, request.args)))
 
 @bluprint_cubes_routes.route('/add_cube', methods=['GET', 'POST'])
 @permission_required(Permissions.cubes_manage)
@@ -129,14 +183,9 @@ def delete_cube(cube_id):
 
 @bluprint_cubes_routes.route('/cube_search')
 @permission_required(Permissions.cubes_read)
+@readonly_db
 def cube_search():
     query = request.args.get('q', '')
-    db = get_db()
-    
-    cubes_list = db.execute('''
-        SELECT * FROM software_cubes 
-        WHERE name LIKE ? OR license_key LIKE ? OR contract_number LIKE ? OR object_location LIKE ? OR support_contact LIKE ?
-        ORDER BY created_at DESC
-    ''', (f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%')).fetchall()
-    
-    return render_template('cubes/cubes.html', cubes=cubes_list, search_query=query)
+    page = query_entity_page(CUBES, request.args)
+    return render_template('cubes/cubes.html', cubes=page.rows, page=page, summary=cubes_summary(entity_filters(CUBES, request.args)),
+                           search_query=query)
@@ -1,20 +1,59 @@
 from flask import render_template, request, redirect, url_for, flash, session, Blueprint
 
 from templates.base.database import get_db
+from templates.base.database_helper import readonly_db
+from templates.base.dashboard_stats import read_dashboard_stats
+from templates.base.pagination import keyset_page, page_size
 from templates.base.requirements import permission_required, permissions_required_all, permissions_required_any
 from templates.roles.permissions import Permissions
 
 bluprint_devices_routes = Blueprint("devices", __name__)
 
+# сортировки списка устройств: параметр sort -> столбец с индексом
+DEVICE_SORT_COLUMNS = {
+    'created_at': 'created_at',
+    'name': 'name',
+    'type': 'type',
+    'location': 'location',
+    'status': 'status',
+}
+
+# фильтры списка по точному значению столбца (имя параметра = имя столбца)
+DEVICE_FILTERS = ['type', 'status', 'location']
+
+def render_devices_page(filters:list, search_query = None):
+    db = get_db()
+
+    selected = dict()
+    for name in DEVICE_FILTERS:
+        value = request.args.get(name, '').strip()
+        if value:
+            selected[name] = value
+            filters.append((f"{name} = ?", [value]))
+
+    page = keyset_page(
+        db, 'devices', DEVICE_SORT_COLUMNS,
+        sort=request.args.get('sort', 'created_at'),
+        order=request.args.get('order', 'desc'),
+        cursor=request.args.get('cursor'),
+        size=page_size(request.args.get('per_page')),
+        filters=filters,
+    )
+
+    # варианты фильтров - из сводной статистики, без прохода по таблице
+    stats = read_dashboard_stats(db)
+    device_types = sorted(r['key'] for r in stats['devices_by_type'])
+    device_statuses = sorted(r['key'] for r in stats['devices_by_status'])
+
+    return render_template('devices/devices.html', devices=page.rows, page=page,
+                           filters=selected, search_query=search_query,
+                           device_types=device_types, device_statuses=device_statuses)
+
 @bluprint_devices_routes.route('/devices')
 @permission_required(Permissions.devices_read)
+@readonly_db
 def devices():
-    db = get_db()
-    devices = db.execute('''
-        SELECT * FROM devices 
-        ORDER BY created_at DESC
-    ''').fetchall()
-    return render_template('devices/devices.html', devices=devices)
+    return render_devices_page([])
 
 @bluprint_devices_routes.route('/add_device', methods=['GET', 'POST'])
 @permission_required(Permissions.devices_manage)
@@ -95,14 +134,12 @@ def delete_device(device_id):
 
 @bluprint_devices_routes.route('/search')
 @permission_required(Permissions.devices_read)
+@readonly_db
 def search():
     query = request.args.get('q', '')
-    db = get_db()
-    
-    devices = db.execute('''
-        SELECT * FROM devices 
-        WHERE name LIKE ? OR model LIKE ? OR serial_number LIKE ? OR assigned_to LIKE ?
-        ORDER BY created_at DESC
-    ''', (f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%')).fetchall()
-    
-    return render_template('devices/devices.html', devices=devices, search_query=query)
\ No newline at end of file
+
+    filters = [(
+        "name LIKE ? OR model LIKE ? OR serial_number LIKE ? OR assigned_to LIKE ?",
+        [f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%']
+    )]
+    return render_devices_page(filters, search_query=query)
\ No newline at end of file
@@ -2,27 +2,65 @@ from flask import render_template, request, redirect, url_for, flash, session, B
 from datetime import datetime
 
 from templates.base.database import get_db
+from templates.base.database_helper import readonly_db
+from templates.base.data_api import Entity, entity_filters, filters_where, query_entity_page, register_data_api
 from templates.base.requirements import permission_required, permissions_required_all, permissions_required_any
 from templates.roles.permissions import Permissions
 
-from templates.guest_wifi.wifi_utils import download_wifi_template, import_guest_wifi_from_excel, export_guest_wifi_to_excel
+from templates.guest_wifi.wifi_utils import download_wifi_template, import_guest_wifi_from_excel, export_guest_wifi_to_excel, validate_guest_wifi_excel
+from import_validation import dry_run_message, generate_errors_filename
+from excel_utils import XLSX_MIMETYPE
 
 bluprint_guest_wifi_routes = Blueprint("guest_wifi", __name__)
 
+GUEST_WIFI = Entity(
+    name='guest_wifi',
+    table='guest_wifi',
+    permission=Permissions.guest_wifi_read,
+    fields=['id', 'city', 'price', 'organization', 'status', 'ssid', 'password', 'ip_range', 'speed',
+            'contract_number', 'contract_date', 'contact_person', 'phone', 'email', 'installation_date',
+            'renewal_date', 'notes', 'created_at', 'updated_at'],
+    filters={
+        'city': ('eq', 'like', 'in'),
+        'organization': ('eq', 'like'),
+        'status': ('eq', 'in'),
+        'ssid': ('eq', 'like'),
+        'price': ('gte', 'lte'),
+        'renewal_date': ('gte', 'lte'),
+        'created_at': ('gte', 'lte'),
+    },
+    sort_columns=['city', 'created_at'],
+    default_sort='city',
+    default_order='asc',
+    search_fields=['city', 'organization', 'ssid', 'contact_person'],
+    numeric_fields=['price'],
+)
+register_data_api(bluprint_guest_wifi_routes, GUEST_WIFI)
 
 
-@bluprint_guest_wifi_routes.route('/guest_wifi')
-@permission_required(Permissions.guest_wifi_read)
-def guest_wifi():
-    db = get_db()
-    wifi_stats = db.execute('''
+
+# итоги по точкам с теми же фильтрами и поиском, что и у списка:
+# сам список на странице показывается частями
+def read_wifi_stats(db, filters:list = None):
+    where, params = filters_where(filters)
+    return db.execute(f'''
     SELECT 
         COUNT(*) as total_count,
         SUM(CASE WHEN status = "Активен" THEN 1 ELSE 0 END) as active_count,
+        SUM(CASE WHEN status = "Неактивен" THEN 1 ELSE 0 END) as inactive_count,
         SUM(CASE WHEN status = "Активен" THEN price ELSE 0 END) as total_price,
+        SUM(price) as all_price,
         COUNT(DISTINCT city) as cities_count
     FROM guest_wifi
-''').fetchone()
+    {where}
+''', params).fetchone()
+
+@bluprint_guest_wifi_routes.route('/guest_wifi')
+@permission_required(Permissions.guest_wifi_read)
+@readonly_db
+def guest_wifi():
+    db = get_db()
+    wifi_stats = read_wifi_stats(db, entity_filters(GUEST_WIFI, request.args))
 
     total_wifi_count = wifi_stats['total_count'] or 0
     active_wifi_count = wifi_stats['active_count'] or 0
@@ -45,10 +83,7 @@ def guest_wifi():
         ORDER BY total_price DESC
     ''').fetchall()    
 
-    wifi_list = db.execute('''
-        SELECT * FROM guest_wifi 
-        ORDER BY city, organization
-    ''').fetchall()
+    page = query_entity_page(GUEST_WIFI, request.args)
 
     return render_template('guest_wifi/guest_wifi.html',
                          total_wifi_count=total_wifi_count,
@@ -57,7 +92,9 @@ def guest_wifi():
                          wifi_cities_count=wifi_cities_count,
                          recent_wifi=recent_wifi,
                          wifi_by_city=wifi_by_city,
-                         wifi_list=wifi_list) 
+                         wifi_list=page.rows,
+                         wifi_stats=wifi_stats,
+                         page=page) 
 
 @bluprint_guest_wifi_routes.route('/add_guest_wifi', methods=['GET', 'POST'])
 @permission_required(Permissions.guest_wifi_manage)
@@ -177,17 +214,13 @@ def delete_guest_wifi(wifi_id):
 # Добавим также поиск для гостевого WiFi
 @bluprint_guest_wifi_routes.route('/guest_wifi_search')
 @permission_required(Permissions.guest_wifi_read)
+@readonly_db
 def guest_wifi_search():
     query = request.args.get('q', '')
-    db = get_db()
-    
-    wifi_list = db.execute('''
-        SELECT * FROM guest_wifi 
-        WHERE city LIKE ? OR organization LIKE ? OR ssid LIKE ? OR contact_person LIKE ?
-        ORDER BY city, organization
-    ''', (f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%')).fetchall()
-    
-    return render_template('guest_wifi/guest_wifi.html', wifi_list=wifi_list, search_query=query)
+    page = query_entity_page(GUEST_WIFI, request.args)
+    return render_template('guest_wifi/guest_wifi.html', wifi_list=page.rows, page=page,
+                           wifi_stats=read_wifi_stats(get_db(), entity_filters(GUEST_WIFI, request.args)),
+                           search_query=query)
 
 # ========== МАРШРУТЫ ДЛЯ ЭКСПОРТА/ИМПОРТА ГОСТЕВОГО WIFI ==========
 
@@ -229,6 +262,15 @@ def import_guest_wifi():
             return redirect(request.url)
         
         try:
+            # только проверка: база не меняется, ошибки возвращаются книгой Excel
+            if request.form.get('dry_run'):
+                rows_checked, errors, workbook = validate_guest_wifi_excel(file)
+                if not errors:
+                    flash(dry_run_message(rows_checked, errors), 'success')
+                    return redirect(request.url)
+                return send_file(workbook, download_name=generate_errors_filename('guest_wifi'),
+                                 as_attachment=True, mimetype=XLSX_MIMETYPE)
+            
             success, message = import_guest_wifi_from_excel(file)
             
             if success:
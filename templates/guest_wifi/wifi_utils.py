@@ -2,8 +2,32 @@ import pandas as pd
 import io
 from datetime import datetime
 from templates.base.database import get_db
+from excel_utils import import_frame, import_result_message, read_excel_file
+from import_validation import error_workbook, validate_import_frame
 from flask import send_file
 
+# заголовки файла импорта (русские -> столбцы таблицы)
+WIFI_IMPORT_COLUMNS = {
+    'Город': 'city',
+    'Стоимость': 'price',
+    'Организация': 'organization',
+    'Статус': 'status',
+    'SSID': 'ssid',
+    'Пароль': 'password',
+    'IP диапазон': 'ip_range',
+    'Скорость': 'speed',
+    'Номер договора': 'contract_number',
+    'Дата договора': 'contract_date',
+    'Контактное лицо': 'contact_person',
+    'Телефон': 'phone',
+    'Email': 'email',
+    'Дата установки': 'installation_date',
+    'Дата продления': 'renewal_date',
+    'Примечания': 'notes'
+}
+
+WIFI_REQUIRED_COLUMNS = ['city']
+
 def export_guest_wifi_to_excel():
     """Экспорт данных гостевого WiFi в Excel"""
     db = get_db()
@@ -95,91 +119,25 @@ def import_guest_wifi_from_excel(file):
     
     try:
         # Читаем Excel файл
-        df = pd.read_excel(file)
-        
-        # Сопоставляем названия колонок (русские -> английские)
-        column_mapping = {
-            'Город': 'city',
-            'Стоимость': 'price', 
-            'Организация': 'organization',
-            'Статус': 'status',
-            'SSID': 'ssid',
-            'Пароль': 'password',
-            'IP диапазон': 'ip_range',
-            'Скорость': 'speed',
-            'Номер договора': 'contract_number',
-            'Дата договора': 'contract_date',
-            'Контактное лицо': 'contact_person',
-            'Телефон': 'phone',
-            'Email': 'email',
-            'Дата установки': 'installation_date',
-            'Дата продления': 'renewal_date',
-            'Примечания': 'notes'
-        }
+        df = read_excel_file(file)
         
         # Переименовываем колонки
-        df = df.rename(columns=column_mapping)
-        
-        # Оставляем только нужные колонки
-        available_columns = [col for col in column_mapping.values() if col in df.columns]
-        df = df[available_columns]
+        df = df.rename(columns=WIFI_IMPORT_COLUMNS)
         
-        # Обрабатываем данные перед вставкой
-        imported_count = 0
-        errors = []
-        
-        for index, row in df.iterrows():
-            try:
-                # Подготавливаем данные
-                row_data = {}
-                for col in available_columns:
-                    value = row[col]
-                    
-                    # Обрабатываем специальные случаи
-                    if pd.isna(value):
-                        value = None
-                    elif col == 'price' and value is not None:
-                        try:
-                            value = float(value)
-                        except (ValueError, TypeError):
-                            value = 0.0
-                    elif isinstance(value, (int, float)) and pd.notna(value):
-                        # Для числовых полей, которые должны быть строками
-                        if col in ['contract_number', 'phone']:
-                            value = str(int(value)) if not pd.isna(value) else None
-                    
-                    row_data[col] = value
-                
-                # Проверяем обязательные поля
-                if not row_data.get('city'):
-                    errors.append(f"Строка {index + 2}: Отсутствует город")
-                    continue
-                
-                # Вставляем данные
-                columns = ', '.join(row_data.keys())
-                placeholders = ', '.join(['?' for _ in row_data])
-                
-                db.execute(
-                    f"INSERT INTO guest_wifi ({columns}) VALUES ({placeholders})",
-                    list(row_data.values())
-                )
-                imported_count += 1
-                
-            except Exception as e:
-                errors.append(f"Строка {index + 2}: {str(e)}")
-                continue
-        
-        db.commit()
-        
-        if errors:
-            return False, f"Успешно импортировано {imported_count} записей. Ошибки: {'; '.join(errors)}"
-        else:
-            return True, f"Успешно импортировано {imported_count} записей"
+        # Приводим типы столбцов и загружаем одной транзакцией
+        imported_count, errors = import_frame(db, 'guest_wifi', df, required_columns=WIFI_REQUIRED_COLUMNS)
+        return import_result_message(imported_count, errors)
         
     except Exception as e:
-        db.rollback()
         return False, f"Ошибка при импорте файла: {str(e)}"
 
+def validate_guest_wifi_excel(file):
+    """Проверка файла без записи в базу: (строк проверено, ошибки, книга с ошибками или None)"""
+    df = read_excel_file(file)
+    renamed = df.rename(columns=WIFI_IMPORT_COLUMNS)
+    errors = validate_import_frame(get_db(), 'guest_wifi', renamed, required_columns=WIFI_REQUIRED_COLUMNS)
+    return len(df), errors, error_workbook(renamed, errors, headers=df.columns) if errors else None
+
 def create_wifi_template():
     """Создает шаблон Excel файла для импорта гостевого WiFi"""
     
@@ -1,6 +1,7 @@
 from flask import render_template, request, redirect, url_for, flash, session, Blueprint
 
 from templates.base.database import get_db
+from templates.base.database_helper import readonly_db
 from templates.base.requirements import permission_required, permissions_required_all, permissions_required_any
 from templates.roles.permissions import Permissions
 
@@ -26,6 +27,7 @@ bluprint_articles_routes = Blueprint("articles", __name__)
 
 @bluprint_articles_routes.route('/articles_list')
 @permission_required(Permissions.articles_read)
+@readonly_db
 def articles_list():
     db = get_db()
     articles = db.execute('''
@@ -0,0 +1,163 @@
+import re
+import sqlite3
+
+from flask import Blueprint, jsonify, request, session, url_for
+from markupsafe import escape
+
+from templates.base.database import get_db
+from templates.base.database_helper import readonly_db
+from templates.base.requirements import login_required
+from templates.roles.database_roles import read_user_permissions
+from templates.roles.permissions import Permissions
+
+# Полнотекстовый поиск по базе знаний (FTS5).
+#
+# articles_fts и notes_fts - индексы с внешним содержимым: текст хранится
+# только в самих таблицах, индекс обновляется триггерами. Результаты
+# упорядочены по bm25, совпадение в заголовке весит больше, чем в тексте.
+
+bluprint_knowledge_search_routes = Blueprint("knowledge_search", __name__)
+
+SEARCH_LIMIT = 20
+
+# веса столбцов для bm25: title, content, tags, category
+ARTICLES_WEIGHTS = (10.0, 1.0, 5.0, 2.0)
+# title, content
+NOTES_WEIGHTS = (10.0, 1.0)
+
+# служебные символы для выделения совпадений во фрагменте: текст фрагмента
+# экранируется целиком, а затем они заменяются на теги
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+
+_words = re.compile(r'\w+', re.UNICODE)
+
+
+def create_knowledge_fts(db:sqlite3.Connection):
+    db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+            title, content, tags, category,
+            content='articles', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            title, content,
+            content='notes', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+
+    # для внешнего содержимого из индекса удаляются старые значения строки;
+    # по одному запросу, executescript закоммитил бы транзакцию миграции
+    for table, columns in (('articles', ('title', 'content', 'tags', 'category')), ('notes', ('title', 'content'))):
+        names = ', '.join(columns)
+        new_values = ', '.join(f"NEW.{c}" for c in columns)
+        old_values = ', '.join(f"OLD.{c}" for c in columns)
+
+        for event in ('insert', 'update', 'delete'):
+            db.execute(f"DROP TRIGGER IF EXISTS trg_{table}_fts_{event}")
+
+        db.execute(f'''
+            CREATE TRIGGER trg_{table}_fts_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {table}_fts (rowid, {names}) VALUES (NEW.id, {new_values});
+            END
+        ''')
+        db.execute(f'''
+            CREATE TRIGGER trg_{table}_fts_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {names}) VALUES ('delete', OLD.id, {old_values});
+            END
+        ''')
+        db.execute(f'''
+            CREATE TRIGGER trg_{table}_fts_update AFTER UPDATE OF {names} ON {table} BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, {names}) VALUES ('delete', OLD.id, {old_values});
+                INSERT INTO {table}_fts (rowid, {names}) VALUES (NEW.id, {new_values});
+            END
+        ''')
+
+
+def rebuild_knowledge_fts(db:sqlite3.Connection):
+    db.execute("INSERT INTO articles_fts (articles_fts) VALUES ('rebuild')")
+    db.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+
+
+def fts_query(text:str):
+    """Запрос пользователя в синтаксисе FTS5: каждое слово - префикс,
+    все слова обязательны. Операторы и кавычки из ввода не используются."""
+    words = _words.findall(text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{w}"*' for w in words)
+
+
+def render_snippet(snippet:str):
+    html = str(escape(snippet or ''))
+    return html.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def search_articles(db:sqlite3.Connection, query:str, limit:int = SEARCH_LIMIT):
+    weights = ', '.join(str(w) for w in ARTICLES_WEIGHTS)
+    rows = db.execute(f'''
+        SELECT a.id, a.title, a.category, a.updated_at,
+               snippet(articles_fts, 1, ?, ?, '…', 16) as snippet,
+               bm25(articles_fts, {weights}) as rank
+        FROM articles_fts
+        JOIN articles a ON a.id = articles_fts.rowid
+        WHERE articles_fts MATCH ? AND a.is_published = 1
+        ORDER BY rank
+        LIMIT ?
+    ''', (MARK_START, MARK_END, query, limit)).fetchall()
+
+    return [{
+        'id': r['id'],
+        'title': r['title'],
+        'category': r['category'],
+        'updated_at': r['updated_at'],
+        'snippet': render_snippet(r['snippet']),
+        'url': url_for('articles.view_article', article_id=r['id']),
+    } for r in rows]
+
+
+def search_notes(db:sqlite3.Connection, query:str, author_id:int, limit:int = SEARCH_LIMIT):
+    weights = ', '.join(str(w) for w in NOTES_WEIGHTS)
+    rows = db.execute(f'''
+        SELECT n.id, n.title, n.updated_at,
+               snippet(notes_fts, 1, ?, ?, '…', 16) as snippet,
+               bm25(notes_fts, {weights}) as rank
+        FROM notes_fts
+        JOIN notes n ON n.id = notes_fts.rowid
+        WHERE notes_fts MATCH ? AND n.author_id = ?
+        ORDER BY rank
+        LIMIT ?
+    ''', (MARK_START, MARK_END, query, author_id, limit)).fetchall()
+
+    return [{
+        'id': r['id'],
+        'title': r['title'],
+        'updated_at': r['updated_at'],
+        'snippet': render_snippet(r['snippet']),
+        'url': url_for('notes.edit_note', note_id=r['id']),
+    } for r in rows]
+
+
+# поиск по статьям и своим заметкам, в выдаче только разделы,
+# которые пользователю разрешено читать
+@bluprint_knowledge_search_routes.route('/knowledge/search')
+@login_required
+@readonly_db
+def search():
+    query = fts_query(request.args.get('q', ''))
+    result = {'articles': [], 'notes': []}
+    if query is None:
+        return jsonify(result)
+
+    db = get_db()
+    user_permissions = read_user_permissions(session['user_id'])
+
+    if Permissions.articles_read in user_permissions or Permissions.articles_manage in user_permissions:
+        result['articles'] = search_articles(db, query)
+    if Permissions.notes_read in user_permissions or Permissions.notes_manage in user_permissions:
+        result['notes'] = search_notes(db, query, session['user_id'])
+
+    return jsonify(result)
@@ -7,9 +7,11 @@ import time
 from datetime import datetime
 import json
 
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, current_app, flash, redirect, render_template, request, url_for
 
 from templates.base.database import get_db
+from templates.base.streaming import iterate_rows, render_streamed
+from templates.network_scan.ping_engine import PING_TIMEOUT, lookup_hostnames, ping_hosts
 from templates.base.requirements import permission_required, permissions_required_all, permissions_required_any
 from templates.roles.permissions import Permissions
 
@@ -69,7 +71,7 @@ def start_network_scan():
         import threading
         scan_thread = threading.Thread(
             target=run_network_scan_background,
-            args=(scan_id, scan_type, target_range)
+            args=(current_app._get_current_object(), scan_id, scan_type, target_range)
         )
         scan_thread.daemon = True
         scan_thread.start()
@@ -81,8 +83,10 @@ def start_network_scan():
     
     return redirect(url_for('network_scan.network_scan'))
 
-def run_network_scan_background(scan_id, scan_type, target_range):
+def run_network_scan_background(app, scan_id, scan_type, target_range):
     """Фоновая задача сканирования сети"""
+    # свой контекст приложения - своё соединение из пула,
+    # которое вернётся в пул по завершении сканирования
     with app.app_context():
         db = get_db()
         try:
@@ -171,35 +175,39 @@ def stop_network_scan():
     flash('Сканирование остановлено', 'info')
     return redirect(url_for('network_scan'))
 
+def device_with_ports(device):
+    """Строка устройства со списком портов вместо JSON"""
+    device_dict = dict(device)
+    if device_dict['ports']:
+        try:
+            device_dict['ports'] = json.loads(device_dict['ports'])
+        except:
+            device_dict['ports'] = []
+    return device_dict
+
 @bluprint_network_scan_routes.route('/network_devices')
 
 def network_devices():
     """Список всех обнаруженных устройств"""
     db = get_db()
     
-    devices = db.execute('''
+    # Статистика для шаблона считается запросом, сами устройства
+    # отдаются потоком по мере чтения из базы
+    stats = db.execute('''
+        SELECT COUNT(*) as devices_count,
+               SUM(CASE WHEN nd.response_time > 0 THEN 1 ELSE 0 END) as online_count,
+               SUM(CASE WHEN nd.ports IS NOT NULL AND nd.ports NOT IN ('', '[]') THEN 1 ELSE 0 END) as with_ports_count,
+               COUNT(DISTINCT CASE WHEN nd.vendor != 'Unknown' THEN nd.vendor END) as vendors_count
+        FROM network_devices nd
+        JOIN network_scans ns ON nd.scan_id = ns.id
+    ''').fetchone()
+    
+    cursor = db.execute('''
         SELECT nd.*, ns.name as scan_name, ns.created_at as scan_date
         FROM network_devices nd
         JOIN network_scans ns ON nd.scan_id = ns.id
         ORDER BY nd.last_seen DESC
-    ''').fetchall()
-    
-    # Обрабатываем порты
-    processed_devices = []
-    for device in devices:
-        device_dict = dict(device)
-        if device_dict['ports']:
-            try:
-                device_dict['ports'] = json.loads(device_dict['ports'])
-            except:
-                device_dict['ports'] = []
-        processed_devices.append(device_dict)
-    
-    # Получаем статистику для шаблона
-    vendors = set()
-    for device in devices:
-        if device['vendor'] != 'Unknown':
-            vendors.add(device['vendor'])
+    ''')
     
     # Получаем количество сканирований
     scans_count = db.execute('SELECT COUNT(*) as count FROM network_scans').fetchone()['count']
@@ -208,9 +216,12 @@ def network_devices():
     last_scan = db.execute('SELECT created_at FROM network_scans ORDER BY created_at DESC LIMIT 1').fetchone()
     last_scan_date = last_scan['created_at'][:10] if last_scan else 'Нет данных'
     
-    return render_template('network_scan/devices_list.html', 
-                         devices=processed_devices,
-                         vendors_count=len(vendors),
+    return render_streamed('network_scan/devices_list.html', 
+                         devices=iterate_rows(cursor, device_with_ports),
+                         devices_count=stats['devices_count'],
+                         online_count=stats['online_count'] or 0,
+                         with_ports_count=stats['with_ports_count'] or 0,
+                         vendors_count=stats['vendors_count'],
                          scans_count=scans_count,
                          last_scan_date=last_scan_date)
 
@@ -339,13 +350,37 @@ def utility_processor():
     return dict(get_port_service=get_port_service)
 
 # Улучшенный NetworkScanner с исправлениями
+def cidr_hosts(cidr_range):
+    """Адреса узлов сети CIDR"""
+    network = ipaddress.ip_network(cidr_range, strict=False)
+    if network.num_addresses <= 2:
+        # в /31 и /32 узлами считаются все адреса
+        return [str(host) for host in network]
+    return [str(host) for host in network.hosts()]
+
+def range_hosts(range_str):
+    """Адреса диапазона вида 192.168.1.1-100"""
+    base_ip, range_part = range_str.split('-')
+    ip_parts = base_ip.split('.')
+
+    if len(ip_parts) != 4:
+        raise ValueError("Invalid IP format")
+
+    start_ip = int(ip_parts[3])
+    end_ip = int(range_part)
+
+    if start_ip > end_ip:
+        start_ip, end_ip = end_ip, start_ip
+
+    return [f"{ip_parts[0]}.{ip_parts[1]}.{ip_parts[2]}.{i}" for i in range(start_ip, end_ip + 1)]
+
 class NetworkScanner:
     def __init__(self):
         self.active_devices = []
         self.scan_progress = 0
         self.is_scanning = False
         
-    def ping_sweep(self, network_range, timeout=2):
+    def ping_sweep(self, network_range, timeout=PING_TIMEOUT):
         """
         Улучшенное ping сканирование сети
         """
@@ -369,115 +404,45 @@ class NetworkScanner:
         
         return devices
 
-    def ping_cidr_format(self, cidr_range, timeout=2):
+    def ping_cidr_format(self, cidr_range, timeout=PING_TIMEOUT):
         """Сканирование в формате CIDR"""
-        devices = []
         try:
-            network = ipaddress.ip_network(cidr_range, strict=False)
-            hosts = list(network.hosts())
-            total_hosts = len(hosts)
-            
-            if total_hosts == 0:  # Для /31 и /32 сетей
-                hosts = [network.network_address, network.broadcast_address]
-                total_hosts = len([h for h in hosts if h is not None])
-            
-            scanned_hosts = 0
-            
-            for host in hosts:
-                if not self.is_scanning:
-                    break
-                    
-                if host is None:
-                    continue
-                    
-                ip = str(host)
-                if self.ping_host(ip, timeout):
-                    device_info = self.get_device_info(ip)
-                    devices.append(device_info)
-                
-                scanned_hosts += 1
-                self.scan_progress = (scanned_hosts / total_hosts) * 100
-                
+            return self.ping_addresses(cidr_hosts(cidr_range), timeout)
         except Exception as e:
             print(f"Error in CIDR scan: {e}")
-            
-        return devices
+            return []
 
-    def ping_range_format(self, range_str, timeout=2):
+    def ping_range_format(self, range_str, timeout=PING_TIMEOUT):
         """Сканирование в формате диапазона IP-адресов"""
-        devices = []
-        
         try:
-            # Формат: 192.168.1.1-100
-            base_ip, range_part = range_str.split('-')
-            ip_parts = base_ip.split('.')
-            
-            if len(ip_parts) != 4:
-                raise ValueError("Invalid IP format")
-            
-            start_ip = int(ip_parts[3])
-            end_ip = int(range_part)
-            
-            if start_ip > end_ip:
-                start_ip, end_ip = end_ip, start_ip
-            
-            total_ips = end_ip - start_ip + 1
-            scanned_ips = 0
-            
-            for i in range(start_ip, end_ip + 1):
-                if not self.is_scanning:
-                    break
-                    
-                ip = f"{ip_parts[0]}.{ip_parts[1]}.{ip_parts[2]}.{i}"
-                
-                if self.ping_host(ip, timeout):
-                    device_info = self.get_device_info(ip)
-                    devices.append(device_info)
-                
-                scanned_ips += 1
-                self.scan_progress = (scanned_ips / total_ips) * 100
-                
+            return self.ping_addresses(range_hosts(range_str), timeout)
         except Exception as e:
             print(f"Error parsing range format {range_str}: {e}")
-        
-        return devices
+            return []
 
-    def ping_single_ip(self, ip, timeout=2):
+    def ping_single_ip(self, ip, timeout=PING_TIMEOUT):
         """Пинг одиночного IP"""
+        return self.ping_addresses([ip], timeout)
+
+    def ping_host(self, ip, timeout=PING_TIMEOUT):
+        """Отвечает ли узел на ping"""
+        return ip in ping_hosts([ip], timeout)
+
+    def ping_addresses(self, hosts, timeout=PING_TIMEOUT):
+        """Параллельный опрос адресов, устройства - ответившие узлы"""
+        def set_progress(done, total):
+            self.scan_progress = done * 100 / total
+
+        alive = ping_hosts(hosts, timeout, on_progress=set_progress, should_stop=lambda: not self.is_scanning)
+        hostnames = lookup_hostnames(alive)
+
         devices = []
-        if self.ping_host(ip, timeout):
-            device_info = self.get_device_info(ip)
+        for ip in sorted(alive, key=ipaddress.ip_address):
+            device_info = self.get_device_info(ip, hostnames.get(ip, 'Unknown'))
+            device_info['response_time'] = alive[ip]
             devices.append(device_info)
         return devices
 
-    def ping_host(self, ip, timeout=2):
-        """Улучшенная функция ping"""
-        try:
-            import platform
-            # Увеличиваем таймаут и количество попыток
-            if platform.system().lower() == "windows":
-                param = f"-n 2 -w {timeout * 1000}"
-            else:
-                param = f"-c 2 -W {timeout}"
-                
-            command = f"ping {param} {ip}"
-            
-            result = subprocess.run(
-                command,
-                capture_output=True,
-                text=True,
-                shell=True,
-                timeout=timeout + 1
-            )
-            
-            return result.returncode == 0
-            
-        except subprocess.TimeoutExpired:
-            return False
-        except Exception as e:
-            print(f"Ping error for {ip}: {e}")
-            return False
-
     def arp_scan(self, interface=None):
         """
         ARP сканирование локальной сети
@@ -583,13 +548,13 @@ class NetworkScanner:
         except:
             return 'Unknown'
 
-    def get_device_info(self, ip):
+    def get_device_info(self, ip, hostname=None):
         """
         Получение информации об устройстве (упрощенная версия)
         """
         return {
             'ip_address': ip,
-            'hostname': self.get_hostname(ip),
+            'hostname': hostname if hostname is not None else self.get_hostname(ip),
             'mac_address': 'Unknown',
             'vendor': 'Unknown',
             'os_info': 'Unknown',
@@ -704,127 +669,26 @@ class NetworkScanner:
 
     def ping_cidr_format(self, cidr_range, timeout=1):
         """Сканирование в формате CIDR"""
-        devices = []
-        network = ipaddress.ip_network(cidr_range, strict=False)
-        total_hosts = len(list(network.hosts()))
-        scanned_hosts = 0
-        
-        def ping_host(ip):
-            try:
-                param = "-n 1 -w {}".format(timeout * 1000) if platform.system().lower() == "windows" else "-c 1 -W {}".format(timeout)
-                command = f"ping {param} {ip}"
-                response = subprocess.run(
-                    command, 
-                    stdout=subprocess.DEVNULL, 
-                    stderr=subprocess.DEVNULL, 
-                    shell=True
-                )
-                return response.returncode == 0
-            except:
-                return False
-        
-        threads = []
-        
-        def check_host(host):
-            if ping_host(str(host)):
-                device_info = self.get_device_info(str(host))
-                devices.append(device_info)
-            
-            nonlocal scanned_hosts
-            scanned_hosts += 1
-            self.scan_progress = (scanned_hosts / total_hosts) * 100
-        
-        # Сканируем все хосты в сети
-        for host in network.hosts():
-            if not self.is_scanning:
-                break
-                
-            thread = threading.Thread(target=check_host, args=(host,))
-            threads.append(thread)
-            thread.start()
-            
-            # Ограничиваем количество одновременных потоков
-            if len(threads) >= 50:
-                for t in threads:
-                    t.join()
-                threads = []
-        
-        # Ждем завершения оставшихся потоков
-        for t in threads:
-            t.join()
-            
-        return devices
+        return self.ping_addresses(cidr_hosts(cidr_range), timeout)
 
     def ping_range_format(self, range_str, timeout=1):
         """Сканирование в формате диапазона IP-адресов"""
-        devices = []
-        
         try:
-            # Формат: 192.168.1.1-100
-            base_ip, range_part = range_str.split('-')
-            ip_parts = base_ip.split('.')
-            
-            if len(ip_parts) != 4:
-                raise ValueError("Invalid IP format")
-            
-            start_ip = int(ip_parts[3])
-            end_ip = int(range_part)
-            
-            if start_ip > end_ip:
-                start_ip, end_ip = end_ip, start_ip
-            
-            total_ips = end_ip - start_ip + 1
-            scanned_ips = 0
-            
-            def ping_host(ip):
-                try:
-                    param = "-n 1 -w {}".format(timeout * 1000) if platform.system().lower() == "windows" else "-c 1 -W {}".format(timeout)
-                    command = f"ping {param} {ip}"
-                    response = subprocess.run(
-                        command, 
-                        stdout=subprocess.DEVNULL, 
-                        stderr=subprocess.DEVNULL, 
-                        shell=True
-                    )
-                    return response.returncode == 0
-                except:
-                    return False
-            
-            threads = []
-            
-            def check_single_ip(ip):
-                if ping_host(ip):
-                    device_info = self.get_device_info(ip)
-                    devices.append(device_info)
-                
-                nonlocal scanned_ips
-                scanned_ips += 1
-                self.scan_progress = (scanned_ips / total_ips) * 100
-            
-            for i in range(start_ip, end_ip + 1):
-                if not self.is_scanning:
-                    break
-                    
-                ip = f"{ip_parts[0]}.{ip_parts[1]}.{ip_parts[2]}.{i}"
-                
-                thread = threading.Thread(target=check_single_ip, args=(ip,))
-                threads.append(thread)
-                thread.start()
-                
-                # Ограничиваем количество одновременных потоков
-                if len(threads) >= 50:
-                    for t in threads:
-                        t.join()
-                    threads = []
-            
-            # Ждем завершения оставшихся потоков
-            for t in threads:
-                t.join()
-                
+            return self.ping_addresses(range_hosts(range_str), timeout)
         except Exception as e:
             print(f"Error parsing range format {range_str}: {e}")
-        
-        return devices
+            return []
+
+    def ping_addresses(self, hosts, timeout=1):
+        """Параллельный опрос адресов, подробности собираются только по ответившим"""
+        def set_progress(done, total):
+            self.scan_progress = done * 100 / total
+
+        alive = ping_hosts(hosts, timeout, on_progress=set_progress, should_stop=lambda: not self.is_scanning)
+        # имена узлов - параллельно, время ответа уже измерено при опросе
+        hostnames = lookup_hostnames(alive)
+        return [self.get_device_info(ip, hostnames.get(ip, 'Unknown'), alive[ip])
+                for ip in sorted(alive, key=ipaddress.ip_address)]
 
     def arp_scan(self, interface=None):
         """
@@ -929,40 +793,43 @@ class NetworkScanner:
             
         return sorted(open_ports)
 
-    def get_device_info(self, ip):
+    def get_device_info(self, ip, hostname=None, response_time=None):
         """
-        Получение информации об устройстве
+        Получение информации об устройстве.
+        hostname и response_time, если уже известны, повторно не определяются
         """
         device_info = {
             'ip_address': ip,
-            'hostname': 'Unknown',
+            'hostname': hostname or 'Unknown',
             'mac_address': 'Unknown',
             'vendor': 'Unknown',
             'os_info': 'Unknown',
-            'response_time': 0,
+            'response_time': response_time or 0,
             'ports': []
         }
         
         try:
             # Получаем hostname
-            try:
-                hostname = socket.gethostbyaddr(ip)[0]
-                device_info['hostname'] = hostname
-            except:
-                pass
+            if hostname is None:
+                try:
+                    hostname = socket.gethostbyaddr(ip)[0]
+                    device_info['hostname'] = hostname
+                except:
+                    pass
             
             # Измеряем время ответа
-            start_time = time.time()
-            param = "-n 1 -w 1000" if platform.system().lower() == "windows" else "-c 1 -W 1"
-            result = subprocess.run(
-                f"ping {param} {ip}", 
-                capture_output=True, 
-                shell=True
-            )
-            end_time = time.time()
-            
-            if result.returncode == 0:
-                device_info['response_time'] = round((end_time - start_time) * 1000, 2)
+            if response_time is None:
+                start_time = time.time()
+                param = "-n 1 -w 1000" if platform.system().lower() == "windows" else "-c 1 -W 1"
+                result = subprocess.run(
+                    f"ping {param} {ip}", 
+                    capture_output=True, 
+                    shell=True
+                )
+                end_time = time.time()
+                
+                if result.returncode == 0:
+                    device_info['response_time'] = round((end_time - start_time) * 1000, 2)
             
             # Сканируем порты (только основные)
             device_info['ports'] = self.port_scan(ip, "21,22,23,80,443,3389,8080")
@@ -0,0 +1,195 @@
+import asyncio
+import itertools
+import math
+import os
+import platform
+import shutil
+import socket
+import struct
+
+# Асинхронный ping-опрос множества адресов.
+#
+# Все адреса опрашиваются в одном цикле asyncio несколькими
+# сопрограммами-обработчиками, которые по очереди берут адреса из общего
+# списка - одновременно идёт не больше concurrency проверок, каждая
+# ограничена своим таймаутом. Потоки и shell на каждый адрес не создаются.
+#
+# Если система разрешает непривилегированные ICMP-сокеты (Linux с
+# net.ipv4.ping_group_range, macOS), эхо-запрос отправляется прямо из
+# процесса. Иначе запускается системный ping через create_subprocess_exec -
+# без shell и не больше concurrency процессов одновременно.
+
+# одновременных проверок: ICMP-сокет дешёвый, процесс ping - нет
+ICMP_CONCURRENCY = int(os.environ.get('PING_ICMP_CONCURRENCY', 512))
+PROCESS_CONCURRENCY = int(os.environ.get('PING_PROCESS_CONCURRENCY', 128))
+
+PING_TIMEOUT = 1.0
+# сколько ждать процесс ping сверх его собственного таймаута
+PROCESS_GRACE = 1.0
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP_PAYLOAD = b'it-inventory-ping'
+
+_icmp_available = None
+# номера эхо-запросов: у одновременных проверок они разные
+_sequences = itertools.count(1)
+
+
+def icmp_available():
+    """Можно ли открыть ICMP-сокет без прав root"""
+    global _icmp_available
+    if _icmp_available is None:
+        try:
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP).close()
+            _icmp_available = True
+        except (OSError, AttributeError):
+            _icmp_available = False
+    return _icmp_available
+
+
+def icmp_checksum(data:bytes):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def echo_request(sequence:int):
+    # идентификатор у ICMP-сокета подставляет ядро
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, 0, sequence)
+    checksum = icmp_checksum(header + ICMP_PAYLOAD)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, 0, sequence) + ICMP_PAYLOAD
+
+
+def is_echo_reply(data:bytes, sequence:int):
+    """Эхо-ответ на запрос с номером sequence"""
+    # macOS отдаёт пакет вместе с IP-заголовком, Linux - без него
+    if data and data[0] >> 4 == 4 and len(data) > 20:
+        data = data[(data[0] & 0x0f) * 4:]
+    if len(data) < 8 or data[0] != ICMP_ECHO_REPLY:
+        return False
+    return struct.unpack('!H', data[6:8])[0] == sequence
+
+
+async def icmp_ping(ip:str, timeout:float):
+    """Время ответа в мс или None"""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+    sock.setblocking(False)
+    sequence = next(_sequences) & 0xffff
+    try:
+        start = loop.time()
+        await loop.sock_sendto(sock, echo_request(sequence), (ip, 0))
+        # на сокет могут прийти и чужие пакеты (на macOS - ответы другим
+        # узлам), поэтому учитывается только ответ от ip с нашим номером
+        while True:
+            remaining = timeout - (loop.time() - start)
+            if remaining <= 0:
+                return None
+            data, address = await asyncio.wait_for(loop.sock_recvfrom(sock, 1024), remaining)
+            if address[0] == ip and is_echo_reply(data, sequence):
+                return round((loop.time() - start) * 1000, 2)
+    except (asyncio.TimeoutError, OSError):
+        return None
+    finally:
+        sock.close()
+
+
+def ping_command(ip:str, timeout:float):
+    if platform.system().lower() == 'windows':
+        return ['ping', '-n', '1', '-w', str(int(timeout * 1000)), ip]
+    return ['ping', '-c', '1', '-W', str(max(1, math.ceil(timeout))), '-n', ip]
+
+
+async def process_ping(ip:str, timeout:float):
+    """Время ответа в мс (с учётом запуска процесса) или None"""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *ping_command(ip, timeout),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+    except OSError as e:
+        print(f"Ping error for {ip}: {e}")
+        return None
+
+    try:
+        returncode = await asyncio.wait_for(process.wait(), timeout + PROCESS_GRACE)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return None
+    if returncode != 0:
+        return None
+    return round((loop.time() - start) * 1000, 2)
+
+
+async def ping_all(hosts:list[str], timeout:float, concurrency:int, on_progress=None, should_stop=None):
+    probe = icmp_ping if icmp_available() else process_ping
+    pending = iter(hosts)
+    alive = dict()
+    done = 0
+
+    async def worker():
+        nonlocal done
+        # общий итератор: каждый адрес достанется одному обработчику
+        for ip in pending:
+            if should_stop is not None and should_stop():
+                return
+            response_time = await probe(ip, timeout)
+            if response_time is not None:
+                alive[ip] = response_time
+            done += 1
+            if on_progress is not None:
+                on_progress(done, len(hosts))
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(hosts)))))
+    return alive
+
+
+def ping_hosts(hosts, timeout:float = PING_TIMEOUT, concurrency:int = None, on_progress=None, should_stop=None):
+    """Опрос адресов hosts, возвращает {ip: время ответа в мс} для ответивших.
+
+    on_progress(проверено, всего) вызывается после каждого адреса,
+    should_stop() - проверяется перед каждым адресом, True прерывает опрос
+    """
+    hosts = [str(host) for host in hosts]
+    if not hosts:
+        return dict()
+    # без ICMP-сокетов нужен системный ping - проверяем один раз, а не на каждом адресе
+    if not icmp_available() and shutil.which(ping_command(hosts[0], timeout)[0]) is None:
+        print("Ping error: нет доступа к ICMP-сокетам и не найдена команда ping")
+        return dict()
+    if concurrency is None:
+        concurrency = ICMP_CONCURRENCY if icmp_available() else PROCESS_CONCURRENCY
+    return asyncio.run(ping_all(hosts, timeout, concurrency, on_progress, should_stop))
+
+
+async def lookup_all(ips:list[str], concurrency:int):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    names = dict()
+
+    async def lookup(ip):
+        async with semaphore:
+            try:
+                names[ip] = (await loop.getnameinfo((ip, 0), socket.NI_NAMEREQD))[0]
+            except (socket.gaierror, socket.herror, OSError):
+                pass
+
+    await asyncio.gather(*(lookup(ip) for ip in ips))
+    return names
+
+
+def lookup_hostnames(ips, concurrency:int = 32):
+    """Имена узлов по обратной зоне DNS: {ip: имя} для найденных"""
+    ips = list(ips)
+    if not ips:
+        return dict()
+    return asyncio.run(lookup_all(ips, concurrency))
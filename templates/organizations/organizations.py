@@ -1,29 +1,62 @@
 from flask import render_template, request, redirect, url_for, flash, session, Blueprint
 
 from templates.base.database import get_db
+from templates.base.database_helper import readonly_db
+from templates.base.data_api import Entity, entity_filters, filters_where, query_entity_page, register_data_api
+from templates.base.dashboard_stats import read_dashboard_stats
 from templates.base.requirements import permission_required, permissions_required_all, permissions_required_any
 from templates.roles.permissions import Permissions
 
 bluprint_organizations_routes = Blueprint("organizations", __name__)
 
+# порядок типов в списке; тем же выражением построен индекс idx_organizations_type_order
+ORGANIZATION_TYPE_ORDER = "CASE type WHEN 'ООО' THEN 1 WHEN 'ИП' THEN 2 WHEN 'Самозанятый' THEN 3 ELSE 4 END"
 
+ORGANIZATIONS = Entity(
+    name='organizations',
+    table='organizations',
+    permission=Permissions.organizations_read,
+    fields=['id', 'name', 'type', 'inn', 'contact_person', 'phone', 'email', 'address', 'notes', 'created_at'],
+    filters={
+        'name': ('eq', 'like'),
+        'type': ('eq', 'in'),
+        'inn': ('eq',),
+        'contact_person': ('like',),
+        'created_at': ('gte', 'lte'),
+    },
+    sort_columns=['name', 'type', 'created_at'],
+    # по умолчанию - ООО, ИП, самозанятые, остальные, внутри типа по названию
+    sort_expressions={'type_order': (ORGANIZATION_TYPE_ORDER, 'name')},
+    default_sort='type_order',
+    default_order='asc',
+    search_fields=['name', 'inn', 'contact_person'],
+)
+register_data_api(bluprint_organizations_routes, ORGANIZATIONS)
+
+# итоги над списком: без фильтров - из сводной статистики, а с фильтрами -
+# запросом с теми же условиями, что и у списка
+def organizations_summary(filters:list = None):
+    if not filters:
+        rows = read_dashboard_stats(get_db())['organizations_by_type']
+        by_type = {r['key']: r['count'] for r in rows}
+    else:
+        where, params = filters_where(filters)
+        rows = get_db().execute(f"SELECT type, COUNT(*) AS count FROM organizations {where} GROUP BY type",
+                                params).fetchall()
+        by_type = {r['type']: r['count'] for r in rows}
+
+    return {
+        'total': sum(by_type.values()),
+        'by_type': by_type,
+    }
 
 @bluprint_organizations_routes.route('/organizations')
 @permission_required(Permissions.organizations_read)
+@readonly_db
 def organizations():
-    db = get_db()
-    organizations_list = db.execute('''
-        SELECT * FROM organizations 
-        ORDER BY 
-            CASE type
-                WHEN 'ООО' THEN 1
-                WHEN 'ИП' THEN 2
-                WHEN 'Самозанятый' THEN 3
-                ELSE 4
-            END,
-            name
-    ''').fetchall()
-    return render_template('organizations/organizations.html', organizations=organizations_list)
+    page = query_entity_page(ORGANIZATIONS, request.args)
+    return render_template('organizations/organizations.html', organizations=page.rows, page=page,
+                           summary=organizations_summary(entity_filters(ORGANIZATIONS, request.args)))
 
 @bluprint_organizations_routes.route('/add_organization', methods=['GET', 'POST'])
 @permission_required(Permissions.organizations_manage)
@@ -1,20 +1,71 @@
 from flask import render_template, request, redirect, url_for, flash, session, Blueprint
 
 from templates.base.database import get_db
+from templates.base.database_helper import readonly_db
+from templates.base.data_api import Entity, entity_filters, filters_where, query_entity_page, register_data_api
+from templates.base.dashboard_stats import read_dashboard_stats, stats_count, stats_total
 from templates.base.requirements import permission_required, permissions_required_all, permissions_required_any
 from templates.roles.permissions import Permissions
 
 bluprint_provider_routes = Blueprint("providers", __name__)
 
+PROVIDERS = Entity(
+    name='providers',
+    table='providers',
+    permission=Permissions.providers_read,
+    fields=['id', 'name', 'service_type', 'contract_number', 'contract_date', 'ip_range', 'speed', 'price',
+            'contact_person', 'phone', 'email', 'object_location', 'city', 'status', 'notes', 'created_at'],
+    filters={
+        'name': ('eq', 'like'),
+        'service_type': ('eq', 'in'),
+        'contract_number': ('eq', 'like'),
+        'object_location': ('eq', 'like'),
+        'city': ('eq', 'like', 'in'),
+        'status': ('eq', 'in'),
+        'price': ('gte', 'lte'),
+        'created_at': ('gte', 'lte'),
+    },
+    sort_columns=['created_at', 'name', 'service_type', 'city', 'status'],
+    default_sort='created_at',
+    search_fields=['name', 'contract_number', 'object_location', 'city', 'contact_person'],
+    numeric_fields=['price'],
+)
+register_data_api(bluprint_provider_routes, PROVIDERS)
+
+# итоги под списком: без фильтров - из сводной статистики, а при поиске
+# и фильтрах - запросом с теми же условиями, что и у списка
+def providers_summary(filters:list = None):
+    if not filters:
+        stats = read_dashboard_stats(get_db())
+        return {
+            'total': stats_count(stats, 'providers'),
+            'active': stats_count(stats, 'active_providers'),
+            'total_price': stats_total(stats, 'providers'),
+            'by_city': {r['key']: r['count'] for r in stats['providers_by_city']},
+        }
+
+    db = get_db()
+    where, params = filters_where(filters)
+    totals = db.execute(f'''
+        SELECT COUNT(*) AS total,
+               COUNT(CASE WHEN status = 'Активен' THEN 1 END) AS active,
+               IFNULL(SUM(price), 0) AS total_price
+        FROM providers {where}
+    ''', params).fetchone()
+    by_city = db.execute(f"SELECT city, COUNT(*) AS count FROM providers {where} GROUP BY city", params).fetchall()
+    return {
+        'total': totals['total'],
+        'active': totals['active'],
+        'total_price': totals['total_price'],
+        'by_city': {r['city']: r['count'] for r in by_city},
+    }
+
 @bluprint_provider_routes.route('/providers')
 @permission_required(Permissions.providers_read)
+@readonly_db
 def providers():
-    db = get_db()
-    providers_list = db.execute('''
-        SELECT * FROM providers 
-        ORDER BY created_at DESC
-    ''').fetchall()
-    return render_template('providers/providers.html', providers=providers_list)
+    page = query_entity_page(PROVIDERS, request.args)
+    return render_template('providers/providers.html', providers=page.rows, page=page, summary=providers_summary(entity_filters(PROVIDERS, request.args)))
 
 @bluprint_provider_routes.route('/add_provider', methods=['GET', 'POST'])
 @permission_required(Permissions.providers_manage)
@@ -121,14 +172,9 @@ def delete_provider(provider_id):
 
 @bluprint_provider_routes.route('/provider_search')
 @permission_required(Permissions.providers_read)
+@readonly_db
 def provider_search():
     query = request.args.get('q', '')
-    db = get_db()
-    
-    providers_list = db.execute('''
-        SELECT * FROM providers 
-        WHERE name LIKE ? OR contract_number LIKE ? OR object_location LIKE ? OR city LIKE ? OR contact_person LIKE ?
-        ORDER BY created_at DESC
-    ''', (f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%')).fetchall()
-    
-    return render_template('providers/providers.html', providers=providers_list, search_query=query)
+    page = query_entity_page(PROVIDERS, request.args)
+    return render_template('providers/providers.html', providers=page.rows, page=page, summary=providers_summary(entity_filters(PROVIDERS, request.args)),
+                           search_query=query)
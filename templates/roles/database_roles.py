@@ -2,15 +2,25 @@ import sqlite3
 
 import enum
 import templates.roles.permissions as permissions
+from templates.roles.permission_cache import permission_cache
 
+from templates.base.change_tracking import get_table_versions
 from templates.base.database_helper import get_db
 
-def find_role_by_name(name:str, db = get_db()):
+# таблицы, от которых зависят эффективные разрешения: их версии
+# в table_changes служат номером поколения кэша разрешений
+PERMISSION_TABLES = ['roles', 'roles_to_user', 'roles_to_permissions']
+
+def find_role_by_name(name:str, db = None):
+    if db is None:
+        db = get_db()
     return db.execute(
         f"select id, name, description from roles where name=\"{name}\""
     ).fetchone()
 
-def find_role_by_id(id:int, db = get_db()):
+def find_role_by_id(id:int, db = None):
+    if db is None:
+        db = get_db()
     row = db.execute(
         f"select id, name, description from roles where id={id}"
     ).fetchone()
@@ -19,26 +29,44 @@ def find_role_by_id(id:int, db = get_db()):
 
 
 
-def remove_permissions_for_role(id:int, db = get_db(), commit = True):
+# Функции, меняющие роли, сбрасывают кэш разрешений только после коммита,
+# иначе до него в кэш могла бы снова попасть старая запись. Вызвавший их
+# с commit=False сбрасывает кэш сам после своего коммита.
+
+def remove_permissions_for_role(id:int, db = None, commit = True, refresh = True):
+    if db is None:
+        db = get_db()
     print(f"Удаляем разрешения для роли с id={id}")
     db.execute(
         f"DELETE FROM roles_to_permissions WHERE role_id={id}"
     )
+    if refresh:
+        refresh_user_permissions(db, role_id=id)
     if commit:
         db.commit()
-
-
-def save_role_permissions(role : permissions.Role, db = get_db(), commit = True):
-    remove_permissions_for_role(role.id, db, False)
-    print(f"Удаляем разрешения для роли с id={role.id} ({role.name})")
-    for p in role.permissions:
-        db.execute(
-            f"INSERT INTO roles_to_permissions (role_id, permission) VALUES ({role.id}, \"{p.value}\") ON CONFLICT(role_id, permission) DO UPDATE SET permission=\"{p.value}\""
-        )
+        permission_cache.invalidate()
+
+
+def save_role_permissions(role : permissions.Role, db = None, commit = True):
+    if db is None:
+        db = get_db()
+    # разрешения пользователей пересчитываются один раз - после вставки новых
+    remove_permissions_for_role(role.id, db, False, refresh=False)
+    print(f"Сохраняем разрешения для роли с id={role.id} ({role.name})")
+    db.executemany(
+        "INSERT INTO roles_to_permissions (role_id, permission) VALUES (?, ?) ON CONFLICT(role_id, permission) DO NOTHING",
+        [(role.id, p.value) for p in role.permissions]
+    )
+    refresh_user_permissions(db, role_id=role.id)
+    if commit:
+        db.commit()
+        permission_cache.invalidate()
 
 
 
-def update_role(role : permissions.Role, db = get_db(), commit = True):
+def update_role(role : permissions.Role, db = None, commit = True):
+    if db is None:
+        db = get_db()
     print(f"Обновляем роль {role}")
 
     db.execute(
@@ -49,9 +77,12 @@ def update_role(role : permissions.Role, db = get_db(), commit = True):
 
     if commit:
         db.commit()
+        permission_cache.invalidate()
 
 
-def save_role(role : permissions.Role, db = get_db(), commit = True):
+def save_role(role : permissions.Role, db = None, commit = True):
+    if db is None:
+        db = get_db()
     print(f"Сохраняем роль {role}")
 
     existing_role = find_role_by_name(role.name, db)
@@ -78,95 +109,163 @@ def save_role(role : permissions.Role, db = get_db(), commit = True):
 
     if commit:
         db.commit()
+        permission_cache.invalidate()
 
-def remove_role(id:int, db = get_db(), commit = True):
+def remove_role(id:int, db = None, commit = True):
+    if db is None:
+        db = get_db()
     print(f"Удаляем роль с id={id}")
     db.execute(
         f"DELETE FROM roles WHERE id={id}"
     )
     remove_permissions_for_role(id, db, False)
-    db.execute(
-        f"DELETE FROM roles_to_permissions WHERE role_id={id}"
-    )
     if commit:
         db.commit()
+        permission_cache.invalidate()
 
-def read_role_permissions(id, db = get_db()):
-    rows = db.execute(f"""
-            select role_id, permission 
+def read_role_permissions(id, db = None):
+    if db is None:
+        db = get_db()
+    rows = db.execute("""
+            select permission
             from roles_to_permissions
-            where role_id = {id}
+            where role_id = ?
             order by permission
-        """).fetchall()
+        """, (id,)).fetchall()
+
+    return to_permissions(r["permission"] for r in rows)
 
+_permissions_by_value = {p.value: p for p in permissions.Permissions}
+
+# разрешения по их строковому значению; неизвестные значения (например,
+# удалённые из Permissions) пропускаются
+def to_permissions(values) -> set:
     all_permissions = set()
-    for r in rows:
-        id = r["permission"]
-        for p in permissions.Permissions:
-            if id == p.value:
-                all_permissions.add(p)
-    
+    for value in values:
+        p = _permissions_by_value.get(value)
+        if p is not None:
+            all_permissions.add(p)
     return all_permissions
 
-def read_all_roles(db = get_db()) -> list[permissions.Role]:
-    roles = list[permissions.Role]()
-    rows = db.execute("select id, name, description from roles order by id").fetchall()
-
+# роли с разрешениями одним запросом: строки вида (роль, разрешение)
+# собираются в объекты Role
+def roles_from_rows(rows) -> list[permissions.Role]:
+    roles = dict()
     for row in rows:
-        roles.append(permissions.Role(id=row["id"], name=row["name"], description=row["description"], permissions=read_role_permissions(row["id"], db)))
-    
-    return roles
+        role = roles.get(row["id"])
+        if role is None:
+            role = permissions.Role(id=row["id"], name=row["name"], description=row["description"], permissions=set())
+            roles[row["id"]] = role
+        if row["permission"] is not None:
+            role.permissions.update(to_permissions([row["permission"]]))
+
+    return list(roles.values())
+
+def read_all_roles(db = None) -> list[permissions.Role]:
+    if db is None:
+        db = get_db()
+    rows = db.execute("""
+            select r.id, r.name, r.description, rp.permission
+            from roles r
+            left join roles_to_permissions rp on rp.role_id = r.id
+            order by r.id
+        """).fetchall()
+
+    return roles_from_rows(rows)
 
-def remove_all_roles_from_user(user_id:int, db = get_db(), commit = True):
+def remove_all_roles_from_user(user_id:int, db = None, commit = True, refresh = True):
+    if db is None:
+        db = get_db()
     print(f"Удаляем все роли у пользователя c id={user_id}")
     db.execute(
         f"DELETE FROM roles_to_user WHERE user_id={user_id}"
     )
+    if refresh:
+        refresh_user_permissions(db, user_id=user_id)
     if commit:
         db.commit()
-
-def save_roles_to_user(user_id:int, roles:list[permissions.Role], db = get_db(), commit = True):
-    remove_all_roles_from_user(user_id, db, False)
-    for role in roles:
-        print(f"Сохраняем роль {role.name} для пользователя с id={user_id}")
-        db.execute(
-            f"INSERT INTO roles_to_user (role_id, user_id) VALUES ('{role.id}', '{user_id}')"
-        )
-    if commit:
-        db.commit()
-
-def save_roles_to_user_by_id(user_id:int, role_ids:list[int], db = get_db(), commit = True):
-    remove_all_roles_from_user(user_id, db, False)
-    for role_id in role_ids:
-        print(f"Сохраняем роль {role_id} для пользователя с id={user_id}")
-        db.execute(
-            f"INSERT INTO roles_to_user (role_id, user_id) VALUES ('{role_id}', '{user_id}')"
-        )
+        permission_cache.invalidate()
+
+def save_roles_to_user(user_id:int, roles:list[permissions.Role], db = None, commit = True):
+    save_roles_to_user_by_id(user_id, [role.id for role in roles], db, commit)
+
+def save_roles_to_user_by_id(user_id:int, role_ids:list[int], db = None, commit = True):
+    if db is None:
+        db = get_db()
+    remove_all_roles_from_user(user_id, db, False, refresh=False)
+    print(f"Сохраняем роли {list(role_ids)} для пользователя с id={user_id}")
+    db.executemany(
+        "INSERT INTO roles_to_user (role_id, user_id) VALUES (?, ?)",
+        [(role_id, user_id) for role_id in role_ids]
+    )
+    refresh_user_permissions(db, user_id=user_id)
     if commit:
         db.commit()
-
-def read_roles_for_user(user_id:int, db = get_db()) -> list[permissions.Role]:
-
-    # прочтём список всех ролей
-    all_roles = read_all_roles(db)
-
-    # список id-шников ролей, назначеных пользователю
-    rows = db.execute(f"""
-            select role_id, user_id 
-            from roles_to_user
-            where user_id = {user_id}
-            order by role_id
-        """).fetchall()
-
-    # выберем из списка ролей те, которые есть в списке назначеных пользователю
-    user_roles = list[permissions.Role]()
-    for r in rows:
-        id = r["role_id"]
-        for role in all_roles:
-            if id == role.id:
-                user_roles.append(role)
-    
-    return user_roles
+        permission_cache.invalidate()
+
+def read_roles_for_user(user_id:int, db = None) -> list[permissions.Role]:
+    if db is None:
+        db = get_db()
+
+    # роли, назначенные пользователю, вместе с их разрешениями
+    rows = db.execute("""
+            select r.id, r.name, r.description, rp.permission
+            from roles_to_user ru
+            join roles r on r.id = ru.role_id
+            left join roles_to_permissions rp on rp.role_id = r.id
+            where ru.user_id = ?
+            order by ru.role_id
+        """, (user_id,)).fetchall()
+
+    return roles_from_rows(rows)
+
+# Материализованные эффективные разрешения пользователей.
+# Пересчитываются в той же транзакции, в которой меняются роли
+# или их назначение, поэтому всегда согласованы с ними.
+def refresh_user_permissions(db, user_id:int = None, role_id:int = None):
+    if user_id is not None:
+        users_filter, params = "user_id = ?", (user_id,)
+    elif role_id is not None:
+        users_filter, params = "user_id IN (SELECT user_id FROM roles_to_user WHERE role_id = ?)", (role_id,)
+    else:
+        users_filter, params = "1 = 1", ()
+
+    db.execute(f"DELETE FROM user_effective_permissions WHERE {users_filter}", params)
+    db.execute(f"""
+            INSERT INTO user_effective_permissions (user_id, permission)
+            SELECT user_id, permission FROM (
+                SELECT DISTINCT ru.user_id, rp.permission
+                FROM roles_to_user ru
+                JOIN roles r ON r.id = ru.role_id
+                JOIN roles_to_permissions rp ON rp.role_id = ru.role_id
+            )
+            WHERE {users_filter}
+        """, params)
+
+# номер поколения разрешений - общий для всех процессов, читается одним запросом
+def permissions_generation(db) -> tuple:
+    versions = get_table_versions(db, PERMISSION_TABLES)
+    return tuple(versions[table][0] for table in PERMISSION_TABLES)
+
+# эффективные разрешения пользователя - из кэша, а при его устаревании из базы
+def read_user_permissions(user_id:int, db = None) -> frozenset:
+    if db is None:
+        db = get_db()
+
+    # поколение читается до разрешений: если роли поменяются между
+    # запросами, запись сохранится со старым номером и будет перечитана
+    generation = permissions_generation(db)
+    cached = permission_cache.get(user_id, generation)
+    if cached is not None:
+        return cached
+
+    rows = db.execute(
+        "SELECT permission FROM user_effective_permissions WHERE user_id = ?", (user_id,)
+    ).fetchall()
+    user_permissions = frozenset(to_permissions(r["permission"] for r in rows))
+    permission_cache.put(user_id, generation, user_permissions)
+
+    return user_permissions
 
 def init_default_admin_role(db:sqlite3.Connection):
 
@@ -213,6 +312,19 @@ def create_roles_tables(db:sqlite3.Connection):
             )
     ''')
 
+    create_user_permissions_table(db)
+
 
     
     init_default_admin_role(db)
+
+def create_user_permissions_table(db:sqlite3.Connection):
+    # эффективные разрешения пользователей, см. refresh_user_permissions
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS user_effective_permissions (
+               user_id INTEGER,
+               permission TEXT,
+
+               PRIMARY KEY (user_id, permission)
+            ) WITHOUT ROWID
+    ''')
@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+
+from flask import session
+
+from templates.roles.permissions import Permissions
+from templates.base.database_helper import open_connection
+
+# Битовое представление набора разрешений.
+#
+# Каждому разрешению назначается номер бита, назначение хранится в таблице
+# permission_bits и никогда не меняется: новые разрешения получают следующий
+# свободный бит. Поэтому маска, сохранённая в cookie сессии, остаётся верной
+# после добавления разрешений в Permissions и перезапуска приложения.
+
+_lock = threading.Lock()
+_bits = None
+
+
+def create_permission_bits_table(db:sqlite3.Connection):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS permission_bits (
+               permission TEXT PRIMARY KEY,
+               bit INTEGER NOT NULL UNIQUE
+            )
+    ''')
+
+
+def assign_permission_bits(db:sqlite3.Connection):
+    """Назначает биты разрешениям, у которых их ещё нет, и возвращает всё назначение"""
+    rows = db.execute('SELECT permission, bit FROM permission_bits').fetchall()
+    assigned = {r['permission']: r['bit'] for r in rows}
+
+    next_bit = max(assigned.values(), default=-1) + 1
+    for p in Permissions:
+        if p.value not in assigned:
+            db.execute('INSERT INTO permission_bits (permission, bit) VALUES (?, ?)', (p.value, next_bit))
+            assigned[p.value] = next_bit
+            next_bit += 1
+
+    return {p: assigned[p.value] for p in Permissions}
+
+
+def get_permission_bits():
+    """Назначение битов, читается из базы один раз за время работы процесса"""
+    global _bits
+    if _bits is not None:
+        return _bits
+
+    with _lock:
+        if _bits is None:
+            # отдельное соединение: соединение запроса может быть только для
+            # чтения или держать незавершённую транзакцию
+            db = open_connection()
+            try:
+                create_permission_bits_table(db)
+                bits = assign_permission_bits(db)
+                db.commit()
+            finally:
+                db.close()
+            _bits = bits
+    return _bits
+
+
+def to_mask(permissions) -> int:
+    bits = get_permission_bits()
+    mask = 0
+    for p in permissions:
+        mask |= 1 << bits[p]
+    return mask
+
+
+def from_mask(mask:int) -> set:
+    bits = get_permission_bits()
+    return {p for p, bit in bits.items() if mask & (1 << bit)}
+
+
+# маска разрешений текущего пользователя;
+# сессии, созданные до перехода на маски, хранят список - переводим его
+def session_permissions_mask() -> int:
+    value = session.get('permissions')
+    if not value:
+        return 0
+    if isinstance(value, int):
+        return value
+
+    known = {p.value: p for p in Permissions}
+    mask = to_mask(known[p] for p in value if p in known)
+    session['permissions'] = mask
+    return mask
@@ -0,0 +1,38 @@
+import threading
+
+# Кэш эффективных разрешений пользователей внутри процесса.
+#
+# Каждая запись хранится вместе с номером поколения, с которым её прочитали.
+# Номер поколения - версии таблиц ролей в table_changes (их увеличивают
+# триггеры, см. PERMISSION_TABLES в database_roles.py), поэтому изменение
+# ролей, сделанное любым процессом, видно всем остальным: при следующем
+# обращении номер не совпадёт и запись будет перечитана из базы.
+
+class PermissionCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = dict()
+
+    def get(self, user_id:int, generation):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+
+        cached_generation, permissions = entry
+        if cached_generation != generation:
+            return None
+        return permissions
+
+    def put(self, user_id:int, generation, permissions:frozenset):
+        # если пока читали из базы роли успели поменяться,
+        # запись сразу окажется устаревшей и не будет использована
+        with self._lock:
+            self._entries[user_id] = (generation, permissions)
+
+    def invalidate(self):
+        # освобождает память; устаревшие записи и так не используются
+        with self._lock:
+            self._entries.clear()
+
+
+permission_cache = PermissionCache()
@@ -0,0 +1,209 @@
+import sqlite3
+
+from flask import Blueprint, render_template, request, session, url_for
+
+from templates.base.database import get_db
+from templates.base.database_helper import readonly_db
+from templates.base.requirements import login_required
+from templates.knowledge.knowledge_search import MARK_END, MARK_START, render_snippet
+from templates.roles.database_roles import read_user_permissions
+from templates.roles.permissions import Permissions
+
+# Общий поиск по всем сущностям.
+#
+# Одна таблица FTS5 global_search с токенизатором trigram хранит для каждой
+# записи заголовок и строку из её идентификаторов (серийные номера, MAC, IP,
+# номера договоров, SSID, ИНН...). Trigram-индекс находит любую подстроку
+# от трёх символов без прохода по исходным таблицам.
+#
+# rowid строки индекса = id записи * ROWID_STEP + код сущности, поэтому
+# триггеры исходных таблиц обновляют и удаляют строку индекса по rowid.
+
+bluprint_search_routes = Blueprint("search", __name__)
+
+SEARCH_LIMIT = 50
+MIN_TERM_LENGTH = 3
+ROWID_STEP = 8
+
+# веса столбцов для bm25: entity, entity_id, title, body
+SEARCH_WEIGHTS = (0.0, 0.0, 5.0, 1.0)
+
+
+class SearchSource:
+    """Таблица, записи которой попадают в общий поиск.
+
+    title_sql - выражение заголовка, таблица в нём обозначается как {row}
+    (NEW в триггерах, имя таблицы при полном пересчёте), body_columns -
+    столбцы, по которым ищется подстрока. permissions - любое из прав даёт доступ,
+    пустой список - раздел доступен всем вошедшим пользователям.
+    """
+
+    def __init__(self, code:int, name:str, table:str, label:str, title_sql:str, body_columns:list[str],
+                 permissions:list, endpoint:str, id_arg:str = None):
+        self.code = code
+        self.name = name
+        self.table = table
+        self.label = label
+        self.title_sql = title_sql
+        self.body_columns = body_columns
+        self.permissions = permissions
+        self.endpoint = endpoint
+        self.id_arg = id_arg
+
+    def title(self, row:str):
+        return self.title_sql.replace('{row}', row)
+
+    def body(self, row:str):
+        return " || ' ' || ".join(f"IFNULL({row}.{column}, '')" for column in self.body_columns)
+
+    def url(self, id:int):
+        if self.id_arg is None:
+            return url_for(self.endpoint)
+        return url_for(self.endpoint, **{self.id_arg: id})
+
+
+SOURCES = [
+    SearchSource(0, 'devices', 'devices', 'Устройства', '{row}.name',
+                 ['name', 'model', 'serial_number', 'mac_address', 'ip_address', 'location', 'assigned_to'],
+                 [Permissions.devices_read, Permissions.devices_manage], 'devices.edit_device', 'device_id'),
+    SearchSource(1, 'providers', 'providers', 'Провайдеры', '{row}.name',
+                 ['name', 'contract_number', 'ip_range', 'object_location', 'city', 'contact_person', 'phone'],
+                 [Permissions.providers_read, Permissions.providers_manage], 'providers.edit_provider', 'provider_id'),
+    SearchSource(2, 'cubes', 'software_cubes', 'Кубы', '{row}.name',
+                 ['name', 'software_type', 'license_key', 'contract_number', 'object_location', 'city'],
+                 [Permissions.cubes_read, Permissions.cubes_manage], 'cubes.edit_cube', 'cube_id'),
+    SearchSource(3, 'guest_wifi', 'guest_wifi', 'Гостевой WiFi', "IFNULL({row}.ssid, {row}.city)",
+                 ['ssid', 'city', 'organization', 'ip_range', 'contract_number', 'contact_person'],
+                 [Permissions.guest_wifi_read, Permissions.guest_wifi_manage], 'guest_wifi.edit_guest_wifi', 'wifi_id'),
+    SearchSource(4, 'organizations', 'organizations', 'Организации', '{row}.name',
+                 ['name', 'inn', 'contact_person', 'phone', 'email', 'address'],
+                 [Permissions.organizations_read, Permissions.organizations_manage],
+                 'organizations.edit_organization', 'org_id'),
+    SearchSource(5, 'wtware', 'wtware_configs', 'WTware', '{row}.name',
+                 ['name', 'version', 'server_ip', 'notes'],
+                 [], 'wtware.edit_wtware', 'config_id'),
+    SearchSource(6, 'network_devices', 'network_devices', 'Сетевые устройства',
+                 "IFNULL({row}.hostname, {row}.ip_address)",
+                 ['ip_address', 'mac_address', 'hostname', 'vendor'],
+                 [], 'network_scan.network_devices'),
+]
+
+SOURCES_BY_CODE = {source.code: source for source in SOURCES}
+SOURCES_BY_NAME = {source.name: source for source in SOURCES}
+
+
+def create_global_search(db:sqlite3.Connection):
+    db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS global_search USING fts5(
+            entity UNINDEXED, entity_id UNINDEXED, title, body,
+            tokenize='trigram'
+        )
+    ''')
+
+    for source in SOURCES:
+        name = f"trg_global_search_{source.name}"
+        rowid_new = f"NEW.id * {ROWID_STEP} + {source.code}"
+        rowid_old = f"OLD.id * {ROWID_STEP} + {source.code}"
+        for event in ('insert', 'update', 'delete'):
+            db.execute(f"DROP TRIGGER IF EXISTS {name}_{event}")
+
+        db.execute(f'''
+            CREATE TRIGGER {name}_insert AFTER INSERT ON {source.table} BEGIN
+                INSERT INTO global_search (rowid, entity, entity_id, title, body)
+                VALUES ({rowid_new}, {source.code}, NEW.id, {source.title('NEW')}, {source.body('NEW')});
+            END
+        ''')
+        db.execute(f'''
+            CREATE TRIGGER {name}_update AFTER UPDATE ON {source.table} BEGIN
+                DELETE FROM global_search WHERE rowid = {rowid_old};
+                INSERT INTO global_search (rowid, entity, entity_id, title, body)
+                VALUES ({rowid_new}, {source.code}, NEW.id, {source.title('NEW')}, {source.body('NEW')});
+            END
+        ''')
+        db.execute(f'''
+            CREATE TRIGGER {name}_delete AFTER DELETE ON {source.table} BEGIN
+                DELETE FROM global_search WHERE rowid = {rowid_old};
+            END
+        ''')
+
+
+def rebuild_global_search(db:sqlite3.Connection):
+    """Полное заполнение индекса по исходным таблицам"""
+    db.execute("DELETE FROM global_search")
+    for source in SOURCES:
+        db.execute(f'''
+            INSERT INTO global_search (rowid, entity, entity_id, title, body)
+            SELECT id * {ROWID_STEP} + {source.code}, {source.code}, id,
+                   {source.title(source.table)}, {source.body(source.table)}
+            FROM {source.table}
+        ''')
+
+
+def search_query(text:str):
+    """Запрос FTS5: каждое слово - подстрока, все слова обязательны.
+    Trigram-индекс ищет подстроки не короче трёх символов, более короткие
+    слова отбрасываются; None - искать нечего."""
+    terms = [t for t in (text or '').split() if len(t) >= MIN_TERM_LENGTH]
+    if not terms:
+        return None
+    return ' '.join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+def allowed_sources(user_permissions):
+    return [s for s in SOURCES if not s.permissions or any(p in user_permissions for p in s.permissions)]
+
+
+def search_ids(db:sqlite3.Connection, query:str, source:SearchSource):
+    """id записей одной сущности, подходящих под запрос search_query"""
+    rows = db.execute('''
+        SELECT entity_id FROM global_search
+        WHERE global_search MATCH ? AND entity = ?
+    ''', (query, source.code)).fetchall()
+    return [r['entity_id'] for r in rows]
+
+
+def search_all(db:sqlite3.Connection, query:str, sources:list[SearchSource], limit:int = SEARCH_LIMIT):
+    if not sources:
+        return []
+
+    weights = ', '.join(str(w) for w in SEARCH_WEIGHTS)
+    placeholders = ', '.join('?' for _ in sources)
+    rows = db.execute(f'''
+        SELECT entity, entity_id, title,
+               snippet(global_search, 3, ?, ?, '…', 12) as snippet,
+               bm25(global_search, {weights}) as rank
+        FROM global_search
+        WHERE global_search MATCH ? AND entity IN ({placeholders})
+        ORDER BY rank
+        LIMIT ?
+    ''', [MARK_START, MARK_END, query] + [s.code for s in sources] + [limit]).fetchall()
+
+    results = []
+    for r in rows:
+        source = SOURCES_BY_CODE[r['entity']]
+        results.append({
+            'entity': source.name,
+            'label': source.label,
+            'id': r['entity_id'],
+            'title': r['title'],
+            'snippet': render_snippet(r['snippet']),
+            'url': source.url(r['entity_id']),
+        })
+    return results
+
+
+# /search занят поиском по устройствам (devices.search)
+@bluprint_search_routes.route('/global_search')
+@login_required
+@readonly_db
+def global_search():
+    text = request.args.get('q', '').strip()
+    query = search_query(text)
+
+    results = []
+    if query is not None:
+        sources = allowed_sources(read_user_permissions(session['user_id']))
+        results = search_all(get_db(), query, sources)
+
+    return render_template('search/search.html', results=results, search_query=text,
+                           too_short=bool(text) and query is None)
@@ -1,8 +1,13 @@
-from flask import render_template, request, redirect, url_for, flash, session, Blueprint
+from datetime import datetime
+
+from flask import render_template, request, redirect, url_for, flash, session, Blueprint, Response, stream_with_context
+
+from excel_utils import WTWARE_EXPORT_COLUMNS, XLSX_MIMETYPE, stream_table_to_excel
 
 from templates.base.database import get_db
 from templates.base.requirements import permission_required, permissions_required_all, permissions_required_any
 from templates.roles.permissions import Permissions
+from templates.search.search import SOURCES_BY_NAME, search_ids, search_query
 
 bluprint_wtware_routes = Blueprint("wtware", __name__)
 
@@ -133,11 +138,22 @@ def wtware_search():
     query = request.args.get('q', '')
     db = get_db()
     
-    configs = db.execute('''
-        SELECT * FROM wtware_configs 
-        WHERE name LIKE ? OR server_ip LIKE ? OR version LIKE ? OR notes LIKE ?
-        ORDER BY name, created_at DESC
-    ''', (f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%')).fetchall()
+    fts = search_query(query)
+    if fts is not None:
+        # подстроки от трёх символов ищутся по общему trigram-индексу
+        ids = search_ids(db, fts, SOURCES_BY_NAME['wtware'])
+        placeholders = ', '.join('?' for _ in ids)
+        configs = db.execute(f'''
+            SELECT * FROM wtware_configs 
+            WHERE id IN ({placeholders})
+            ORDER BY name, created_at DESC
+        ''', ids).fetchall()
+    else:
+        configs = db.execute('''
+            SELECT * FROM wtware_configs 
+            WHERE name LIKE ? OR server_ip LIKE ? OR version LIKE ? OR notes LIKE ?
+            ORDER BY name, created_at DESC
+        ''', (f'%{query}%', f'%{query}%', f'%{query}%', f'%{query}%')).fetchall()
     
     return render_template('wtware/wtware_list.html', configs=configs, search_query=query)
 
@@ -146,23 +162,18 @@ def wtware_search():
 def export_wtware():
     """Экспорт конфигураций WTware в Excel"""
     try:
-        excel_file = export_to_excel('wtware_configs', [
-            'name', 'version', 'server_ip', 'server_port', 'screen_width', 
-            'screen_height', 'auto_start', 'network_drive', 'printer_config',
-            'startup_script', 'shutdown_script', 'status', 'notes'
-        ])
+        chunks = stream_table_to_excel('wtware_configs', WTWARE_EXPORT_COLUMNS)
         filename = f'wtware_export_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx'
         
-        return send_file(
-            excel_file,
-            download_name=filename,
-            as_attachment=True,
-            mimetype='bluprint_wtware_routeslication/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return Response(
+            stream_with_context(chunks),
+            mimetype=XLSX_MIMETYPE,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
         )
         
     except Exception as e:
         flash(f'Ошибка при экспорте данных: {str(e)}', 'error')
-        return redirect(url_for('wtware_list'))
+        return redirect(url_for('wtware.wtware_list'))
 
 @bluprint_wtware_routes.route('/import/wtware', methods=['GET', 'POST'])
 def import_wtware():
@@ -0,0 +1,152 @@
+import io
+import math
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# Потоковая запись XLSX.
+#
+# Файл собирается прямо из строк выборки: лист пишется построчно в zip-архив,
+# а готовые сжатые байты сразу отдаются наружу. Ни вся таблица, ни весь файл
+# в памяти не хранятся. Строки записываются как inlineStr - без общей таблицы
+# строк, которую пришлось бы копить до конца выгрузки.
+
+# через сколько строк отдавать накопленные байты
+FLUSH_EVERY_ROWS = 1000
+
+# символы, недопустимые в XML 1.0
+_illegal_xml_chars = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+CONTENT_TYPES_XML = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>'''
+
+ROOT_RELS_XML = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+WORKBOOK_XML = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+WORKBOOK_RELS_XML = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>'''
+
+# стиль 1 - жирный шрифт для заголовка
+STYLES_XML = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>'''
+
+SHEET_START_XML = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/></sheetView></sheetViews>
+<sheetData>'''
+
+SHEET_END_XML = '</sheetData></worksheet>'
+
+
+class ChunkBuffer(io.RawIOBase):
+    """Файл без перемотки, из которого можно забрать записанные байты"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def column_letter(index:int):
+    """Буквенное имя столбца: 0 -> A, 26 -> AA"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def cell_xml(ref:str, value, style:int = 0):
+    if value is None or value == '':
+        return ''
+    style_attr = f' s="{style}"' if style else ''
+    if isinstance(value, float) and not math.isfinite(value):
+        # inf и nan в числовой ячейке Excel считает повреждением файла:
+        # nan - пустая ячейка, бесконечность - текстом
+        if math.isnan(value):
+            return ''
+        value = str(value)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{ref}"{style_attr}><v>{value}</v></c>'
+
+    text = escape(_illegal_xml_chars.sub('', str(value)))
+    space = ' xml:space="preserve"' if text != text.strip() else ''
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+
+def row_xml(number:int, letters:list[str], values, style:int = 0):
+    cells = ''.join(cell_xml(f"{letter}{number}", value, style) for letter, value in zip(letters, values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def sheet_name_xml(name:str):
+    # имя листа в Excel - не длиннее 31 символа и без []:*?/\
+    name = re.sub(r'[\[\]:*?/\\]', '_', name)[:31] or 'Sheet1'
+    return escape(name, {'"': '&quot;'})
+
+
+def xlsx_stream(sheet_name:str, headers:list[str], rows):
+    """Байты XLSX-файла по частям: лист с заголовком headers и строками rows"""
+    buffer = ChunkBuffer()
+    letters = [column_letter(i) for i in range(len(headers))]
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES_XML)
+        archive.writestr('_rels/.rels', ROOT_RELS_XML)
+        archive.writestr('xl/workbook.xml', WORKBOOK_XML.format(sheet_name=sheet_name_xml(sheet_name)))
+        archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS_XML)
+        archive.writestr('xl/styles.xml', STYLES_XML)
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(SHEET_START_XML.encode('utf-8'))
+            sheet.write(row_xml(1, letters, headers, style=1).encode('utf-8'))
+
+            for number, row in enumerate(rows, start=2):
+                sheet.write(row_xml(number, letters, row).encode('utf-8'))
+                if number % FLUSH_EVERY_ROWS == 0:
+                    data = buffer.pop()
+                    if data:
+                        yield data
+
+            sheet.write(SHEET_END_XML.encode('utf-8'))
+
+    yield buffer.pop()